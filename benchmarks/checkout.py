@@ -0,0 +1,209 @@
+"""Нагрузочный тест эндпоинтов оплаты против локальной заглушки Stripe.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.checkout --requests 500 --concurrency 16 --latency 0.05 --json bench.json
+    python -m benchmarks.checkout --compare bench.json  # сравнить с прошлым прогоном
+
+Для каждого сценария выводятся p50/p95/p99 задержки, запросы в секунду,
+доля ошибок и среднее число запросов к БД на HTTP-запрос.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from benchmarks.fake_stripe import FakeStripeServer  # noqa: E402
+from payments.models import Discount, Item, Order, Tax  # noqa: E402
+
+
+_local = threading.local()
+
+
+def client() -> Client:
+    """Отдельный тестовый клиент на поток."""
+    if not hasattr(_local, "client"):
+        _local.client = Client()
+    return _local.client
+
+
+def seed(items: int, orders: int) -> Dict[str, List]:
+    """Наполняет БД товарами и заказами для сценариев."""
+    Item.objects.all().delete()
+    Order.objects.all().delete()
+    discount = Discount.objects.create(name="Bench discount", amount=1)
+    tax = Tax.objects.create(name="Bench tax", percentage=10)
+
+    item_ids = [
+        item.id
+        for item in Item.objects.bulk_create(
+            Item(name=f"Bench item {n}", description="", price=10 + n % 90, currency="usd") for n in range(items)
+        )
+    ]
+
+    order_ids, order_lines = [], []
+    for n in range(orders):
+        order = Order.objects.create(discount=discount, tax=tax)
+        order_items = random.sample(item_ids, min(3, len(item_ids)))
+        order.items.add(*order_items)
+        order_ids.append(order.id)
+        order_lines.extend((order.id, item_id) for item_id in order_items)
+
+    return {"items": item_ids, "orders": order_ids, "order_lines": order_lines}
+
+
+def scenarios(data: Dict[str, List]) -> Dict[str, Callable[[int], int]]:
+    """Сценарии: функция получает номер запроса и возвращает HTTP-статус."""
+    items, orders, order_lines = data["items"], data["orders"], data["order_lines"]
+
+    def buy(n: int) -> int:
+        return client().get(f"/buy/{items[n % len(items)]}/").status_code
+
+    def order_add(n: int) -> int:
+        return client().post("/order/add/", {"item_id": items[n % len(items)]}, content_type="application/json").status_code
+
+    def order_buy(n: int) -> int:
+        return client().post("/order/buy/", {"order_id": orders[n % len(orders)]}, content_type="application/json").status_code
+
+    def order_remove(n: int) -> int:
+        # Каждая строка заказа удаляется один раз; когда строки кончаются, ответы становятся 400
+        order_id, item_id = order_lines[n % len(order_lines)]
+        return client().post(
+            "/order/remove/", {"order_id": order_id, "item_id": item_id}, content_type="application/json"
+        ).status_code
+
+    return {"buy": buy, "order_add": order_add, "order_buy": order_buy, "order_remove": order_remove}
+
+
+def run_scenario(name: str, request: Callable[[int], int], total: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    queries: List[int] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(n: int) -> None:
+        nonlocal errors
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            status = request(n)
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            latencies.append(elapsed)
+            queries.append(count)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    duration = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / duration, 1),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+        "queries_per_request": round(statistics.mean(queries), 2),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(results: Dict, baseline: Dict = None) -> None:
+    columns = ["rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request", "errors"]
+    print(f"{'scenario':<14}" + "".join(f"{column:>22}" for column in columns))
+    for name, result in results["scenarios"].items():
+        row = f"{name:<14}"
+        for column in columns:
+            value = result[column]
+            cell = f"{value}"
+            if baseline and name in baseline.get("scenarios", {}):
+                old = baseline["scenarios"][name][column]
+                if old:
+                    cell += f" ({(value - old) / old * 100:+.0f}%)"
+            row += f"{cell:>22}"
+        print(row)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8, help="Одновременных запросов")
+    parser.add_argument("--scenario", action="append", help="Запустить только указанные сценарии")
+    parser.add_argument("--items", type=int, default=200, help="Товаров в тестовой БД")
+    parser.add_argument("--orders", type=int, default=200, help="Заказов в тестовой БД")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка заглушки Stripe (секунды)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Случайная добавка к задержке (секунды)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500 от заглушки Stripe")
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    parser.add_argument("--compare", help="Сравнить с результатами из файла")
+    args = parser.parse_args()
+
+    host, port = settings.STRIPE_API_BASE.removeprefix("http://").split(":")
+    server = FakeStripeServer((host, int(port)), latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    server.start()
+
+    call_command("migrate", verbosity=0)
+    random.seed(0)
+    data = seed(args.items, args.orders)
+
+    results = {
+        "revision": git_revision(),
+        "params": vars(args),
+        "scenarios": {},
+    }
+    for name, request in scenarios(data).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        results["scenarios"][name] = run_scenario(name, request, args.requests, args.concurrency)
+    results["stripe_requests"] = server.requests
+    server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"revision {results['revision']} vs {baseline.get('revision')}")
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
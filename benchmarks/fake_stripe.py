@@ -0,0 +1,94 @@
+"""Локальная заглушка Stripe API для нагрузочных тестов.
+
+Отвечает на создание объектов (`POST /v1/<ресурс>`) и их изменение
+(`POST /v1/<ресурс>/<id>`) с заданной задержкой и долей ошибок 500.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+# Префиксы id и значения поля `object` для ресурсов, которые вызывает приложение
+RESOURCES = {
+    "checkout/sessions": ("cs_test", "checkout.session"),
+    "coupons": ("coupon", "coupon"),
+    "tax_rates": ("txr", "tax_rate"),
+    "products": ("prod", "product"),
+    "prices": ("price", "price"),
+}
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        super().__init__(address, FakeStripeHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.counter = itertools.count(1)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+
+    def do_POST(self):
+        self._handle()
+
+    def do_GET(self):
+        self._handle()
+
+    def _handle(self):
+        server: FakeStripeServer = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        with server.lock:
+            server.requests += 1
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < server.error_rate:
+            self._respond(500, {"error": {"type": "api_error", "message": "Fake Stripe error"}})
+            return
+
+        path = self.path.split("?")[0].removeprefix("/v1/").strip("/")
+        for resource, (prefix, object_name) in RESOURCES.items():
+            if path == resource:
+                self._respond(200, {"id": f"{prefix}_{next(server.counter)}", "object": object_name})
+                return
+            if path.startswith(resource + "/"):
+                self._respond(200, {"id": path.rsplit("/", 1)[-1], "object": object_name})
+                return
+
+        self._respond(404, {"error": {"type": "invalid_request_error", "message": f"Unknown path {self.path}"}})
+
+    def _respond(self, status: int, body: dict):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
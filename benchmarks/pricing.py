@@ -0,0 +1,64 @@
+"""Скорость расчета сумм заказов на больших корзинах.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.pricing --orders 10000 --lines 50
+
+Сравнивает `payments.pricing` (целые центы) с прежним расчетом на Decimal
+и считает заказы, в которых прежний расчет расходился с суммой в Stripe.
+"""
+import argparse
+import random
+import sys
+import time
+from decimal import Decimal
+from typing import List, Tuple
+
+from payments import pricing
+
+
+def generate(orders: int, lines: int) -> List[Tuple]:
+    """Случайные заказы: (id, валюта, строки, скидка в центах, налог в б.п.)."""
+    result = []
+    for order_id in range(orders):
+        cart = [(random.randint(1, 100_000), random.randint(1, 5)) for _ in range(lines)]
+        result.append((order_id, "usd", cart, random.choice([0, 100, 550, 2000]), random.choice([0, 700, 1025, 2000])))
+    return result
+
+
+def legacy_total(cart, discount: int, tax_basis_points: int) -> Decimal:
+    """Прежний `Order.total_price`: сумма Decimal и налог без округления до цента."""
+    subtotal = sum((Decimal(unit) / 100 * quantity for unit, quantity in cart), Decimal("0"))
+    discount_amount = Decimal(discount) / 100
+    taxed = (subtotal - discount_amount) * (Decimal(tax_basis_points) / 10000)
+    return max(subtotal - discount_amount + taxed, 0)
+
+
+def timed(function) -> Tuple[float, object]:
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=10_000, help="Заказов в пачке")
+    parser.add_argument("--lines", type=int, default=50, help="Строк в заказе")
+    args = parser.parse_args()
+
+    random.seed(0)
+    orders = generate(args.orders, args.lines)
+
+    engine_time, totals = timed(lambda: pricing.batch_totals(orders))
+    legacy_time, legacy = timed(lambda: {order[0]: legacy_total(*order[2:]) for order in orders})
+
+    diverged = sum(1 for order_id, total in legacy.items() if total != pricing.to_major(totals[order_id].total, "usd"))
+
+    lines = args.orders * args.lines
+    print(f"{'engine':<8} {engine_time * 1000:>10.1f} ms {lines / engine_time:>14,.0f} lines/s")
+    print(f"{'legacy':<8} {legacy_time * 1000:>10.1f} ms {lines / legacy_time:>14,.0f} lines/s")
+    print(f"legacy total differs from the cent-rounded total in {diverged} of {args.orders} orders")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
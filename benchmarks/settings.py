@@ -0,0 +1,22 @@
+"""Настройки для нагрузочных тестов: отдельная БД и заглушка Stripe вместо настоящего API."""
+import os
+
+from stripe_project.settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv("BENCH_DB_NAME", str(BASE_DIR / "bench.sqlite3")),  # noqa: F405
+        "OPTIONS": {"timeout": 30},
+    }
+}
+
+STRIPE_SECRET_KEYS = {currency: f"sk_test_bench_{currency}" for currency in STRIPE_CURRENCIES}  # noqa: F405
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "http://127.0.0.1:12111")
+STRIPE_CATALOG_SYNC_ON_SAVE = False
+
+# Все запросы идут от одного клиента: лимиты частоты превратили бы замер в подсчет ответов 429
+RATE_LIMIT_ENABLED = False
@@ -1,7 +1,191 @@
 from django.contrib import admin
-from .models import Item, Order, Discount, Tax
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Upper
+from django.utils.functional import cached_property
 
-admin.site.register(Item)
-admin.site.register(Order)
-admin.site.register(Discount)
-admin.site.register(Tax)
+from .models import (
+    ArchivedOrder, DailySales, Item, Order, OrderCheckoutSession, OrderItem, Discount, Tax, StripeCoupon, StripeTaxRate, StripeEvent,
+)
+from .services import bump_cart_version
+
+
+# Ниже этого числа строк точный COUNT(*) достаточно быстрый
+ESTIMATE_COUNT_THRESHOLD = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который для больших таблиц без фильтров берет число строк из статистики PostgreSQL.
+
+    На миллионах строк `COUNT(*)` читает всю таблицу при каждом открытии списка;
+    оценка `pg_class.reltuples` бесплатна и точна с точностью до последнего ANALYZE.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = _estimated_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > ESTIMATE_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def _estimated_count(model, using: str):
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*): оценка числа строк и без счетчика «всего» рядом с фильтрами.
+
+    Поиск только по индексам: `"=field"` — точное совпадение (значение приводится к типу поля),
+    `"^field"` — начало строки без учета регистра по `UPPER(field)` (индекс `text_pattern_ops`).
+    Стандартный поиск Django строит `UPPER(field::text) = UPPER(...)` и мимо btree-индексов.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        condition, aliases = Q(), {}
+        for search_field in self.get_search_fields(request):
+            name = search_field[1:]
+            if search_field.startswith("="):
+                try:
+                    value = self.model._meta.get_field(name).to_python(term)
+                except ValidationError:
+                    # "abc" не может быть id: условие по этому полю не добавляется
+                    continue
+                condition |= Q(**{name: value})
+            elif search_field.startswith("^"):
+                alias = f"_search_{name}"
+                aliases[alias] = Upper(name)
+                condition |= Q(**{f"{alias}__startswith": term.upper()})
+            else:
+                raise ValueError(f"Search field {search_field!r} cannot use an index")
+
+        if not condition:
+            return queryset.none(), False
+        return queryset.alias(**aliases).filter(condition), False
+
+
+@admin.register(Item)
+class ItemAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "sku", "price", "currency", "has_synced_price", "updated_at")
+    list_filter = ("currency",)
+    # Точный SKU (уникальный индекс) и начало названия (item_name_upper_idx), см. LargeTableAdmin
+    search_fields = ("=sku", "^name")
+    readonly_fields = ("stripe_product_id", "stripe_price_id", "stripe_unit_amount", "stripe_currency", "updated_at")
+
+    @admin.display(boolean=True, description="Synced with Stripe")
+    def has_synced_price(self, obj: Item) -> bool:
+        return obj.has_synced_price
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    # Выпадающий список из всех товаров каталога рендерился бы для каждой строки
+    raw_id_fields = ("item",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("item")
+
+
+class OrderCheckoutSessionInline(admin.TabularInline):
+    """Сессии оплаты частей заказа в разных валютах (только просмотр: их меняют вебхуки)."""
+    model = OrderCheckoutSession
+    extra = 0
+    can_delete = False
+    fields = readonly_fields = ("currency", "session_id", "status", "total", "paid_at", "updated_at")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("id", "status", "item_count", "subtotal", "discount", "tax", "created_at", "updated_at")
+    list_filter = ("status", "created_at")
+    list_select_related = ("discount", "tax")
+    search_fields = ("=id",)
+    readonly_fields = ("created_at", "updated_at", "paid_at", "cart_version", "prepared_session_id",
+                       "prepared_cart_version", "prepared_fingerprint", "prepared_at")
+    inlines = [OrderItemInline, OrderCheckoutSessionInline]
+
+    def get_queryset(self, request):
+        # Число товаров и сумма считаются в том же запросе, что и страница списка
+        return super().get_queryset(request).with_totals()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Изменение строк в админке — тоже изменение корзины (сбрасывает подготовленную сессию и кэш)
+        if any(formset.has_changed() for formset in formsets):
+            bump_cart_version(form.instance.pk)
+
+    @admin.display(description="Items", ordering="item_count")
+    def item_count(self, obj: Order) -> int:
+        return obj.item_count
+
+    @admin.display(description="Subtotal", ordering="subtotal")
+    def subtotal(self, obj: Order):
+        return obj.subtotal
+
+
+@admin.register(Discount)
+class DiscountAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "amount")
+    search_fields = ("^name",)
+
+
+@admin.register(Tax)
+class TaxAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "percentage")
+    search_fields = ("^name",)
+
+
+@admin.register(StripeCoupon)
+class StripeCouponAdmin(admin.ModelAdmin):
+    list_display = ("discount", "currency", "stripe_id", "created_at")
+    list_filter = ("currency",)
+    list_select_related = ("discount",)
+
+
+@admin.register(StripeTaxRate)
+class StripeTaxRateAdmin(admin.ModelAdmin):
+    list_display = ("tax", "currency", "stripe_id", "created_at")
+    list_filter = ("currency",)
+    list_select_related = ("tax",)
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(LargeTableAdmin):
+    list_display = ("event_id", "type", "currency", "status", "attempts", "next_attempt_at", "received_at", "processed_at")
+    list_filter = ("status", "currency")
+    search_fields = ("=event_id",)
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    list_display = ("order_id", "status", "totals", "created_at", "archived_at")
+    list_filter = ("status",)
+    search_fields = ("=order_id",)
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ("day", "currency", "orders", "items", "subtotal", "discount", "tax", "total", "refreshed_at")
+    list_filter = ("currency",)
+    date_hierarchy = "day"
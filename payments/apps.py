@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from payments import signals  # noqa: F401
+        from payments.metrics import install_db_wrapper
+
+        connection_created.connect(install_db_wrapper, dispatch_uid="payments_metrics_db_wrapper")
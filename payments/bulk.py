@@ -0,0 +1,245 @@
+"""Потоковый импорт и экспорт каталога (товары, скидки, налоги) в CSV и JSONL.
+
+Импорт — цепочка генераторов: строки файла -> проверенные объекты -> пачки
+фиксированного размера -> `bulk_create(update_conflicts=True)`. В памяти
+находится одна пачка, поэтому размер файла не ограничен.
+"""
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple, Type
+
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from payments import caching, db_router, stripe_registry
+from payments.models import Discount, Item, StripeCoupon, StripeTaxRate, Tax
+
+
+@dataclass(frozen=True)
+class Spec:
+    """Как сущность читается из файла и записывается в БД."""
+    model: Type[models.Model]
+    fields: Tuple[str, ...]
+    # Уникальное поле, по которому существующие строки обновляются, а не дублируются
+    unique_field: str
+    required: Tuple[str, ...]
+    # Сопоставление с объектами Stripe, устаревающее при изменении `stripe_value_field`
+    stripe_model: Optional[Type[models.Model]] = None
+    stripe_kind: str = ""
+    stripe_value_field: str = ""
+    cache: caching.CacheNamespace = caching.items
+
+
+SPECS: Dict[str, Spec] = {
+    "items": Spec(
+        model=Item,
+        fields=("sku", "name", "description", "price", "currency"),
+        unique_field="sku",
+        required=("name", "price"),
+        cache=caching.items,
+    ),
+    "discounts": Spec(
+        model=Discount,
+        fields=("id", "name", "amount"),
+        unique_field="id",
+        required=("name", "amount"),
+        stripe_model=StripeCoupon,
+        stripe_kind="coupon",
+        stripe_value_field="amount",
+        cache=caching.discounts,
+    ),
+    "taxes": Spec(
+        model=Tax,
+        fields=("id", "name", "percentage"),
+        unique_field="id",
+        required=("name", "percentage"),
+        stripe_model=StripeTaxRate,
+        stripe_kind="tax_rate",
+        stripe_value_field="percentage",
+        cache=caching.taxes,
+    ),
+}
+
+FORMATS = ("csv", "jsonl")
+
+
+def format_from_path(path: str) -> Optional[str]:
+    """Формат по расширению файла."""
+    for fmt in FORMATS:
+        if path.endswith(f".{fmt}"):
+            return fmt
+    return None
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    written: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.monotonic)
+    # Первые ошибки с номерами строк; остальные только считаются
+    messages: List[str] = field(default_factory=list)
+
+    MAX_MESSAGES = 50
+
+    def error(self, line: int, message: str) -> None:
+        self.errors += 1
+        if len(self.messages) < self.MAX_MESSAGES:
+            self.messages.append(f"line {line}: {message}")
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+# ---------- Импорт ----------
+def read_rows(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """Строки файла как словари вместе с номером строки."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            yield line_num, row
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def build_objects(spec: Spec, rows: Iterable[Tuple[int, Dict]], stats: ImportStats) -> Iterator[models.Model]:
+    """Проверяет строки валидаторами полей модели (в том числе `choices` валюты) и собирает объекты."""
+    for line_num, row in rows:
+        stats.read += 1
+        if not isinstance(row, dict):
+            stats.error(line_num, "not a JSON object")
+            continue
+        values = {}
+        try:
+            for name in spec.fields:
+                raw = row.get(name)
+                if raw in (None, ""):
+                    if name in spec.required:
+                        raise ValidationError(f"{name} is required")
+                    model_field = spec.model._meta.get_field(name)
+                    if model_field.null:
+                        values[name] = None
+                    elif not isinstance(model_field, models.AutoField):
+                        values[name] = model_field.get_default() if model_field.has_default() else ""
+                    continue
+                values[name] = spec.model._meta.get_field(name).clean(str(raw).strip(), None)
+        except ValidationError as e:
+            stats.error(line_num, "; ".join(e.messages))
+            continue
+        yield spec.model(**values)
+
+
+def batched(objects: Iterable[models.Model], size: int) -> Iterator[List[models.Model]]:
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_batch(spec: Spec, batch: List[models.Model]) -> int:
+    """Вставляет новые строки и обновляет существующие по `unique_field` одним запросом.
+
+    Возвращает число записанных строк: повторы ключа внутри пачки записываются один раз.
+    """
+    update_fields = [name for name in spec.fields if name != spec.unique_field]
+    if spec.model is Item:
+        update_fields.append("updated_at")
+
+    keyed = _dedupe([obj for obj in batch if getattr(obj, spec.unique_field) is not None], spec.unique_field)
+    new = [obj for obj in batch if getattr(obj, spec.unique_field) is None]
+
+    with transaction.atomic():
+        if spec.stripe_model is not None and keyed:
+            _forget_stripe_objects(spec, keyed)
+        if keyed:
+            spec.model.objects.bulk_create(
+                keyed,
+                update_conflicts=True,
+                unique_fields=[spec.unique_field],
+                update_fields=update_fields,
+            )
+        if new:
+            spec.model.objects.bulk_create(new)
+    return len(keyed) + len(new)
+
+
+def import_rows(spec: Spec, stream: IO[str], fmt: str, batch_size: int) -> ImportStats:
+    stats = ImportStats()
+    objects = build_objects(spec, read_rows(stream, fmt), stats)
+    try:
+        for batch in batched(objects, batch_size):
+            stats.written += write_batch(spec, batch)
+    finally:
+        if spec.unique_field == "id":
+            # Строки с явными id не продвигают последовательность PostgreSQL
+            _reset_sequence(spec.model)
+        # bulk_create не вызывает сигналы моделей, поэтому кэш сбрасывается здесь
+        db_router.mark_catalog_written()
+        spec.cache.invalidate()
+        caching.orders.invalidate()
+    return stats
+
+
+def _dedupe(batch: List[models.Model], unique_field: str) -> List[models.Model]:
+    """Одна строка на ключ внутри пачки (побеждает последняя): иначе upsert падает на конфликте."""
+    return list({getattr(obj, unique_field): obj for obj in batch}.values())
+
+
+def _reset_sequence(model: Type[models.Model]) -> None:
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def _forget_stripe_objects(spec: Spec, batch: List[models.Model]) -> None:
+    """Удаляет купоны/налоговые ставки Stripe строк, у которых меняется сумма или процент."""
+    new_values = {obj.pk: getattr(obj, spec.stripe_value_field) for obj in batch}
+    old_values = spec.model.objects.filter(pk__in=new_values).values_list("pk", spec.stripe_value_field)
+    changed = [pk for pk, value in old_values if value != new_values[pk]]
+    if changed:
+        spec.stripe_model.objects.filter(**{f"{spec.model._meta.model_name}_id__in": changed}).delete()
+        for pk in changed:
+            stripe_registry.invalidate(spec.stripe_kind, pk)
+
+
+# ---------- Экспорт ----------
+def export_rows(spec: Spec, stream: IO[str], fmt: str, chunk_size: int) -> int:
+    """Пишет все строки сущности, читая БД курсором по `chunk_size` строк."""
+    rows = spec.model.objects.order_by("pk").values_list(*spec.fields).iterator(chunk_size=chunk_size)
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(spec.fields)
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+            count += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            stream.write(json.dumps(dict(zip(spec.fields, row)), default=str, ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    return count
@@ -0,0 +1,43 @@
+"""Анонимный покупатель: случайный id в подписанной cookie.
+
+Сессия товара без заказа переиспользуется только для того же покупателя
+(см. services.get_client_identity). У анонимного посетителя нет ни пользователя,
+ни сессии Django, поэтому id выдается при первом обращении (страница товара
+или оплата) и сохраняется в ответе `BuyerMiddleware`. Повторные и одновременные
+запросы из той же вкладки приходят с этой cookie и получают одну сессию Stripe.
+Cookie подписана, в БД ничего не пишется.
+"""
+import uuid
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+COOKIE_NAME = "buyer"
+COOKIE_SALT = "payments.buyer"
+COOKIE_AGE = 365 * 24 * 60 * 60
+
+
+def get_buyer_id(request: HttpRequest) -> str:
+    """id покупателя из cookie; если ее нет или подпись неверна — новый id, который уйдет в ответе."""
+    buyer_id = getattr(request, "_buyer_id", None)
+    if buyer_id is None:
+        buyer_id = request.get_signed_cookie(COOKIE_NAME, default="", salt=COOKIE_SALT)
+        if not buyer_id:
+            buyer_id = uuid.uuid4().hex
+            request._buyer_id_is_new = True
+        request._buyer_id = buyer_id
+    return buyer_id
+
+
+def save(request: HttpRequest, response: HttpResponse) -> None:
+    """Записывает в ответ cookie с id, выданным во время запроса."""
+    if getattr(request, "_buyer_id_is_new", False):
+        response.set_signed_cookie(
+            COOKIE_NAME,
+            request._buyer_id,
+            salt=COOKIE_SALT,
+            max_age=COOKIE_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite="Lax",
+        )
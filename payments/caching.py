@@ -0,0 +1,137 @@
+"""Кэш приложения `payments` поверх `django.core.cache`.
+
+Ключи разбиты на пространства имен (`items`, `discounts`, `taxes`, `orders`),
+в каждый ключ входит номер версии пространства и, для ключей объекта, номер
+версии объекта. Инвалидация увеличивает версию: старые ключи перестают
+читаться и вытесняются бэкендом (LRU в памяти процесса или Redis).
+
+`get_or_set` защищает от лавины пересчетов: значение пересчитывает только
+один вызов (блокировка через `cache.add`, общая для всех воркеров при Redis),
+а пересчет начинается с вероятностью, растущей по мере приближения к сроку
+жизни (probabilistic early expiration), пока остальные получают старое значение.
+"""
+import math
+import random
+import time
+from typing import Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+T = TypeVar("T")
+
+# Как часто ожидающий вызов проверяет, не появилось ли значение, пересчитанное другим
+LOCK_POLL_INTERVAL = 0.05
+
+
+class CacheNamespace(Generic[T]):
+    """Пространство имен кэша с версионной инвалидацией.
+
+    `timeout_setting` — имя настройки со сроком жизни значений по умолчанию.
+    """
+
+    def __init__(self, name: str, timeout_setting: str = "CACHE_TTL"):
+        self.name = name
+        self.timeout_setting = timeout_setting
+
+    @property
+    def timeout(self) -> int:
+        return getattr(settings, self.timeout_setting)
+
+    def key(self, *parts: Hashable, pk: Optional[int] = None) -> str:
+        """Ключ с текущими версиями пространства имен и объекта `pk`."""
+        versions = self._versions(pk)
+        return f"payments:{self.name}:v{versions}:" + ":".join(str(part) for part in parts)
+
+    def invalidate(self, pk: Optional[int] = None) -> None:
+        """Сбрасывает все ключи пространства имен или, если передан `pk`, только ключи объекта."""
+        key = self._version_key(pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    def get(self, *parts: Hashable, pk: Optional[int] = None) -> Optional[T]:
+        entry = cache.get(self.key(*parts, pk=pk))
+        return entry["value"] if entry is not None else None
+
+    def set(self, *parts: Hashable, value: T, pk: Optional[int] = None, timeout: Optional[int] = None) -> None:
+        self._store(self.key(*parts, pk=pk), value, 0.0, timeout)
+
+    def get_or_set(
+        self,
+        parts: tuple,
+        compute: Callable[[], T],
+        pk: Optional[int] = None,
+        timeout: Optional[int] = None,
+        beta: float = 1.0,
+    ) -> T:
+        """Значение из кэша или результат `compute()`, вычисленный одним вызовом на ключ.
+
+        `beta` > 1 начинает досрочный пересчет раньше, `beta` = 0 отключает его.
+        """
+        key = self.key(*parts, pk=pk)
+        entry = cache.get(key)
+        if entry is not None and not _expires_early(entry, beta):
+            return entry["value"]
+
+        lock_key = f"{key}:lock"
+        locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+        if not locked:
+            # Значение уже пересчитывается: отдаем старое или ждем новое
+            if entry is not None:
+                return entry["value"]
+            entry = _wait_for(key)
+            if entry is not None:
+                return entry["value"]
+
+        try:
+            started = time.monotonic()
+            value = compute()
+            self._store(key, value, time.monotonic() - started, timeout)
+            return value
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def _store(self, key: str, value: T, delta: float, timeout: Optional[int]) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        cache.set(key, {"value": value, "delta": delta, "expires": time.time() + timeout}, timeout)
+
+    def _versions(self, pk: Optional[int]) -> str:
+        keys = [self._version_key()] + ([self._version_key(pk)] if pk is not None else [])
+        found = cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        for key in missing:
+            # Начальное значение от времени, чтобы после вытеснения ключа не вернуться к старой версии
+            cache.add(key, time.time_ns(), timeout=None)
+        if missing:
+            found.update(cache.get_many(missing))
+        return ".".join(str(found[key]) for key in keys)
+
+    def _version_key(self, pk: Optional[int] = None) -> str:
+        if pk is None:
+            return f"payments:{self.name}:version"
+        return f"payments:{self.name}:{pk}:version"
+
+
+def _expires_early(entry: Dict, beta: float) -> bool:
+    """XFetch: чем дольше пересчет (`delta`) и ближе срок жизни, тем вероятнее досрочный пересчет."""
+    return time.time() - entry["delta"] * beta * math.log(1.0 - random.random()) >= entry["expires"]
+
+
+def _wait_for(key: str) -> Optional[Dict]:
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+items: CacheNamespace = CacheNamespace("items", "PAGE_CACHE_TTL")
+discounts: CacheNamespace = CacheNamespace("discounts")
+taxes: CacheNamespace = CacheNamespace("taxes")
+orders: CacheNamespace = CacheNamespace("orders")
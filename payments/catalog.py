@@ -0,0 +1,117 @@
+import logging
+from typing import Iterable, Iterator, List, Set
+
+from payments.models import Item
+from payments.stripe_clients import get_stripe_client
+
+
+logger = logging.getLogger(__name__)
+
+
+def sync_item(item: Item) -> Item:
+    """Создает или обновляет Product и Price в Stripe для товара и сохраняет их id."""
+    client = get_stripe_client(item.currency)
+
+    # Товар переехал в другую валюту, а значит и в другой аккаунт Stripe
+    if item.stripe_product_id and item.stripe_currency != item.currency:
+        archive_item(item)
+        item.stripe_product_id = item.stripe_price_id = ""
+
+    if item.stripe_product_id:
+        client.products.update(
+            item.stripe_product_id,
+            params={"name": item.name, "description": item.description or ""},
+        )
+    else:
+        params = {"name": item.name, "metadata": {"item_id": item.pk}}
+        if item.description:
+            params["description"] = item.description
+        product = client.products.create(
+            params=params,
+            options={"idempotency_key": f"product-{item.pk}-{item.currency}-{_version(item)}"},
+        )
+        item.stripe_product_id = product.id
+
+    if not item.has_synced_price:
+        old_price_id = item.stripe_price_id if item.stripe_currency == item.currency else ""
+        # Версия товара в ключе: при возврате к прежней цене (A -> B -> A) в пределах суток Stripe
+        # иначе вернул бы только что архивированную цену A
+        idempotency_key = f"price-{item.stripe_product_id}-{item.currency}-{item.unit_amount}-{_version(item)}"
+        price = client.prices.create(
+            params={
+                "product": item.stripe_product_id,
+                "currency": item.currency,
+                "unit_amount": item.unit_amount,
+                "metadata": {"item_id": item.pk},
+            },
+            options={"idempotency_key": idempotency_key},
+        )
+        # Цены в Stripe неизменяемы: новая цена становится ценой по умолчанию, старая архивируется
+        client.products.update(item.stripe_product_id, params={"default_price": price.id})
+        if old_price_id:
+            archive_prices([old_price_id], item.currency)
+        item.stripe_price_id = price.id
+
+    item.stripe_unit_amount = item.unit_amount
+    item.stripe_currency = item.currency
+
+    # update() вместо save(), чтобы не вызвать post_save повторно
+    Item.objects.filter(pk=item.pk).update(
+        stripe_product_id=item.stripe_product_id,
+        stripe_price_id=item.stripe_price_id,
+        stripe_unit_amount=item.stripe_unit_amount,
+        stripe_currency=item.stripe_currency,
+    )
+    return item
+
+
+def _version(item: Item) -> int:
+    """Версия товара для ключей идемпотентности: меняется при каждом сохранении."""
+    return int(item.updated_at.timestamp() * 1_000_000) if item.updated_at else 0
+
+
+def archive_item(item: Item) -> None:
+    """Архивирует Product и Price товара в аккаунте, где они были созданы."""
+    if not item.stripe_product_id:
+        return
+
+    client = get_stripe_client(item.stripe_currency or item.currency)
+    if item.stripe_price_id:
+        client.products.update(item.stripe_product_id, params={"default_price": ""})
+        client.prices.update(item.stripe_price_id, params={"active": False})
+    client.products.update(item.stripe_product_id, params={"active": False})
+
+
+def archive_prices(price_ids: Iterable[str], currency: str) -> int:
+    """Архивирует цены в аккаунте валюты и возвращает их количество."""
+    client = get_stripe_client(currency)
+    archived = 0
+    for price_id in price_ids:
+        client.prices.update(price_id, params={"active": False})
+        archived += 1
+    return archived
+
+
+def find_stale_prices(currency: str) -> List[str]:
+    """Ищет активные цены наших товаров в Stripe, которые больше не используются."""
+    client = get_stripe_client(currency)
+    current: Set[str] = set(
+        Item.objects.filter(currency=currency).exclude(stripe_price_id="").values_list("stripe_price_id", flat=True)
+    )
+
+    stale = []
+    for price in client.prices.list(params={"active": True, "limit": 100}).auto_paging_iter():
+        if "item_id" in (price.metadata or {}) and price.id not in current:
+            stale.append(price.id)
+    return stale
+
+
+def iter_item_batches(batch_size: int, only_unsynced: bool = False) -> Iterator[List[Item]]:
+    """Постранично (по возрастанию id) отдает товары каталога."""
+    last_id = 0
+    while True:
+        batch = list(Item.objects.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield [item for item in batch if not only_unsynced or not item.has_synced_price]
@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from payments.models import Order
+
+
+# Запросы с одинаковым отпечатком, выполняющиеся сейчас в этом процессе
+_locks: Dict[str, threading.Lock] = {}
+_futures: Dict[str, asyncio.Future] = {}
+_guard = threading.Lock()
+
+
+def checkout_fingerprint(
+    site_url: str, order: Optional[Order], line_items: List[Dict], currency: str, client: str = ""
+) -> str:
+    """Стабильный отпечаток содержимого сессии: заказ, товары, скидка, налог, валюта и адрес сайта.
+
+    Сессия товара без заказа принадлежит покупателю, поэтому в отпечаток входит и `client`
+    (пользователь или анонимный покупатель из cookie): иначе два покупателя одного товара получили бы одну сессию.
+    """
+    payload = {
+        "site_url": site_url,
+        "order": order.pk if order else None,
+        "client": client,
+        "currency": currency,
+        "line_items": line_items,
+        "discount": [order.discount.pk, str(order.discount.amount)] if order and order.discount else None,
+        "tax": [order.tax.pk, str(order.tax.percentage)] if order and order.tax else None,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def idempotency_key(fingerprint: str) -> str:
+    """Ключ идемпотентности Stripe, общий для всех запросов в пределах одного окна TTL."""
+    window = int(time.time() // settings.CHECKOUT_SESSION_TTL)
+    return f"checkout-{fingerprint}-{window}"
+
+
+def get_or_create_session(fingerprint: str, create: Callable[[str], Dict]) -> Dict:
+    """Возвращает недавно созданную сессию или создает новую, схлопывая одновременные дубликаты."""
+    key = _cache_key(fingerprint)
+    result = cache.get(key)
+    if result:
+        return result
+
+    with _guard:
+        lock = _locks.setdefault(fingerprint, threading.Lock())
+
+    with lock:
+        try:
+            result = cache.get(key)
+            if result:
+                return result
+
+            result = create(idempotency_key(fingerprint))
+            if "session_id" in result:
+                cache.set(key, result, settings.CHECKOUT_SESSION_TTL)
+            return result
+        finally:
+            with _guard:
+                _locks.pop(fingerprint, None)
+
+
+async def aget_or_create_session(fingerprint: str, create: Callable[[str], Awaitable[Dict]]) -> Dict:
+    """Асинхронная версия `get_or_create_session`: дубликаты ждут уже запущенный запрос к Stripe."""
+    key = _cache_key(fingerprint)
+    result = await cache.aget(key)
+    if result:
+        return result
+
+    future = _futures.get(fingerprint)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _futures[fingerprint] = future
+    try:
+        result = await create(idempotency_key(fingerprint))
+        if "session_id" in result:
+            await cache.aset(key, result, settings.CHECKOUT_SESSION_TTL)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        # Исключение уже передано ожидающим дубликатам
+        future.exception()
+        raise
+    finally:
+        _futures.pop(fingerprint, None)
+
+
+def _cache_key(fingerprint: str) -> str:
+    return f"payments:checkout-session:{fingerprint}"
@@ -0,0 +1,66 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Чтение каталога с реплики разрешено только внутри `replica_reads()`
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+
+# Ключ кэша (общий для воркеров при Redis): каталог недавно менялся, реплика может отставать
+CATALOG_WRITTEN_KEY = "payments:catalog:written"
+
+
+@contextmanager
+def replica_reads():
+    """Чтения каталога внутри блока идут на реплику. Только для read-only views каталога."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def mark_catalog_written() -> None:
+    """Каталог изменился: следующие `DB_REPLICA_LAG` секунд страницы каталога рендерятся с основной БД."""
+    if settings.DB_REPLICA_LAG:
+        cache.set(CATALOG_WRITTEN_KEY, True, settings.DB_REPLICA_LAG)
+
+
+def catalog_recently_written() -> bool:
+    """Каталог менялся в последние `DB_REPLICA_LAG` секунд."""
+    return cache.get(CATALOG_WRITTEN_KEY) is not None
+
+
+class ReplicaRouter:
+    """Чтение каталога (товары, скидки, налоги) в read-only views идет на реплику, все остальное — на основную БД.
+
+    Реплика используется только внутри `replica_reads()` и не внутри транзакции: проверки
+    в `apply_cart_operations`, формы админки и импорт читают то, что только что записали.
+    Заказы и строки заказов всегда читаются с основной БД.
+    """
+
+    replica = "replica"
+    catalog_models = {"payments.item", "payments.discount", "payments.tax"}
+
+    def db_for_read(self, model, **hints):
+        if (
+            _replica_reads.get()
+            and model._meta.label_lower in self.catalog_models
+            and self.replica in settings.DATABASES
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return self.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
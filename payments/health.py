@@ -0,0 +1,50 @@
+"""Проверки готовности процесса принимать запросы (эндпоинт `/ready`)."""
+import logging
+from typing import Dict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+logger = logging.getLogger(__name__)
+
+# Миграции применены — больше не проверяем: схема не откатывается, пока процесс жив
+_migrations_applied = False
+
+
+def check_database() -> bool:
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("SELECT 1")
+        return cursor.fetchone() == (1,)
+
+
+def check_cache() -> bool:
+    cache.set("payments:ready", 1, 10)
+    return cache.get("payments:ready") == 1
+
+
+def check_migrations() -> bool:
+    """Нет ли непримененных миграций (init еще не отработал или выкатывается новая версия)."""
+    global _migrations_applied
+    if not _migrations_applied:
+        executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+        _migrations_applied = not executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return _migrations_applied
+
+
+CHECKS = {
+    "database": check_database,
+    "cache": check_cache,
+    "migrations": check_migrations,
+}
+
+
+def run_checks() -> Dict[str, bool]:
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            results[name] = check()
+        except Exception as e:
+            logger.warning(f"Readiness check {name} failed: {e}")
+            results[name] = False
+    return results
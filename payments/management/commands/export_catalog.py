@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import bulk
+
+
+class Command(BaseCommand):
+    help = "Экспортирует товары, скидки или налоги в CSV/JSONL, читая БД частями постоянного размера."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(bulk.SPECS), help="Что экспортировать")
+        parser.add_argument("path", help="Путь к файлу или - для stdout")
+        parser.add_argument("--format", choices=bulk.FORMATS, help="Формат файла (по умолчанию по расширению)")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Сколько строк читать из БД за раз")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path == "-" else bulk.format_from_path(path))
+        if fmt is None:
+            raise CommandError("Cannot detect file format, pass --format")
+        spec = bulk.SPECS[options["kind"]]
+        started = time.monotonic()
+
+        if path == "-":
+            count = bulk.export_rows(spec, sys.stdout, fmt, options["chunk_size"])
+        else:
+            try:
+                with open(path, "w", newline="", encoding="utf-8") as stream:
+                    count = bulk.export_rows(spec, stream, fmt, options["chunk_size"])
+            except OSError as e:
+                raise CommandError(e)
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"Выгружено строк: {count}, {elapsed:.1f} с ({count / elapsed if elapsed else 0:.0f} строк/с)"
+        ))
+
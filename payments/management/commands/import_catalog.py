@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует товары, скидки или налоги из CSV/JSONL. Товары обновляются по `sku`, "
+        "скидки и налоги — по `id`; строки без ключа добавляются. Цены в Stripe обновит sync_stripe_catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(bulk.SPECS), help="Что импортировать")
+        parser.add_argument("path", help="Путь к файлу или - для stdin")
+        parser.add_argument("--format", choices=bulk.FORMATS, help="Формат файла (по умолчанию по расширению)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Сколько строк записывать одним запросом")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or bulk.format_from_path(options["path"])
+        if fmt is None:
+            raise CommandError("Cannot detect file format, pass --format")
+        spec = bulk.SPECS[options["kind"]]
+
+        if options["path"] == "-":
+            stats = bulk.import_rows(spec, sys.stdin, fmt, options["batch_size"])
+        else:
+            try:
+                with open(options["path"], newline="", encoding="utf-8") as stream:
+                    stats = bulk.import_rows(spec, stream, fmt, options["batch_size"])
+            except OSError as e:
+                raise CommandError(e)
+
+        for message in stats.messages:
+            self.stderr.write(message)
+        self.stdout.write(self.style.SUCCESS(
+            f"Прочитано строк: {stats.read}, записано: {stats.written}, ошибок: {stats.errors}, "
+            f"{stats.elapsed:.1f} с ({stats.rate:.0f} строк/с)"
+        ))
+
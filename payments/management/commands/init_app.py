@@ -0,0 +1,41 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Однократная подготовка перед запуском: миграции, суперпользователь и статика (в одном процессе)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-static", action="store_true", help="Не собирать статику")
+
+    def handle(self, *args, **options):
+        call_command("migrate", interactive=False, verbosity=options["verbosity"])
+        self.create_superuser()
+        if not options["skip_static"]:
+            self.collect_static()
+
+    def create_superuser(self) -> None:
+        User = get_user_model()
+        username = os.getenv("DJANGO_SUPERUSER_USERNAME", "admin")
+        email = os.getenv("DJANGO_SUPERUSER_EMAIL", "admin@example.com")
+        password = os.getenv("DJANGO_SUPERUSER_PASSWORD", "admin")
+
+        if User.objects.filter(username=username).exists():
+            self.stdout.write(f"Суперпользователь {username} уже существует.")
+            return
+        User.objects.create_superuser(username=username, email=email, password=password)
+        self.stdout.write(self.style.SUCCESS(f"Суперпользователь {username} создан!"))
+
+    def collect_static(self) -> None:
+        # Статика собирается при сборке образа; манифест на месте — значит, повторять не нужно
+        manifest = settings.STATIC_ROOT / getattr(staticfiles_storage, "manifest_name", "staticfiles.json")
+        if manifest.exists():
+            self.stdout.write("Статика уже собрана.")
+            return
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.stdout.write(self.style.SUCCESS("Статика собрана."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments import webhooks
+
+
+class Command(BaseCommand):
+    help = "Обрабатывает очередь событий вебхуков Stripe."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Сколько событий обрабатывать за транзакцию")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и завершиться")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Пауза (секунды), когда очередь пуста")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = webhooks.process_batch(options["batch_size"])
+            total += processed
+            # Без паузы — только пока события применяются; неудачные ждут своего next_attempt_at
+            if processed:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Обработано событий: {total}"))
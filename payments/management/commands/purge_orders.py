@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments import retention
+from payments.models import Order
+
+
+class Command(BaseCommand):
+    help = "Удаляет или архивирует заказы без активности дольше заданного срока (брошенные корзины)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.ORDER_RETENTION_DAYS, help="Сколько дней без активности хранить заказ"
+        )
+        parser.add_argument(
+            "--status",
+            action="append",
+            choices=[status for status, _ in Order.STATUS_CHOICES],
+            help="Статусы очищаемых заказов (по умолчанию pending и failed)",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Сколько заказов удалять за транзакцию")
+        parser.add_argument("--archive", action="store_true", help="Перед удалением копировать заказы в ArchivedOrder")
+        parser.add_argument("--sleep", type=float, default=0.0, help="Пауза (секунды) между пачками")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать заказы")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        statuses = options["status"] or [Order.STATUS_PENDING, Order.STATUS_FAILED]
+
+        if options["dry_run"]:
+            count = retention.stale_orders(cutoff, statuses).count()
+            self.stdout.write(f"Заказов к очистке: {count}")
+            return
+
+        totals = {"orders": 0, "order_items": 0, "archived": 0}
+        started = time.monotonic()
+        while True:
+            result = retention.purge_batch(cutoff, statuses, options["batch_size"], archive=options["archive"])
+            if not result["orders"]:
+                break
+            for key, value in result.items():
+                totals[key] += value
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено заказов: {totals['orders']}, строк заказов: {totals['order_items']}, "
+            f"в архиве: {totals['archived']}, всего строк освобождено: {totals['orders'] + totals['order_items']} "
+            f"за {time.monotonic() - started:.1f} с"
+        ))
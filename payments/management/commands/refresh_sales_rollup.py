@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payments import reports
+
+
+class Command(BaseCommand):
+    help = "Обновляет свертку продаж DailySales: пересчитывает дни, в которых оплаченные заказы менялись."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Пересчитать все дни")
+
+    def handle(self, *args, **options):
+        result = reports.refresh_rollup(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано дней: {result['days']}, строк: {result['rows']}"))
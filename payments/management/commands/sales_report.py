@@ -0,0 +1,50 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import reports
+from payments.models import Item, Order
+
+
+class Command(BaseCommand):
+    help = "Выручка, число заказов, средний чек, скидки и налоги по валютам и дням/неделям (агрегация в БД)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", choices=reports.PERIODS, default="day", help="Группировка по дням или неделям")
+        parser.add_argument("--start", type=date.fromisoformat, help="Первый день (YYYY-MM-DD)")
+        parser.add_argument("--end", type=date.fromisoformat, help="Последний день включительно (YYYY-MM-DD)")
+        parser.add_argument("--currency", choices=[code for code, _ in Item.CURRENCY_CHOICES])
+        parser.add_argument(
+            "--status",
+            action="append",
+            choices=[status for status, _ in Order.STATUS_CHOICES],
+            help="Статусы заказов (по умолчанию paid)",
+        )
+        parser.add_argument(
+            "--source", choices=reports.SOURCES, default="live", help="live — по заказам, rollup — из свертки DailySales"
+        )
+
+    def handle(self, *args, **options):
+        filters = {"start": options["start"], "end": options["end"], "currency": options["currency"]}
+        if options["source"] == "rollup":
+            if options["status"] and set(options["status"]) != {Order.STATUS_PAID}:
+                raise CommandError("Rollup contains only paid orders")
+            rows = reports.rollup_report(options["period"], **filters)
+        else:
+            statuses = options["status"] or [Order.STATUS_PAID]
+            rows = reports.live_report(options["period"], statuses=statuses, **filters)
+
+        header = f"{'period':<12} {'cur':<4} {'orders':>8} {'items':>8} {'subtotal':>14} {'discount':>12} " \
+                 f"{'tax':>12} {'total':>14} {'avg order':>11}"
+        self.stdout.write(header)
+        for row in rows:
+            self.stdout.write(self.format_row(str(row["period"]), row))
+        for row in reports.summary(rows):
+            self.stdout.write(self.style.SUCCESS(self.format_row("total", row)))
+
+    @staticmethod
+    def format_row(label: str, row) -> str:
+        return (
+            f"{label:<12} {row['currency']:<4} {row['orders']:>8} {row['items']:>8} {row['subtotal']:>14} "
+            f"{row['discount']:>12} {row['tax']:>12} {row['total']:>14} {row['average_order']:>11}"
+        )
@@ -0,0 +1,37 @@
+import stripe
+from django.core.management.base import BaseCommand
+
+from payments import catalog
+from payments.models import Item
+from payments.resilience import StripeUnavailable
+
+
+class Command(BaseCommand):
+    help = "Синхронизирует товары с каталогом Stripe (Product/Price) и архивирует устаревшие цены."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Сколько товаров читать из БД за раз")
+        parser.add_argument("--all", action="store_true", help="Обновить все товары, а не только несинхронизированные")
+        parser.add_argument("--archive-stale", action="store_true", help="Архивировать неиспользуемые цены в Stripe")
+
+    def handle(self, *args, **options):
+        synced = failed = 0
+        for batch in catalog.iter_item_batches(options["batch_size"], only_unsynced=not options["all"]):
+            for item in batch:
+                try:
+                    catalog.sync_item(item)
+                    synced += 1
+                except (stripe.error.StripeError, StripeUnavailable, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f"Item {item.pk}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Синхронизировано товаров: {synced}, ошибок: {failed}"))
+
+        if options["archive_stale"]:
+            for currency, _ in Item.CURRENCY_CHOICES:
+                try:
+                    archived = catalog.archive_prices(catalog.find_stale_prices(currency), currency)
+                except (stripe.error.StripeError, StripeUnavailable, ValueError) as e:
+                    self.stderr.write(f"{currency}: {e}")
+                    continue
+                self.stdout.write(f"[{currency}] архивировано цен: {archived}")
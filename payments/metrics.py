@@ -0,0 +1,158 @@
+"""Метрики производительности запросов в формате Prometheus.
+
+Метрики хранятся в памяти процесса: каждый воркер gunicorn отдает на `/metrics`
+свои значения, агрегирование между воркерами — задача Prometheus.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин: O(log n) на наблюдение."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._help: Dict[str, str] = {}
+
+    def observe(self, name: str, labels: Dict[str, str], value: float, buckets=DURATION_BUCKETS) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus."""
+        lines: List[str] = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        seen = set()
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {self._help.get(name, name)}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {self._help.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple, **extra) -> str:
+    items = list(labels) + [(key, value) for key, value in extra.items()]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+registry = Registry()
+registry.describe("http_request_duration_seconds", "Wall time of HTTP requests")
+registry.describe("http_request_db_queries", "DB queries per HTTP request")
+registry.describe("http_request_db_duration_seconds", "Time spent in DB queries per HTTP request")
+registry.describe("stripe_request_duration_seconds", "Latency of outbound Stripe API calls")
+registry.describe("stripe_requests_total", "Outbound Stripe API calls")
+
+
+# ---------- Статистика текущего запроса ----------
+@dataclass
+class RequestStats:
+    endpoint: str = "unknown"
+    db_queries: int = 0
+    db_time: float = 0.0
+    stripe_calls: int = 0
+    stripe_time: float = 0.0
+
+
+# contextvars переносятся и в потоки sync_to_async, поэтому работают и для асинхронных views
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar("payments_request_stats", default=None)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """Обертка `connection.execute_wrapper`, считающая запросы к БД текущего HTTP-запроса."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_db_wrapper(sender, connection, **kwargs) -> None:
+    """Обработчик `connection_created`: добавляет обертку в каждое новое соединение с БД."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def record_stripe_call(duration: float) -> None:
+    """Учитывает один HTTP-запрос к Stripe (каждую попытку, включая повторы)."""
+    stats = current_stats.get()
+    endpoint = stats.endpoint if stats else "background"
+    if stats is not None:
+        stats.stripe_calls += 1
+        stats.stripe_time += duration
+    registry.observe("stripe_request_duration_seconds", {"endpoint": endpoint}, duration)
+    registry.inc("stripe_requests_total", {"endpoint": endpoint})
+
+
+def record_request(stats: RequestStats, method: str, status: int, duration: float) -> None:
+    labels = {"endpoint": stats.endpoint, "method": method}
+    registry.observe("http_request_duration_seconds", {**labels, "status": str(status)}, duration)
+    registry.observe("http_request_db_queries", labels, stats.db_queries, buckets=COUNT_BUCKETS)
+    registry.observe("http_request_db_duration_seconds", labels, stats.db_time)
+
+
+def server_timing(stats: RequestStats, duration: float) -> str:
+    """Значение заголовка `Server-Timing`."""
+    return ", ".join([
+        f"app;dur={duration * 1000:.1f}",
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_queries} queries"',
+        f'stripe;dur={stats.stripe_time * 1000:.1f};desc="{stats.stripe_calls} calls"',
+    ])
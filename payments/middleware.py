@@ -0,0 +1,78 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from payments import buyer, metrics
+
+
+class PerformanceMiddleware:
+    """Замеряет время запроса, запросы к БД и вызовы Stripe.
+
+    Результат отдается клиенту в заголовке `Server-Timing` и накапливается
+    в гистограммах по имени эндпоинта из `payments/urls.py` (см. `/metrics`).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = metrics.current_stats.get()
+        if stats is not None:
+            stats.endpoint = request.resolver_match.url_name or request.resolver_match.view_name
+
+    def _finish(self, request, response, stats: metrics.RequestStats, duration: float):
+        metrics.record_request(stats, request.method, response.status_code, duration)
+        response["Server-Timing"] = metrics.server_timing(stats, duration)
+        return response
+
+
+class BuyerMiddleware:
+    """Сохраняет в ответе cookie анонимного покупателя, если id был выдан во время запроса (см. payments.buyer)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        buyer.save(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        buyer.save(request, response)
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_item_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeCoupon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('usd', 'USD'), ('eur', 'EUR')], max_length=3)),
+                ('stripe_id', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('discount', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_coupons', to='payments.discount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('discount', 'currency'), name='unique_stripe_coupon_per_currency')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StripeTaxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('usd', 'USD'), ('eur', 'EUR')], max_length=3)),
+                ('stripe_id', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tax', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_tax_rates', to='payments.tax')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tax', 'currency'), name='unique_stripe_tax_rate_per_currency')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_stripecoupon_stripetaxrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='stripe_currency',
+            field=models.CharField(blank=True, default='', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_price_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_product_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_unit_amount',
+            field=models.PositiveIntegerField(blank=True, help_text='Цена в Stripe в минимальных единицах валюты', null=True),
+        ),
+    ]
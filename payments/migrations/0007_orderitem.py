@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_item_stripe_currency_item_stripe_price_id_and_more'),
+    ]
+
+    operations = [
+        # Таблица payments_order_items уже существует (автоматическая таблица M2M),
+        # поэтому through-модель добавляется только в состояние миграций.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderItem',
+                    fields=[
+                        ('id', models.AutoField(primary_key=True, serialize=False)),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='payments.order')),
+                        ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='payments.item')),
+                    ],
+                    options={
+                        'db_table': 'payments_order_items',
+                        'unique_together': {('order', 'item')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='items',
+                    field=models.ManyToManyField(through='payments.OrderItem', to='payments.item'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
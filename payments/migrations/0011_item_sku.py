@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_order_prepared_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='sku',
+            field=models.CharField(blank=True, help_text='Артикул для массового импорта', max_length=64, null=True, unique=True),
+        ),
+    ]
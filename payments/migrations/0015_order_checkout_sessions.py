@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_sales_reports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCheckoutSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('usd', 'USD'), ('eur', 'EUR')], max_length=3)),
+                ('session_id', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_sessions', to='payments.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'currency'), name='unique_checkout_session_per_currency')],
+            },
+        ),
+    ]
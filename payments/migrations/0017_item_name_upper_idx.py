@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+# Поиск по началу названия в админке: UPPER(name) LIKE 'ABC%' (см. admin.LargeTableAdmin).
+# Обычный btree-индекс при не-C collation для LIKE не используется, нужен text_pattern_ops,
+# которого нет в SQLite, поэтому индекс создается только в PostgreSQL и не входит в Meta модели.
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "item_name_upper_idx" ON "payments_item" ((UPPER("name") text_pattern_ops))'
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute('DROP INDEX IF EXISTS "item_name_upper_idx"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0016_stripe_event_retry_backoff'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
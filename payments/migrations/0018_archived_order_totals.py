@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:43
+
+from django.db import migrations, models
+
+from payments import pricing
+
+
+def copy_totals(apps, schema_editor):
+    # Прежний total — сумма части в основной валюте (валюте первой строки)
+    ArchivedOrder = apps.get_model("payments", "ArchivedOrder")
+    for row in ArchivedOrder.objects.iterator(chunk_size=1000):
+        currency = row.lines[0]["currency"] if row.lines else "usd"
+        row.totals = {currency: pricing.to_minor(row.total, currency)}
+        row.save(update_fields=["totals"])
+
+
+def copy_total(apps, schema_editor):
+    ArchivedOrder = apps.get_model("payments", "ArchivedOrder")
+    for row in ArchivedOrder.objects.iterator(chunk_size=1000):
+        currency, amount = next(iter(row.totals.items()), ("usd", 0))
+        row.total = pricing.to_major(amount, currency)
+        row.save(update_fields=["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0017_item_name_upper_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='totals',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='total',
+            field=models.DecimalField(decimal_places=2, max_digits=12, default=0),
+        ),
+        migrations.RunPython(copy_totals, copy_total),
+        migrations.RemoveField(
+            model_name='archivedorder',
+            name='total',
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+from payments import pricing
+
+
+def snapshot_totals(apps, schema_editor):
+    """Суммы уже выданных частей и частей оплаченных заказов без частей — по текущим ценам (других нет)."""
+    Order = apps.get_model("payments", "Order")
+    OrderCheckoutSession = apps.get_model("payments", "OrderCheckoutSession")
+    orders = Order.objects.filter(
+        models.Q(checkout_sessions__isnull=False) | models.Q(status="paid")
+    ).distinct().select_related("discount", "tax")
+    for order in orders.iterator(chunk_size=500):
+        parts, items = {}, {}
+        for row in order.order_items.select_related("item").order_by("id"):
+            currency = row.item.currency
+            parts.setdefault(currency, []).append((pricing.to_minor(row.item.price, currency), row.quantity))
+            items[currency] = items.get(currency, 0) + row.quantity
+        # Скидка — только в части основной валюты (первой строки), как в Order.get_currency_totals
+        primary = next(iter(parts), None)
+        tax_basis_points = pricing.basis_points(order.tax.percentage) if order.tax else 0
+        existing = {part.currency: part for part in OrderCheckoutSession.objects.filter(order=order)}
+        for currency, lines in parts.items():
+            discount = 0
+            if order.discount and currency == primary:
+                discount = pricing.to_minor(order.discount.amount, currency)
+            totals = pricing.compute_totals(lines, currency, discount=discount, tax_basis_points=tax_basis_points)
+            part = existing.get(currency)
+            if part is None:
+                if existing:
+                    continue
+                # Заказ оплачен одной сессией до появления оплаты по частям
+                part = OrderCheckoutSession(
+                    order=order, currency=currency, session_id=order.prepared_session_id or "", status="paid",
+                    paid_at=order.paid_at,
+                )
+            part.items = items[currency]
+            for name in ("subtotal", "discount", "tax", "total"):
+                setattr(part, name, getattr(totals, name))
+            part.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0018_archived_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordercheckoutsession',
+            name='discount',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordercheckoutsession',
+            name='items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordercheckoutsession',
+            name='subtotal',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordercheckoutsession',
+            name='tax',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordercheckoutsession',
+            name='total',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(snapshot_totals, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,12 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict
+
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+
+from payments import pricing
 
 
 class Item(models.Model):
@@ -7,14 +15,41 @@ class Item(models.Model):
         ("eur", "EUR"),
     ]
 
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, help_text="Артикул для массового импорта")
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="usd")
 
+    # Синхронизированные с каталогом Stripe объекты (см. payments.catalog)
+    stripe_product_id = models.CharField(max_length=255, blank=True, default="")
+    stripe_price_id = models.CharField(max_length=255, blank=True, default="")
+    stripe_unit_amount = models.PositiveIntegerField(null=True, blank=True, help_text="Цена в Stripe в минимальных единицах валюты")
+    stripe_currency = models.CharField(max_length=3, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Фильтр по валюте с сортировкой и поиском по началу названия в админке
+            models.Index(fields=["currency", "name"], name="item_currency_name_idx"),
+            models.Index(fields=["name"], name="item_name_idx"),
+            # В PostgreSQL есть и item_name_upper_idx для поиска по началу названия (миграция 0017)
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.currency})"
 
+    @property
+    def unit_amount(self) -> int:
+        """Цена в минимальных единицах валюты (центах)."""
+        return pricing.to_minor(self.price, self.currency)
+
+    @property
+    def has_synced_price(self) -> bool:
+        """Совпадает ли цена в Stripe с текущей ценой товара."""
+        return bool(self.stripe_price_id) and self.stripe_currency == self.currency \
+            and self.stripe_unit_amount == self.unit_amount
+
 
 class Discount(models.Model):
     name = models.CharField(max_length=255)
@@ -32,20 +67,296 @@ class Tax(models.Model):
         return f"{self.name} ({self.percentage}%)"
 
 
+# Валюта пустого заказа
+DEFAULT_CURRENCY = "usd"
+
+# Стоимость строки заказа: цена товара × количество
+LINE_TOTAL = ExpressionWrapper(
+    F("order_items__item__price") * F("order_items__quantity"), output_field=models.DecimalField()
+)
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_subtotal(self):
+        """Добавляет `subtotal` — сумму цен товаров с учетом количества, посчитанную в БД."""
+        return self.annotate(subtotal=Coalesce(Sum(LINE_TOTAL), Decimal("0"), output_field=models.DecimalField()))
+
+    def with_totals(self):
+        """`subtotal` и `item_count` (число товаров с учетом количества) одним запросом с GROUP BY."""
+        return self.with_subtotal().annotate(item_count=Coalesce(Sum("order_items__quantity"), 0))
+
+    def totals(self) -> Dict[int, pricing.OrderTotals]:
+        """Суммы всех заказов выборки в основной валюте заказа: два запроса при любом числе заказов."""
+        orders = list(self.values_list("pk", "discount__amount", "tax__percentage"))
+        lines = defaultdict(list)
+        currencies = {}
+        rows = OrderItem.objects.filter(order__in=self.values("pk")).order_by("order_id", "id").values_list(
+            "order_id", "item__price", "item__currency", "quantity"
+        )
+        for order_id, price, currency, quantity in rows:
+            # Строки в других валютах оплачиваются отдельными сессиями (см. Order.get_currency_totals)
+            if currencies.setdefault(order_id, currency) == currency:
+                lines[order_id].append((pricing.to_minor(price, currency), quantity))
+
+        return pricing.batch_totals(
+            (
+                pk,
+                currencies.get(pk, DEFAULT_CURRENCY),
+                lines[pk],
+                pricing.to_minor(discount or 0, currencies.get(pk, DEFAULT_CURRENCY)),
+                pricing.basis_points(percentage or 0),
+            )
+            for pk, discount, percentage in orders
+        )
+
+    def for_checkout(self):
+        """Заказ со скидкой и налогом одним JOIN и строками с товарами одним дополнительным запросом."""
+        return self.select_related("discount", "tax").prefetch_related(
+            models.Prefetch("order_items", queryset=OrderItem.objects.select_related("item").order_by("id"))
+        )
+
+
 class Order(models.Model):
-    items = models.ManyToManyField(Item)
+    STATUS_PENDING = "pending"
+    STATUS_PAID = "paid"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PAID, "Paid"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    items = models.ManyToManyField(Item, through="OrderItem")
     discount = models.ForeignKey(Discount, on_delete=models.SET_NULL, null=True, blank=True)
     tax = models.ForeignKey(Tax, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Последняя активность: изменение корзины или статуса (см. services.bump_cart_version)
+    updated_at = models.DateTimeField(auto_now=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    # Номер версии корзины: увеличивается при каждом изменении состава заказа
+    cart_version = models.PositiveIntegerField(default=0)
+    # Сессия Stripe, заранее подготовленная в фоне (см. payments.prewarm)
+    prepared_session_id = models.CharField(max_length=255, blank=True)
+    prepared_cart_version = models.PositiveIntegerField(null=True, blank=True)
+    prepared_fingerprint = models.CharField(max_length=64, blank=True)
+    prepared_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Поиск брошенных корзин командой purge_orders
+            models.Index(fields=["status", "updated_at"], name="order_retention_idx"),
+            # Фильтр по дате в админке
+            models.Index(fields=["created_at"], name="order_created_at_idx"),
+            # Отчеты о продажах: оплаченные заказы за период (см. payments.reports)
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+        ]
+
+    def get_totals(self) -> pricing.OrderTotals:
+        """Суммы заказа в основной валюте в минимальных единицах: из prefetch (`for_checkout`) или двумя запросами.
+
+        Для заказа в нескольких валютах — только часть в основной валюте, все части дает `get_currency_totals`.
+        """
+        if "order_items" not in getattr(self, "_prefetched_objects_cache", {}):
+            return Order.objects.filter(pk=self.pk).totals()[self.pk]
+
+        totals = self.get_currency_totals()
+        if not totals:
+            return pricing.compute_totals([], DEFAULT_CURRENCY)
+        return next(iter(totals.values()))
+
+    def get_currency_totals(self) -> Dict[str, pricing.OrderTotals]:
+        """Суммы каждой валютной части заказа (своя сессия Stripe на каждую), основная валюта — первой.
+
+        Скидка с фиксированной суммой относится только к основной валюте, налог — ко всем частям.
+        """
+        parts: Dict[str, list] = {}
+        for row in self._checkout_rows():
+            parts.setdefault(row.item.currency, []).append((row.item.unit_amount, row.quantity))
+
+        tax_basis_points = pricing.basis_points(self.tax.percentage) if self.tax else 0
+        primary = next(iter(parts), None)
+        return {
+            currency: pricing.compute_totals(
+                lines,
+                currency,
+                discount=pricing.to_minor(self.discount.amount, currency) if self.discount and currency == primary else 0,
+                tax_basis_points=tax_basis_points,
+            )
+            for currency, lines in parts.items()
+        }
+
+    @property
+    def primary_currency(self) -> str:
+        """Основная валюта заказа — валюта первой строки; к ее части применяется скидка."""
+        rows = self._checkout_rows()
+        return rows[0].item.currency if rows else DEFAULT_CURRENCY
+
+    def _checkout_rows(self) -> list:
+        """Строки заказа с товарами: из prefetch (`for_checkout`) или одним запросом."""
+        if "order_items" in getattr(self, "_prefetched_objects_cache", {}):
+            return list(self.order_items.all())
+        return list(self.order_items.select_related("item").order_by("id"))
+
+    def total_price(self) -> Decimal:
+        """Итоговая стоимость заказа с учетом скидки и налога (не может быть отрицательной)."""
+        return self.get_totals().as_major()["total"]
+
+    def __str__(self):
+        # Число товаров выводится, только если оно уже посчитано (with_totals): без запроса на каждую строку
+        item_count = getattr(self, "item_count", None)
+        if item_count is None:
+            return f"Order {self.id} ({self.status})"
+        return f"Order {self.id} (Items: {item_count})"
+
+
+class OrderItem(models.Model):
+    """Строка заказа: товар и его количество."""
+    # Наибольшее количество товара в строке (Stripe Checkout ограничивает quantity строки)
+    MAX_QUANTITY = 999
+
+    id = models.AutoField(primary_key=True)  # как у прежней автоматической таблицы M2M
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items")
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="order_items")
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # Таблица осталась от прежнего ManyToManyField без through-модели
+        db_table = "payments_order_items"
+        unique_together = [("order", "item")]
+
+    def __str__(self):
+        return f"{self.item} × {self.quantity}"
+
+
+class OrderCheckoutSession(models.Model):
+    """Сессия оплаты части заказа в одной валюте: заказ оплачен, когда оплачены все его валюты."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="checkout_sessions")
+    currency = models.CharField(max_length=3, choices=Item.CURRENCY_CHOICES)
+    # Последняя выданная сессия этой части (или оплаченная, если вебхук пришел по более ранней)
+    session_id = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=Order.STATUS_CHOICES, default=Order.STATUS_PENDING)
+    # Суммы части по ценам, скидке и налогу на момент выдачи сессии, в минимальных единицах
+    # (payments.pricing): отчеты не меняются, если цену товара изменили после оплаты
+    items = models.PositiveIntegerField(default=0)
+    subtotal = models.PositiveBigIntegerField(default=0)
+    discount = models.PositiveBigIntegerField(default=0)
+    tax = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["order", "currency"], name="unique_checkout_session_per_currency"),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} {self.currency}: {self.session_id} ({self.status})"
+
+
+class ArchivedOrder(models.Model):
+    """Заказ, перенесенный из рабочих таблиц командой `purge_orders --archive`."""
+    order_id = models.PositiveIntegerField(unique=True)
+    status = models.CharField(max_length=16, choices=Order.STATUS_CHOICES)
+    # Итог каждой валютной части в минимальных единицах (payments.pricing): {"usd": 1999, "eur": 500}
+    totals = models.JSONField(default=dict)
+    # Строки заказа: [{"item_id", "name", "price", "currency", "quantity"}]
+    lines = models.JSONField(default=list)
+    discount_id = models.PositiveIntegerField(null=True, blank=True)
+    tax_id = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    paid_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order {self.order_id} ({self.status})"
+
+
+class DailySales(models.Model):
+    """Продажи за день в одной валюте: свертка оплаченных заказов для отчетов (см. payments.reports)."""
+    day = models.DateField()
+    currency = models.CharField(max_length=3, choices=Item.CURRENCY_CHOICES)
+    orders = models.PositiveIntegerField()
+    items = models.PositiveIntegerField()
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2)
+    discount = models.DecimalField(max_digits=14, decimal_places=2)
+    tax = models.DecimalField(max_digits=14, decimal_places=2)
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    # Начало обновления, записавшего строку: заказы, измененные позже, попадут в следующее обновление
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "currency"], name="unique_daily_sales_per_currency"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.currency}: {self.total}"
+
+
+class StripeCoupon(models.Model):
+    """Купон Stripe, созданный для скидки в конкретной валюте (аккаунте)."""
+    discount = models.ForeignKey(Discount, on_delete=models.CASCADE, related_name="stripe_coupons")
+    currency = models.CharField(max_length=3, choices=Item.CURRENCY_CHOICES)
+    stripe_id = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["discount", "currency"], name="unique_stripe_coupon_per_currency"),
+        ]
+
+    def __str__(self):
+        return f"{self.discount} [{self.currency}] -> {self.stripe_id}"
+
+
+class StripeTaxRate(models.Model):
+    """Налоговая ставка Stripe, созданная для налога в конкретной валюте (аккаунте)."""
+    tax = models.ForeignKey(Tax, on_delete=models.CASCADE, related_name="stripe_tax_rates")
+    currency = models.CharField(max_length=3, choices=Item.CURRENCY_CHOICES)
+    stripe_id = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tax", "currency"], name="unique_stripe_tax_rate_per_currency"),
+        ]
 
-    def total_price(self):
-        """Вычисляет общую стоимость заказа с учетом скидки и налогов."""
-        subtotal = sum(item.price for item in self.items.all())
+    def __str__(self):
+        return f"{self.tax} [{self.currency}] -> {self.stripe_id}"
+
+
+class StripeEvent(models.Model):
+    """Событие вебхука Stripe, сохраненное до обработки (очередь в БД)."""
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSED = "processed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSED, "Processed"),
+        (STATUS_FAILED, "Failed"),
+    ]
 
-        discount_amount = self.discount.amount if self.discount else 0
-        taxed_amount = (subtotal - discount_amount) * (self.tax.percentage / 100) if self.tax else 0
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    currency = models.CharField(max_length=3, choices=Item.CURRENCY_CHOICES, help_text="Аккаунт Stripe, приславший событие")
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Не раньше этого времени событие берется на повтор после ошибки (пусто — сразу)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
 
-        return max(subtotal - discount_amount + taxed_amount, 0)  # Итоговая сумма не может быть отрицательной
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="stripe_event_queue_idx"),
+        ]
 
     def __str__(self):
-        return f"Order {self.id} (Items: {self.items.count()})"
+        return f"{self.type} {self.event_id} ({self.status})"
@@ -0,0 +1,161 @@
+"""Оплата заказа с товарами в нескольких валютах.
+
+У каждой валюты свой аккаунт Stripe (`STRIPE_SECRET_KEYS`), поэтому строки заказа
+делятся по валютам и на каждую часть создается своя сессия. Сессии создаются
+одновременно (потоки в синхронном пути, `asyncio.gather` в асинхронном), так что
+оплата корзины в двух валютах занимает примерно один запрос к Stripe.
+
+Части отслеживаются в `OrderCheckoutSession`: заказ становится оплаченным, когда
+оплачены все части (см. payments.webhooks), а повторный вызов создает сессии
+только для еще не оплаченных частей.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from payments import prewarm
+from payments.models import Order, OrderCheckoutSession
+from payments.services import acreate_checkout_session, create_checkout_session, create_stripe_line_items
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def partition_line_items(order: Order) -> Dict[str, List[Dict]]:
+    """Строки сессий Stripe по валютам; основная валюта заказа (первой строки) — первой."""
+    parts: Dict[str, list] = {}
+    for row in order.order_items.all():
+        parts.setdefault(row.item.currency, []).append(row)
+    return {
+        currency: create_stripe_line_items([row.item for row in rows], {row.item_id: row.quantity for row in rows})
+        for currency, rows in parts.items()
+    }
+
+
+def unpaid_parts(order: Order) -> Dict[str, List[Dict]]:
+    """Части заказа, которые еще не оплачены."""
+    paid = set(
+        OrderCheckoutSession.objects.filter(order=order, status=Order.STATUS_PAID).values_list("currency", flat=True)
+    )
+    return {currency: line_items for currency, line_items in partition_line_items(order).items() if currency not in paid}
+
+
+def create_order_checkout_sessions(site_url: str, order: Order) -> List[Dict]:
+    """Сессии оплаты всех неоплаченных частей заказа, загруженного через `Order.objects.for_checkout()`."""
+    parts = unpaid_parts(order)
+    if not parts:
+        raise ValueError("Order is already paid")
+
+    if len(parts) == 1:
+        currency, line_items = next(iter(parts.items()))
+        # Сессия, подготовленная в фоне после последнего изменения корзины, отдается без запросов к Stripe
+        result = prewarm.get_prepared_session(order, site_url, line_items, currency)
+        results = {currency: result or create_checkout_session(site_url, order, line_items, currency)}
+    else:
+        futures = {
+            # Контекст копируется, чтобы запросы к Stripe учитывались в метриках текущего HTTP-запроса
+            currency: _get_executor().submit(
+                contextvars.copy_context().run, _create_in_thread, site_url, order, line_items, currency
+            )
+            for currency, line_items in parts.items()
+        }
+        results = {currency: future.result() for currency, future in futures.items()}
+
+    track_sessions(order, results)
+    return [_session_entry(currency, result) for currency, result in results.items()]
+
+
+async def acreate_order_checkout_sessions(site_url: str, order: Order) -> List[Dict]:
+    """Асинхронная версия `create_order_checkout_sessions`: сессии всех валют создаются одновременно."""
+    parts = await sync_to_async(unpaid_parts)(order)
+    if not parts:
+        raise ValueError("Order is already paid")
+
+    prepared = None
+    if len(parts) == 1:
+        currency, line_items = next(iter(parts.items()))
+        prepared = prewarm.get_prepared_session(order, site_url, line_items, currency)
+
+    if prepared is not None:
+        results = {currency: prepared}
+    else:
+        created = await asyncio.gather(*(
+            acreate_checkout_session(site_url, order, line_items, currency) for currency, line_items in parts.items()
+        ))
+        results = dict(zip(parts, created))
+
+    await sync_to_async(track_sessions)(order, results)
+    return [_session_entry(currency, result) for currency, result in results.items()]
+
+
+def track_sessions(order: Order, results: Dict[str, Dict]) -> None:
+    """Запоминает выданные сессии частей заказа и их суммы; неудачная оплата части снова становится ожидающей.
+
+    Суммы считает `Order.get_currency_totals()` (те же, что ушли в Stripe) по строкам,
+    уже загруженным для сессии. Отчеты о продажах строятся по ним, а не по текущим ценам.
+    """
+    if not any("session_id" in result for result in results.values()):
+        return
+    totals = order.get_currency_totals()
+    items: Dict[str, int] = {}
+    for row in order.order_items.all():
+        items[row.item.currency] = items.get(row.item.currency, 0) + row.quantity
+    rows = [
+        OrderCheckoutSession(
+            order=order,
+            currency=currency,
+            session_id=result["session_id"],
+            items=items[currency],
+            subtotal=totals[currency].subtotal,
+            discount=totals[currency].discount,
+            tax=totals[currency].tax,
+            total=totals[currency].total,
+        )
+        for currency, result in results.items()
+        if "session_id" in result
+    ]
+    OrderCheckoutSession.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["order", "currency"],
+        update_fields=["session_id", "items", "subtotal", "discount", "tax", "total", "updated_at"],
+    )
+    OrderCheckoutSession.objects.filter(
+        order=order, currency__in=[row.currency for row in rows], status=Order.STATUS_FAILED
+    ).update(status=Order.STATUS_PENDING)
+
+
+def _session_entry(currency: str, result: Dict) -> Dict:
+    """Элемент ответа: сессия и публичный ключ аккаунта ее валюты (для Stripe.js) или ошибка."""
+    if "session_id" in result:
+        return {
+            "currency": currency,
+            "session_id": result["session_id"],
+            "public_key": settings.STRIPE_PUBLIC_KEYS.get(currency, ""),
+        }
+    return {"currency": currency, **result}
+
+
+def _create_in_thread(site_url: str, order: Order, line_items: List[Dict], currency: str) -> Dict:
+    close_old_connections()
+    try:
+        return create_checkout_session(site_url, order, line_items, currency)
+    finally:
+        close_old_connections()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ORDER_CHECKOUT_WORKERS, thread_name_prefix="checkout-fanout"
+                )
+    return _executor
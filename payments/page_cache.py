@@ -0,0 +1,35 @@
+import hashlib
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from payments import caching, db_router
+
+
+# Страницы хранятся в пространстве имен `items`: любое изменение товара увеличивает
+# его версию, и старые страницы товаров и каталога просто перестают читаться.
+def catalog_page(cursor: int, limit: int, render: Callable[[], Dict]) -> Dict:
+    """Страница JSON-каталога из кэша или результат `render()`."""
+    return caching.items.get_or_set(("catalog", cursor, limit), lambda: _render(render))
+
+
+def item_page(item_id: int, render: Callable[[], Dict]) -> Dict:
+    """Страница товара из кэша или результат `render()`."""
+    return caching.items.get_or_set(("page", item_id), lambda: _render(render))
+
+
+def _render(render: Callable[[], Dict]) -> Dict:
+    """Рендер с реплики, кроме первых `DB_REPLICA_LAG` секунд после изменения каталога:
+    иначе отстающая реплика отдала бы старые данные, и они остались бы в кэше на `PAGE_CACHE_TTL`."""
+    if db_router.catalog_recently_written():
+        return render()
+    with db_router.replica_reads():
+        return render()
+
+
+def make_entry(content: bytes, last_modified: Optional[datetime]) -> Dict:
+    """Запись кэша страницы: содержимое вместе с ETag и Last-Modified для условных запросов."""
+    return {
+        "content": content,
+        "etag": f'"{hashlib.md5(content).hexdigest()}"',
+        "last_modified": last_modified.timestamp() if last_modified else None,
+    }
@@ -0,0 +1,87 @@
+"""Фоновая подготовка сессий оплаты заказов.
+
+После изменения корзины сессия Stripe создается в пуле потоков и сохраняется
+в `Order` вместе с номером версии корзины (`cart_version`) и отпечатком
+содержимого. `/order/buy/` отдает ее сразу, если заказ с тех пор не менялся.
+Готовятся только заказы в одной валюте.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from payments.checkout_cache import checkout_fingerprint
+from payments.models import Order
+from payments.services import create_checkout_session, create_order_line_items
+
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def schedule(order_id: int, site_url: str) -> None:
+    """Ставит подготовку сессии в очередь после коммита текущей транзакции."""
+    if settings.ORDER_SESSION_PREWARM:
+        transaction.on_commit(lambda: _get_executor().submit(prepare, order_id, site_url))
+
+
+def prepare(order_id: int, site_url: str) -> None:
+    """Создает сессию Stripe для текущей версии корзины и сохраняет ее в заказе."""
+    close_old_connections()
+    try:
+        order = Order.objects.for_checkout().filter(id=order_id, status=Order.STATUS_PENDING).first()
+        if order is None or order.prepared_cart_version == order.cart_version:
+            return
+        order_items = list(order.order_items.all())
+        # Заказ в нескольких валютах оплачивается несколькими сессиями (payments.order_checkout), их не готовим
+        if not order_items or len({row.item.currency for row in order_items}) > 1:
+            return
+
+        currency = order_items[0].item.currency
+        line_items = create_order_line_items(order)
+        fingerprint = checkout_fingerprint(site_url, order, line_items, currency)
+        result = create_checkout_session(site_url, order, line_items, currency)
+        if "session_id" not in result:
+            return
+
+        # Если корзина успела измениться, сессия уже устарела и не сохраняется
+        Order.objects.filter(id=order_id, cart_version=order.cart_version).update(
+            prepared_session_id=result["session_id"],
+            prepared_cart_version=order.cart_version,
+            prepared_fingerprint=fingerprint,
+            prepared_at=timezone.now(),
+        )
+    except Exception:
+        logger.exception(f"Failed to prepare checkout session for order {order_id}")
+    finally:
+        close_old_connections()
+
+
+def get_prepared_session(order: Order, site_url: str, line_items: List[Dict], currency: str) -> Optional[Dict]:
+    """Подготовленная сессия, если она создана для текущего содержимого заказа и еще не устарела."""
+    if not order.prepared_session_id or order.prepared_cart_version != order.cart_version:
+        return None
+    if order.prepared_at < timezone.now() - timedelta(seconds=settings.ORDER_SESSION_PREWARM_MAX_AGE):
+        return None
+    # Отпечаток учитывает скидку, налог и цены, которые могли измениться без изменения корзины
+    if order.prepared_fingerprint != checkout_fingerprint(site_url, order, line_items, currency):
+        return None
+    return {"session_id": order.prepared_session_id}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ORDER_SESSION_PREWARM_WORKERS, thread_name_prefix="checkout-prewarm"
+                )
+    return _executor
@@ -0,0 +1,114 @@
+"""Расчет сумм заказа в целых минимальных единицах валюты (центах).
+
+Один и тот же расчет используется моделью (`Order.total_price`) и платежной сессией
+(цены строк и купон скидки), поэтому сумма в БД и сумма в Stripe
+не расходятся из-за разного округления. Суммы частей заказа запоминаются при выдаче сессии
+(`OrderCheckoutSession`) и по ним строятся отчеты (`payments.reports`).
+
+Правила повторяют Stripe: скидка с фиксированной суммой распределяется по строкам
+пропорционально их стоимости, налог считается по каждой строке после скидки
+и округляется до цента (половина — вверх).
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, List, Sequence, Tuple, Union
+
+
+# Число знаков после запятой в валютах аккаунтов; для остальных валют — 2
+MINOR_UNIT_EXPONENTS = {"usd": 2, "eur": 2}
+
+Money = Union[Decimal, int, str]
+
+
+def exponent(currency: str) -> int:
+    return MINOR_UNIT_EXPONENTS.get(currency, 2)
+
+
+def to_minor(amount: Money, currency: str) -> int:
+    """Сумма в минимальных единицах с округлением до ближайшей (половина — вверх), а не отбрасыванием."""
+    scaled = Decimal(amount).scaleb(exponent(currency))
+    return int(scaled.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_major(amount: int, currency: str) -> Decimal:
+    """Сумма в основных единицах валюты: 1999 -> Decimal("19.99")."""
+    return Decimal(amount).scaleb(-exponent(currency))
+
+
+def basis_points(percentage: Money) -> int:
+    """Процент налога в сотых долях процента: 10.25 -> 1025 (у `Tax.percentage` два знака)."""
+    return to_minor(percentage, "usd")
+
+
+@dataclass(frozen=True)
+class OrderTotals:
+    currency: str
+    subtotal: int
+    discount: int
+    tax: int
+    total: int
+
+    def as_major(self) -> dict:
+        """Суммы в основных единицах для ответов API и отчетов."""
+        return {
+            "currency": self.currency,
+            "subtotal": to_major(self.subtotal, self.currency),
+            "discount": to_major(self.discount, self.currency),
+            "tax": to_major(self.tax, self.currency),
+            "total": to_major(self.total, self.currency),
+        }
+
+
+def compute_totals(
+    lines: Sequence[Tuple[int, int]], currency: str, discount: int = 0, tax_basis_points: int = 0
+) -> OrderTotals:
+    """Суммы заказа по строкам `(цена за единицу, количество)` в минимальных единицах.
+
+    Скидка не превышает стоимость товаров, поэтому итог никогда не отрицателен.
+    """
+    amounts = [unit_amount * quantity for unit_amount, quantity in lines]
+    subtotal = sum(amounts)
+    discount = min(max(discount, 0), subtotal)
+
+    tax = 0
+    if tax_basis_points:
+        taxable = [amount - share for amount, share in zip(amounts, allocate(discount, amounts))] if discount else amounts
+        tax = sum(_round_half_up(amount, tax_basis_points, 10_000) for amount in taxable)
+
+    return OrderTotals(currency, subtotal, discount, tax, subtotal - discount + tax)
+
+
+def allocate(total: int, weights: Sequence[int]) -> List[int]:
+    """Делит `total` пропорционально `weights` так, что сумма частей точно равна `total`.
+
+    Остаток от целочисленного деления достается частям с наибольшей дробной частью.
+    """
+    weight_sum = sum(weights)
+    if not weight_sum:
+        return [0] * len(weights)
+
+    shares = [total * weight // weight_sum for weight in weights]
+    left = total - sum(shares)
+    if not left:
+        return shares
+    remainders = sorted(
+        range(len(weights)), key=lambda index: (-(total * weights[index] % weight_sum), index)
+    )
+    for index in remainders[:left]:
+        shares[index] += 1
+    return shares
+
+
+def batch_totals(
+    orders: Iterable[Tuple[int, str, Sequence[Tuple[int, int]], int, int]]
+) -> dict:
+    """Суммы для многих заказов: `(id, валюта, строки, скидка, налог в б.п.)` -> {id: OrderTotals}."""
+    return {
+        order_id: compute_totals(lines, currency, discount, tax_basis_points)
+        for order_id, currency, lines, discount, tax_basis_points in orders
+    }
+
+
+def _round_half_up(numerator: int, multiplier: int, divisor: int) -> int:
+    """round(numerator * multiplier / divisor) для неотрицательных целых без float."""
+    return (2 * numerator * multiplier + divisor) // (2 * divisor)
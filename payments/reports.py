@@ -0,0 +1,202 @@
+"""Отчеты о продажах: выручка, число заказов, средний чек, скидки и налоги по валютам и периодам.
+
+Отчет строится по частям заказов (`OrderCheckoutSession`): при выдаче сессии оплаты
+в части запоминаются число товаров, сумма, скидка, налог и итог, посчитанные
+`payments.pricing` (распределение скидки по строкам и округление налога по строке),
+то есть ровно то, что ушло в Stripe. Поэтому изменение цены товара, скидки или налога
+после оплаты не меняет прошлые отчеты, а суммы совпадают с `Order.get_currency_totals()`.
+В отчет попадают только заказы, дошедшие до оплаты.
+
+Все суммы считаются в БД одним запросом с группировкой по валюте и дню/неделе
+`created_at` заказа (индекс order_status_created_idx). Заказы в Python не загружаются.
+
+Свертка `DailySales` хранит те же суммы оплаченных заказов по дням и обновляется
+инкрементально: пересчитываются только дни, в которых заказы менялись с прошлого обновления.
+"""
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+
+from payments import pricing
+from payments.models import DailySales, Order, OrderCheckoutSession
+
+PERIODS = ("day", "week")
+SOURCES = ("live", "rollup")
+
+CENT = Decimal("0.01")
+
+# Запас при инкрементальном обновлении свертки: заказы из транзакций, начатых до прошлого
+# обновления и закоммиченных после него, имеют updated_at раньше его начала
+ROLLUP_OVERLAP = timedelta(minutes=5)
+
+# Поля строки отчета, которые суммируются при объединении строк
+SUMMED_FIELDS = ("orders", "items", "subtotal", "discount", "tax", "total")
+# Суммы в минимальных единицах, запомненные в части заказа при выдаче сессии
+AMOUNT_FIELDS = ("subtotal", "discount", "tax", "total")
+
+
+def order_parts(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    statuses: Iterable[str] = (Order.STATUS_PAID,),
+    currency: Optional[str] = None,
+):
+    """Части заказов в статусах `statuses`, созданных с `start` по `end` включительно."""
+    parts = OrderCheckoutSession.objects.filter(order__status__in=list(statuses))
+    if start is not None:
+        parts = parts.filter(order__created_at__gte=_day_start(start))
+    if end is not None:
+        parts = parts.filter(order__created_at__lt=_day_start(end + timedelta(days=1)))
+    if currency:
+        parts = parts.filter(currency=currency)
+    return parts
+
+
+def _truncate(field: str, period: str):
+    if period == "week":
+        # Неделя начинается с понедельника
+        return TruncWeek(field)
+    return TruncDate(field)
+
+
+def live_report(period: str = "day", **filters) -> List[Dict]:
+    """Отчет по заказам одним запросом: строка на валюту и период."""
+    rows = (
+        order_parts(**filters)
+        .order_by()
+        .values("currency", period=_truncate("order__created_at", period))
+        .annotate(orders=Count("id"), items=Sum("items"), **{name: Sum(name) for name in AMOUNT_FIELDS})
+        .order_by("period", "currency")
+    )
+    report = []
+    for row in rows:
+        for name in AMOUNT_FIELDS:
+            row[name] = pricing.to_major(row[name], row["currency"])
+        report.append(_row(row))
+    return report
+
+
+def rollup_report(
+    period: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    currency: Optional[str] = None,
+) -> List[Dict]:
+    """Тот же отчет по оплаченным заказам из свертки `DailySales` (без обращения к заказам)."""
+    queryset = DailySales.objects.all()
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lte=end)
+    if currency:
+        queryset = queryset.filter(currency=currency)
+
+    rows = (
+        queryset.annotate(period=TruncWeek("day", output_field=models.DateField()) if period == "week" else F("day"))
+        .order_by()
+        .values("period", "currency")
+        .annotate(**{name: Sum(name) for name in SUMMED_FIELDS})
+        .order_by("period", "currency")
+    )
+    return [_row(row) for row in rows]
+
+
+def summary(rows: List[Dict]) -> List[Dict]:
+    """Итоги отчета по каждой валюте за весь период."""
+    totals: Dict[str, Dict] = {}
+    for row in rows:
+        current = totals.setdefault(row["currency"], {"currency": row["currency"], **{name: 0 for name in SUMMED_FIELDS}})
+        for name in SUMMED_FIELDS:
+            current[name] += row[name]
+    return [_with_averages(row) for row in totals.values()]
+
+
+def refresh_rollup(full: bool = False) -> Dict[str, int]:
+    """Пересчитывает дни свертки, в которых оплаченные заказы менялись с прошлого обновления.
+
+    `full` пересчитывает все дни. Возвращает число пересчитанных дней и записанных строк.
+    """
+    started = timezone.now()
+    last_refresh = None if full else DailySales.objects.aggregate(last=models.Max("refreshed_at"))["last"]
+
+    paid = Order.objects.filter(status=Order.STATUS_PAID)
+    if last_refresh is not None:
+        # Индекс order_retention_idx (status, updated_at)
+        paid = paid.filter(updated_at__gte=last_refresh - ROLLUP_OVERLAP)
+    days = sorted(set(paid.annotate(day=TruncDate("created_at")).order_by().values_list("day", flat=True)))
+
+    written = 0
+    # Одна транзакция: при ошибке свертка и отметка времени обновления остаются прежними
+    with transaction.atomic():
+        if full:
+            DailySales.objects.all().delete()
+        for chunk in _chunks(days, 100):
+            rows = []
+            for start, end in _day_ranges(chunk):
+                rows.extend(live_report("day", start=start, end=end))
+            DailySales.objects.filter(day__in=chunk).delete()
+            DailySales.objects.bulk_create(
+                DailySales(
+                    day=row["period"],
+                    currency=row["currency"],
+                    refreshed_at=started,
+                    **{name: row[name] for name in SUMMED_FIELDS},
+                )
+                for row in rows
+            )
+            written += len(rows)
+    return {"days": len(days), "rows": written}
+
+
+def _row(row: Dict) -> Dict:
+    row = dict(row, period=_to_date(row["period"]))
+    for name in ("subtotal", "discount", "tax", "total"):
+        row[name] = _to_money(row[name])
+    return _with_averages(row)
+
+
+def _to_date(value) -> date:
+    """Начало периода из БД: дата, datetime (TruncWeek) или строка (SQLite)."""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _to_money(value) -> Decimal:
+    """Сумма из БД (Decimal, а в SQLite — float) с точностью до цента."""
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def _with_averages(row: Dict) -> Dict:
+    """Средний чек и среднее число товаров в заказе."""
+    orders = row["orders"]
+    row["average_order"] = (row["total"] / orders).quantize(CENT) if orders else Decimal("0.00")
+    row["average_items"] = round(row["items"] / orders, 2) if orders else 0
+    return row
+
+
+def _day_start(day: date):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _day_ranges(days: List[date]):
+    """Подряд идущие дни объединяются в один диапазон: меньше запросов при пересчете."""
+    start = previous = days[0]
+    for day in days[1:]:
+        if day != previous + timedelta(days=1):
+            yield start, previous
+            start = day
+        previous = day
+    yield start, previous
+
+
+def _chunks(values: List, size: int):
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from django.conf import settings
+
+from payments.metrics import registry as metrics_registry
+
+
+class StripeUnavailable(Exception):
+    """Stripe для этой валюты сейчас недоступен: запросы не отправляются, пока breaker открыт."""
+
+    def __init__(self, currency: str, retry_after: float):
+        super().__init__(f"Stripe is temporarily unavailable for {currency}")
+        self.currency = currency
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker по доле ошибок в скользящем окне.
+
+    closed — запросы идут, результаты копятся в окне; если за `window` секунд было
+    не меньше `min_calls` запросов и доля ошибок достигла `error_rate`, breaker
+    открывается. open — запросы сразу отклоняются `StripeUnavailable` в течение
+    `open_seconds`. half-open — пропускается один пробный запрос: успех закрывает
+    breaker, ошибка снова открывает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, error_rate: float, min_calls: int, window: float, open_seconds: float):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Пропускает запрос или бросает `StripeUnavailable`."""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    metrics_registry.inc("stripe_circuit_rejected_total", {"currency": self.name})
+                    raise StripeUnavailable(self.name, remaining)
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    metrics_registry.inc("stripe_circuit_rejected_total", {"currency": self.name})
+                    raise StripeUnavailable(self.name, self.open_seconds)
+                self._trial_in_flight = True
+
+    def record(self, success: bool) -> None:
+        """Учитывает результат запроса, пропущенного `before_call`."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if success:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+
+            self._calls.append((now, success))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = self.OPEN
+        self._opened_at = now
+        self._trial_in_flight = False
+        self._calls.clear()
+        metrics_registry.inc("stripe_circuit_opened_total", {"currency": self.name})
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_lock = threading.Lock()
+
+
+def get_breaker(currency: str) -> CircuitBreaker:
+    """Breaker аккаунта Stripe для валюты (один на процесс)."""
+    breaker = _breakers.get(currency)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(
+                currency,
+                CircuitBreaker(
+                    currency,
+                    error_rate=settings.STRIPE_BREAKER_ERROR_RATE,
+                    min_calls=settings.STRIPE_BREAKER_MIN_CALLS,
+                    window=settings.STRIPE_BREAKER_WINDOW,
+                    open_seconds=settings.STRIPE_BREAKER_OPEN_SECONDS,
+                ),
+            )
+    return breaker
@@ -0,0 +1,77 @@
+"""Удаление и архивирование брошенных заказов.
+
+Заказы обрабатываются пачками, каждая в своей короткой транзакции, поэтому
+таблицы заказов не блокируются надолго и сервис продолжает работать во время очистки.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from payments.models import ArchivedOrder, Order, OrderCheckoutSession, OrderItem
+
+
+def stale_orders(cutoff: datetime, statuses: Iterable[str]):
+    """Заказы в статусах `statuses` без активности с момента `cutoff` (индекс order_retention_idx).
+
+    Неоплаченный заказ в нескольких валютах, у которого часть уже оплачена, не брошенная корзина:
+    деньги по нему списаны, поэтому он не очищается, пока не будут оплачены остальные части.
+    """
+    paid_part = OrderCheckoutSession.objects.filter(order_id=OuterRef("pk"), status=Order.STATUS_PAID)
+    return Order.objects.filter(status__in=list(statuses), updated_at__lt=cutoff).exclude(
+        Q(Exists(paid_part)) & ~Q(status=Order.STATUS_PAID)
+    )
+
+
+def purge_batch(cutoff: datetime, statuses: Iterable[str], batch_size: int, archive: bool = False) -> Dict[str, int]:
+    """Удаляет (и при `archive` копирует в `ArchivedOrder`) до `batch_size` заказов; возвращает число строк."""
+    with transaction.atomic():
+        # Заказы, которые сейчас меняет другая транзакция, пропускаются до следующего запуска
+        ids = list(
+            stale_orders(cutoff, statuses)
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return {"orders": 0, "order_items": 0, "archived": 0}
+
+        archived = 0
+        if archive:
+            # Заказы, уже попавшие в архив при прерванном запуске, не копируются и не считаются повторно
+            already = set(ArchivedOrder.objects.filter(order_id__in=ids).values_list("order_id", flat=True))
+            orders = Order.objects.for_checkout().filter(id__in=ids).exclude(id__in=already)
+            archived = len(ArchivedOrder.objects.bulk_create([_archive_row(order) for order in orders]))
+
+        # Строки заказа удаляются одним запросом, до каскада от Order
+        order_items, _ = OrderItem.objects.filter(order_id__in=ids).delete()
+        # delete() возвращает и строки каскада: заказы считаются по своей модели
+        _, deleted = Order.objects.filter(id__in=ids).delete()
+        orders = deleted.get(Order._meta.label, 0)
+    return {"orders": orders, "order_items": order_items, "archived": archived}
+
+
+def _archive_row(order: Order) -> ArchivedOrder:
+    lines: List[Dict] = [
+        {
+            "item_id": row.item_id,
+            "name": row.item.name,
+            "price": str(row.item.price),
+            "currency": row.item.currency,
+            "quantity": row.quantity,
+        }
+        for row in order.order_items.all()
+    ]
+    return ArchivedOrder(
+        order_id=order.pk,
+        status=order.status,
+        # Все валютные части, а не только основная (total_price): каждая оплачивается своей сессией
+        totals={currency: part.total for currency, part in order.get_currency_totals().items()},
+        lines=lines,
+        discount_id=order.discount_id,
+        tax_id=order.tax_id,
+        created_at=order.created_at,
+        updated_at=order.updated_at,
+        paid_at=order.paid_at,
+    )
@@ -1,7 +1,61 @@
 from rest_framework import serializers
 
+from . import reports
+from .models import Item, Order, OrderItem
+
 
 class AddToOrderSerializer(serializers.Serializer):
     """Сериализатор для добавления товара в заказ."""
     item_id = serializers.IntegerField(required=True)
-    order_id = serializers.CharField(required=False, allow_null=True)
\ No newline at end of file
+    order_id = serializers.CharField(required=False, allow_null=True)
+
+class CartOperationSerializer(serializers.Serializer):
+    """Одна операция над корзиной: добавить, удалить или задать количество товара."""
+    op = serializers.ChoiceField(choices=["add", "remove", "set"])
+    item_id = serializers.IntegerField(required=True)
+    quantity = serializers.IntegerField(required=False, default=1, min_value=0, max_value=OrderItem.MAX_QUANTITY)
+
+
+class UpdateOrderItemsSerializer(serializers.Serializer):
+    """Сериализатор для пакетного изменения товаров в заказе."""
+    order_id = serializers.CharField(required=False, allow_null=True)
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class ItemSerializer(serializers.ModelSerializer):
+    """Сериализатор товара для JSON-каталога."""
+
+    class Meta:
+        model = Item
+        fields = ["id", "name", "description", "price", "currency"]
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    """Параметры отчета о продажах."""
+    period = serializers.ChoiceField(choices=reports.PERIODS, default="day")
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    currency = serializers.ChoiceField(choices=Item.CURRENCY_CHOICES, required=False)
+    status = serializers.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    source = serializers.ChoiceField(choices=reports.SOURCES, default="live")
+
+    def validate(self, attrs):
+        if attrs.get("start") and attrs.get("end") and attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError("start must not be after end")
+        if attrs["source"] == "rollup" and attrs.get("status", {Order.STATUS_PAID}) != {Order.STATUS_PAID}:
+            raise serializers.ValidationError("rollup contains only paid orders")
+        return attrs
+
+
+class SalesReportRowSerializer(serializers.Serializer):
+    """Строка отчета о продажах; суммы — строками, как цены в остальном API."""
+    period = serializers.DateField(required=False)
+    currency = serializers.CharField()
+    orders = serializers.IntegerField()
+    items = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    discount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    tax = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    average_order = serializers.DecimalField(max_digits=14, decimal_places=2)
+    average_items = serializers.FloatField()
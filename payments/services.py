@@ -1,34 +1,61 @@
 import logging
+import uuid
+from functools import partial
 from typing import List, Dict, Optional
 
 import stripe
+from django.db import transaction
+from django.db.models import F, Q
 from django.http import HttpRequest
 from django.urls import reverse
+from django.utils import timezone
 
-from payments.models import Item, Order
-from stripe_project import settings
+from payments import buyer, caching
+from payments.checkout_cache import aget_or_create_session, checkout_fingerprint, get_or_create_session
+from payments.models import Item, Order, OrderCheckoutSession, OrderItem
+from payments.stripe_clients import get_stripe_client
+from payments.stripe_registry import (
+    aget_stripe_coupon_id,
+    aget_stripe_tax_rate_id,
+    get_stripe_coupon_id,
+    get_stripe_tax_rate_id,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
-def create_stripe_line_items(items: List[Item]) -> List[Dict]:
-    """Создает список элементов для платежной сессии Stripe."""
+class CartLocked(Exception):
+    """Состав заказа больше нельзя менять: заказ или одна из его валютных частей уже оплачены."""
+
+    def __init__(self, order_id):
+        super().__init__(f"Order {order_id} is already paid or partly paid")
+        self.order_id = order_id
+
+
+def create_stripe_line_item(item: Item, quantity: int = 1) -> Dict:
+    """Строка платежной сессии: id цены из каталога Stripe или inline `price_data`, если товар не синхронизирован."""
+    if item.has_synced_price:
+        return {"price": item.stripe_price_id, "quantity": quantity}
+
+    return {
+        "price_data": {
+            "currency": item.currency,
+            "product_data": {"name": item.name},
+            "unit_amount": item.unit_amount,
+        },
+        "quantity": quantity,
+    }
+
+
+def create_stripe_line_items(items: List[Item], quantities: Optional[Dict[int, int]] = None) -> List[Dict]:
+    """Создает список элементов для платежной сессии Stripe (по одной строке на товар)."""
     if not items:
         raise ValueError("Items list is empty")
 
+    quantities = quantities or {}
     currency = items[0].currency
-    line_items = [
-        {
-            "price_data": {
-                "currency": item.currency,
-                "product_data": {"name": item.name},
-                "unit_amount": int(item.price * 100),
-            },
-            "quantity": 1,
-        }
-        for item in items
-    ]
+    line_items = [create_stripe_line_item(item, quantities.get(item.id, 1)) for item in items]
 
     if any(item.currency != currency for item in items):
         raise ValueError("All items must have the same currency")
@@ -36,57 +63,227 @@ def create_stripe_line_items(items: List[Item]) -> List[Dict]:
     return line_items
 
 
-def create_stripe_checkout_session(request: HttpRequest, order: Optional[Order], line_items: List[Dict]) -> Dict:
-    """Создает платежную сессию в Stripe для товара или заказа."""
+def create_order_line_items(order: Order) -> List[Dict]:
+    """Строки платежной сессии для заказа, загруженного через `Order.objects.for_checkout()`."""
+    order_items = list(order.order_items.all())
+    return create_stripe_line_items(
+        [row.item for row in order_items], {row.item_id: row.quantity for row in order_items}
+    )
+
+
+@transaction.atomic
+def apply_cart_operations(order: Order, operations: List[Dict]) -> List[OrderItem]:
+    """Применяет к заказу список операций add/remove/set за постоянное число запросов.
+
+    Операция: `{"op": "add" | "remove" | "set", "item_id": int, "quantity": int}`.
+    `set` с количеством 0 удаляет товар. Возвращает строки заказа после изменения.
+    Количество больше `OrderItem.MAX_QUANTITY` (в том числе накопленное `add`) — ValueError.
+    """
+    item_ids = {operation["item_id"] for operation in operations}
+    existing_ids = set(Item.objects.filter(id__in=item_ids).values_list("id", flat=True))
+    missing = item_ids - existing_ids
+    if missing:
+        raise Item.DoesNotExist(f"Items not found: {sorted(missing)}")
+
+    rows = {row.item_id: row for row in OrderItem.objects.select_for_update().filter(order=order, item_id__in=item_ids)}
+    quantities = {item_id: row.quantity for item_id, row in rows.items()}
+
+    for operation in operations:
+        item_id = operation["item_id"]
+        quantity = operation.get("quantity", 1)
+        if operation["op"] == "add":
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+        elif operation["op"] == "set":
+            quantities[item_id] = quantity
+        elif operation["op"] == "remove":
+            quantities[item_id] = 0
+        else:
+            raise ValueError(f"Unknown cart operation: {operation['op']}")
+
+    too_many = sorted(item_id for item_id, quantity in quantities.items() if quantity > OrderItem.MAX_QUANTITY)
+    if too_many:
+        raise ValueError(f"Quantity exceeds {OrderItem.MAX_QUANTITY} for items: {too_many}")
+
+    to_create, to_update, to_delete = [], [], []
+    for item_id, quantity in quantities.items():
+        row = rows.get(item_id)
+        if row is None:
+            if quantity > 0:
+                to_create.append(OrderItem(order=order, item_id=item_id, quantity=quantity))
+        elif quantity <= 0:
+            to_delete.append(row.id)
+        elif quantity != row.quantity:
+            row.quantity = quantity
+            to_update.append(row)
+
+    if to_create:
+        OrderItem.objects.bulk_create(to_create)
+    if to_update:
+        OrderItem.objects.bulk_update(to_update, ["quantity"])
+    if to_delete:
+        OrderItem.objects.filter(id__in=to_delete).delete()
+    if to_create or to_update or to_delete:
+        bump_cart_version(order.pk)
+
+    return list(OrderItem.objects.filter(order=order).order_by("id"))
+
+
+def ensure_cart_editable(order_id) -> None:
+    """CartLocked, если заказ или часть заказа в одной из валют уже оплачены (одним запросом).
+
+    Иначе товар, добавленный в уже оплаченную валютную часть, не попал бы ни в одну сессию
+    и заказ стал бы оплаченным без него.
+    """
+    paid = Q(status=Order.STATUS_PAID) | Q(
+        id__in=OrderCheckoutSession.objects.filter(order_id=order_id, status=Order.STATUS_PAID).values("order_id")
+    )
+    if Order.objects.filter(paid, id=order_id).exists():
+        raise CartLocked(order_id)
+
+
+def bump_cart_version(order_id: int) -> None:
+    """Отмечает изменение корзины: заранее подготовленная сессия оплаты становится неактуальной."""
+    Order.objects.filter(pk=order_id).update(cart_version=F("cart_version") + 1, updated_at=timezone.now())
+    caching.orders.invalidate(order_id)
+
+
+def get_site_url(request: HttpRequest) -> str:
+    """Адрес сайта (схема и хост), на который Stripe вернет покупателя после оплаты."""
+    return request.build_absolute_uri("/").rstrip("/")
+
+
+def create_stripe_checkout_session(
+    request: HttpRequest, order: Optional[Order], line_items: List[Dict], currency: str
+) -> Dict:
+    """Создает платежную сессию в Stripe для товара или заказа.
+
+    Повторный запрос того же покупателя с тем же содержимым в пределах
+    `CHECKOUT_SESSION_TTL` возвращает уже созданную сессию.
+    """
+    client = get_client_identity(request, request.user) if order is None else ""
+    return create_checkout_session(get_site_url(request), order, line_items, currency, client)
+
+
+def create_checkout_session(
+    site_url: str, order: Optional[Order], line_items: List[Dict], currency: str, client: str = ""
+) -> Dict:
+    """То же, что `create_stripe_checkout_session`, но без HTTP-запроса (для фоновых задач).
+
+    Сессия товара без заказа переиспользуется только для того же покупателя `client`.
+    """
     if not line_items:
         raise ValueError("No items provided for checkout session")
 
+    create = partial(_create_stripe_checkout_session, site_url, order, line_items, currency)
+    if order is None and not client:
+        return create(_unique_idempotency_key())
+    return get_or_create_session(checkout_fingerprint(site_url, order, line_items, currency, client), create)
+
+
+def _create_stripe_checkout_session(
+    site_url: str, order: Optional[Order], line_items: List[Dict], currency: str, idempotency_key: str
+) -> Dict:
+    client = get_stripe_client(currency)
+
     try:
-        currency = line_items[0]["price_data"]["currency"]
+        # Купон и налоговая ставка создаются в Stripe один раз и переиспользуются
+        discounts = []
+        if _applies_discount(order, currency):
+            discounts.append({"coupon": get_stripe_coupon_id(order.discount, currency)})
 
-        stripe_key = settings.STRIPE_SECRET_KEYS.get(currency)
-        if not stripe_key:
-            raise ValueError(f"No Stripe key configured for currency: {currency}")
+        tax_rates = []
+        if order and order.tax:
+            tax_rates.append(get_stripe_tax_rate_id(order.tax, currency))
 
-        stripe.api_key = stripe_key
+        session = client.checkout.sessions.create(
+            params=_checkout_session_params(site_url, order, line_items, discounts, tax_rates),
+            options={"idempotency_key": idempotency_key},
+        )
+        return {"session_id": session.id}
+    except stripe.error.StripeError as e:
+        logger.error(f"Stripe error: {e}")
+        return {"error": str(e)}
+
+
+async def acreate_stripe_checkout_session(
+    request: HttpRequest, order: Optional[Order], line_items: List[Dict], currency: str
+) -> Dict:
+    """Асинхронная версия `create_stripe_checkout_session`: не занимает воркер на время запроса к Stripe."""
+    client = get_client_identity(request, await request.auser()) if order is None else ""
+    return await acreate_checkout_session(get_site_url(request), order, line_items, currency, client)
+
+
+async def acreate_checkout_session(
+    site_url: str, order: Optional[Order], line_items: List[Dict], currency: str, client: str = ""
+) -> Dict:
+    """Асинхронная версия `create_checkout_session`."""
+    if not line_items:
+        raise ValueError("No items provided for checkout session")
 
-        # Создаём скидку, если передан заказ
+    create = partial(_acreate_stripe_checkout_session, site_url, order, line_items, currency)
+    if order is None and not client:
+        return await create(_unique_idempotency_key())
+    return await aget_or_create_session(checkout_fingerprint(site_url, order, line_items, currency, client), create)
+
+
+async def _acreate_stripe_checkout_session(
+    site_url: str, order: Optional[Order], line_items: List[Dict], currency: str, idempotency_key: str
+) -> Dict:
+    client = get_stripe_client(currency)
+
+    try:
         discounts = []
-        if order and order.discount:
-            coupon = stripe.Coupon.create(
-                name=order.discount.name,
-                amount_off=int(order.discount.amount * 100),
-                currency=currency,
-                duration="once"
-            )
-            discounts.append({"coupon": coupon.id})
-
-        # Создаём налог, если передан заказ
+        if _applies_discount(order, currency):
+            discounts.append({"coupon": await aget_stripe_coupon_id(order.discount, currency)})
+
         tax_rates = []
         if order and order.tax:
-            tax = stripe.TaxRate.create(
-                display_name=order.tax.name,
-                percentage=float(order.tax.percentage),
-                inclusive=False
-            )
-            tax_rates.append(tax.id)
-
-        for item in line_items:
-            item["tax_rates"] = tax_rates  # Добавляем налог к каждому товару
-
-        success_url = request.build_absolute_uri(reverse("success"))
-        cancel_url = request.build_absolute_uri(reverse("cancel"))
-
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=line_items,
-            mode="payment",
-            success_url=success_url,
-            cancel_url=cancel_url,
-            discounts=discounts
+            tax_rates.append(await aget_stripe_tax_rate_id(order.tax, currency))
+
+        session = await client.checkout.sessions.create_async(
+            params=_checkout_session_params(site_url, order, line_items, discounts, tax_rates),
+            options={"idempotency_key": idempotency_key},
         )
         return {"session_id": session.id}
     except stripe.error.StripeError as e:
         logger.error(f"Stripe error: {e}")
         return {"error": str(e)}
 
+
+def get_client_identity(request: HttpRequest, user) -> str:
+    """Покупатель для отпечатка сессии товара: пользователь или анонимный покупатель из cookie (payments.buyer)."""
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"buyer:{buyer.get_buyer_id(request)}"
+
+
+def _unique_idempotency_key() -> str:
+    """Покупатель не указан (вызов без запроса): одинаковые запросы разных покупателей не должны получить одну сессию."""
+    return f"checkout-{uuid.uuid4().hex}"
+
+
+def _applies_discount(order: Optional[Order], currency: str) -> bool:
+    """Скидка заказа в нескольких валютах применяется один раз — к сессии основной валюты."""
+    return bool(order and order.discount) and currency == order.primary_currency
+
+
+def _checkout_session_params(
+    site_url: str, order: Optional[Order], line_items: List[Dict], discounts: List[Dict], tax_rates: List[str]
+) -> Dict:
+    """Параметры `checkout.sessions.create`, общие для синхронной и асинхронной версии."""
+    for item in line_items:
+        item["tax_rates"] = tax_rates  # Добавляем налог к каждому товару
+
+    params = {
+        "payment_method_types": ["card"],
+        "line_items": line_items,
+        "mode": "payment",
+        "success_url": site_url + reverse("success"),
+        "cancel_url": site_url + reverse("cancel"),
+        "discounts": discounts,
+    }
+    if order:
+        # По этим полям вебхук находит заказ (см. payments.webhooks)
+        params["client_reference_id"] = str(order.pk)
+        params["metadata"] = {"order_id": order.pk}
+    return params
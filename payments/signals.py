@@ -0,0 +1,89 @@
+import logging
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from payments import caching, catalog, db_router, stripe_registry
+from payments.models import Item, Discount, Order, Tax, StripeCoupon, StripeTaxRate
+from payments.resilience import StripeUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_stripe_coupons(sender, instance: Discount, **kwargs) -> None:
+    """После изменения скидки купоны Stripe будут созданы заново при следующей оплате."""
+    StripeCoupon.objects.filter(discount_id=instance.pk).delete()
+    stripe_registry.invalidate("coupon", instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Tax)
+def invalidate_stripe_tax_rates(sender, instance: Tax, **kwargs) -> None:
+    """После изменения налога ставки Stripe будут созданы заново при следующей оплате."""
+    StripeTaxRate.objects.filter(tax_id=instance.pk).delete()
+    stripe_registry.invalidate("tax_rate", instance.pk)
+
+
+# Поля товара, которые попадают в Product/Price Stripe
+STRIPE_ITEM_FIELDS = {"name", "description", "price", "currency"}
+
+
+@receiver(post_save, sender=Item)
+def sync_item_to_stripe(sender, instance: Item, raw: bool = False, update_fields=None, **kwargs) -> None:
+    """Обновляет Product в Stripe после сохранения товара (после коммита транзакции).
+
+    Название и описание обновляются при каждом сохранении, новая Price создается, только если изменилась цена.
+    """
+    if raw or not settings.STRIPE_CATALOG_SYNC_ON_SAVE:
+        return
+    if update_fields is not None and not STRIPE_ITEM_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(lambda: _run_catalog_task(catalog.sync_item, instance))
+
+
+@receiver(post_delete, sender=Item)
+def archive_item_in_stripe(sender, instance: Item, **kwargs) -> None:
+    """Архивирует Product/Price в Stripe после удаления товара."""
+    if not settings.STRIPE_CATALOG_SYNC_ON_SAVE or not instance.stripe_product_id:
+        return
+    transaction.on_commit(lambda: _run_catalog_task(catalog.archive_item, instance))
+
+
+def _run_catalog_task(task, item: Item) -> None:
+    """Ошибки Stripe не должны ломать сохранение в админке: товар досинхронизирует sync_stripe_catalog."""
+    try:
+        task(item)
+    except (stripe.error.StripeError, StripeUnavailable, ValueError) as e:
+        logger.error(f"Stripe catalog sync failed for item {item.pk}: {e}")
+
+
+@receiver([post_save, post_delete], sender=Item)
+def invalidate_item_cache(sender, instance: Item, **kwargs) -> None:
+    """Сбрасывает кэш страниц товаров, JSON-каталога и корзин (в них цены и названия товаров)."""
+    db_router.mark_catalog_written()
+    caching.items.invalidate()
+    caching.orders.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_discount_cache(sender, instance: Discount, **kwargs) -> None:
+    """Сбрасывает кэш скидки и заказов: их суммы зависят от скидки."""
+    caching.discounts.invalidate(instance.pk)
+    caching.orders.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Tax)
+def invalidate_tax_cache(sender, instance: Tax, **kwargs) -> None:
+    """Сбрасывает кэш налога и заказов: их суммы зависят от налога."""
+    caching.taxes.invalidate(instance.pk)
+    caching.orders.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_cache(sender, instance: Order, **kwargs) -> None:
+    """Сбрасывает кэш заказа (изменения корзины сбрасывают его в `bump_cart_version`)."""
+    caching.orders.invalidate(instance.pk)
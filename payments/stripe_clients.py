@@ -0,0 +1,133 @@
+import ssl
+import threading
+import time
+from typing import Callable, Dict
+
+import httpx
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from payments.metrics import record_stripe_call
+from payments.resilience import CircuitBreaker, get_breaker
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """HTTPXClient с пулом keep-alive соединений, circuit breaker и замером времени запросов.
+
+    Повторы выполняет сама библиотека Stripe (экспоненциальная задержка с jitter,
+    POST-запросы повторяются с ключом идемпотентности); здесь задержка между
+    попытками ограничена `max_retry_delay`, чтобы время запроса оставалось предсказуемым.
+    """
+
+    def __init__(self, limits: httpx.Limits, breaker: CircuitBreaker, max_retry_delay: float, **kwargs):
+        super().__init__(**kwargs)
+        verify = ssl.create_default_context(cafile=stripe.ca_bundle_path) if self._verify_ssl_certs else False
+        self._client_async = httpx.AsyncClient(verify=verify, limits=limits)
+        if self._client is not None:
+            self._client = httpx.Client(verify=verify, limits=limits)
+        self.breaker = breaker
+        self.max_retry_delay = max_retry_delay
+
+    def request(self, method, url, headers, post_data=None):
+        self.breaker.before_call()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = super().request(method, url, headers, post_data)
+            return response
+        finally:
+            self._record(response, time.perf_counter() - started)
+
+    async def request_async(self, method, url, headers, post_data=None):
+        self.breaker.before_call()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await super().request_async(method, url, headers, post_data)
+            return response
+        finally:
+            self._record(response, time.perf_counter() - started)
+
+    def _sleep_time_seconds(self, num_retries, response=None) -> float:
+        return min(super()._sleep_time_seconds(num_retries, response), self.max_retry_delay)
+
+    def _record(self, response, duration: float) -> None:
+        # Ошибки 4xx — проблема запроса, а не доступности Stripe; 429 и 5xx считаются сбоем
+        status_code = response[1] if response else None
+        self.breaker.record(status_code is not None and status_code < 500 and status_code != 429)
+        record_stripe_call(duration)
+
+
+def get_api_key(currency: str) -> str:
+    """Возвращает секретный ключ аккаунта Stripe для валюты."""
+    api_key = settings.STRIPE_SECRET_KEYS.get(currency)
+    if not api_key:
+        raise ValueError(f"No Stripe key configured for currency: {currency}")
+    return api_key
+
+
+def build_client(currency: str, api_key: str) -> stripe.StripeClient:
+    """Фабрика по умолчанию: свой пул соединений, таймауты, повторы и breaker на каждый аккаунт."""
+    http_client = PooledHTTPXClient(
+        limits=httpx.Limits(
+            max_connections=settings.STRIPE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.STRIPE_MAX_CONNECTIONS,
+        ),
+        breaker=get_breaker(currency),
+        max_retry_delay=settings.STRIPE_MAX_RETRY_DELAY,
+        timeout=httpx.Timeout(settings.STRIPE_TIMEOUT, connect=settings.STRIPE_CONNECT_TIMEOUT),
+        allow_sync_methods=True,
+    )
+    return stripe.StripeClient(
+        api_key,
+        http_client=http_client,
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        base_addresses={"api": settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE else {},
+    )
+
+
+class StripeClientRegistry:
+    """Клиенты Stripe по валютам (аккаунтам).
+
+    Ключ передается в каждый запрос клиентом, а не через глобальный `stripe.api_key`,
+    поэтому клиенты безопасно использовать из нескольких потоков и корутин.
+    """
+
+    def __init__(self, factory: Callable[[str, str], stripe.StripeClient]):
+        self._factory = factory
+        self._clients: Dict[str, stripe.StripeClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, currency: str) -> stripe.StripeClient:
+        client = self._clients.get(currency)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(currency)
+                if client is None:
+                    client = self._factory(currency, get_api_key(currency))
+                    self._clients[currency] = client
+        return client
+
+    def warm_up(self) -> None:
+        """Создает клиенты для всех настроенных валют."""
+        for currency, api_key in settings.STRIPE_SECRET_KEYS.items():
+            if api_key:
+                self.get(currency)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+registry = StripeClientRegistry(lambda currency, api_key: import_string(settings.STRIPE_CLIENT_FACTORY)(currency, api_key))
+
+
+def get_stripe_client(currency: str) -> stripe.StripeClient:
+    """Возвращает клиент Stripe для аккаунта валюты."""
+    return registry.get(currency)
+
+
+def warm_up() -> None:
+    """Создает клиенты для всех настроенных валют при старте процесса."""
+    registry.warm_up()
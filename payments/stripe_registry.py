@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+
+from payments import pricing
+from payments.models import Discount, Tax, StripeCoupon, StripeTaxRate
+from payments.stripe_clients import get_stripe_client
+
+
+logger = logging.getLogger(__name__)
+
+# Кэш внутри процесса: (тип, pk, валюта, значение) -> id объекта в Stripe.
+# Значение (сумма скидки / процент налога) входит в ключ, чтобы другие воркеры
+# не отдавали устаревший id после редактирования строки в админке.
+_cache: Dict[Tuple, str] = {}
+_lock = threading.Lock()
+
+
+def get_stripe_coupon_id(discount: Discount, currency: str) -> str:
+    """Возвращает id купона Stripe для скидки, создавая его только один раз."""
+    key = ("coupon", discount.pk, currency, discount.amount)
+    stripe_id = _cache.get(key)
+    if stripe_id:
+        return stripe_id
+
+    coupon = StripeCoupon.objects.filter(discount=discount, currency=currency).first()
+    if coupon is None:
+        params = _coupon_params(discount, currency)
+        created = get_stripe_client(currency).coupons.create(
+            params=params, options={"idempotency_key": _idempotency_key(f"coupon-{discount.pk}-{currency}", params)}
+        )
+        coupon = _save(StripeCoupon, {"discount": discount, "currency": currency}, created.id)
+
+    return _remember(key, coupon.stripe_id)
+
+
+async def aget_stripe_coupon_id(discount: Discount, currency: str) -> str:
+    """Асинхронная версия `get_stripe_coupon_id`."""
+    key = ("coupon", discount.pk, currency, discount.amount)
+    stripe_id = _cache.get(key)
+    if stripe_id:
+        return stripe_id
+
+    coupon = await StripeCoupon.objects.filter(discount=discount, currency=currency).afirst()
+    if coupon is None:
+        params = _coupon_params(discount, currency)
+        created = await get_stripe_client(currency).coupons.create_async(
+            params=params, options={"idempotency_key": _idempotency_key(f"coupon-{discount.pk}-{currency}", params)}
+        )
+        coupon = await sync_to_async(_save)(StripeCoupon, {"discount": discount, "currency": currency}, created.id)
+
+    return _remember(key, coupon.stripe_id)
+
+
+def get_stripe_tax_rate_id(tax: Tax, currency: str) -> str:
+    """Возвращает id налоговой ставки Stripe для налога, создавая её только один раз."""
+    key = ("tax_rate", tax.pk, currency, tax.percentage)
+    stripe_id = _cache.get(key)
+    if stripe_id:
+        return stripe_id
+
+    tax_rate = StripeTaxRate.objects.filter(tax=tax, currency=currency).first()
+    if tax_rate is None:
+        params = _tax_rate_params(tax)
+        created = get_stripe_client(currency).tax_rates.create(
+            params=params, options={"idempotency_key": _idempotency_key(f"tax-rate-{tax.pk}-{currency}", params)}
+        )
+        tax_rate = _save(StripeTaxRate, {"tax": tax, "currency": currency}, created.id)
+
+    return _remember(key, tax_rate.stripe_id)
+
+
+async def aget_stripe_tax_rate_id(tax: Tax, currency: str) -> str:
+    """Асинхронная версия `get_stripe_tax_rate_id`."""
+    key = ("tax_rate", tax.pk, currency, tax.percentage)
+    stripe_id = _cache.get(key)
+    if stripe_id:
+        return stripe_id
+
+    tax_rate = await StripeTaxRate.objects.filter(tax=tax, currency=currency).afirst()
+    if tax_rate is None:
+        params = _tax_rate_params(tax)
+        created = await get_stripe_client(currency).tax_rates.create_async(
+            params=params, options={"idempotency_key": _idempotency_key(f"tax-rate-{tax.pk}-{currency}", params)}
+        )
+        tax_rate = await sync_to_async(_save)(StripeTaxRate, {"tax": tax, "currency": currency}, created.id)
+
+    return _remember(key, tax_rate.stripe_id)
+
+
+def invalidate(kind: str, pk: int) -> None:
+    """Сбрасывает закэшированные id для строки `Discount` ("coupon") или `Tax` ("tax_rate")."""
+    with _lock:
+        for key in [key for key in _cache if key[0] == kind and key[1] == pk]:
+            del _cache[key]
+
+
+def _coupon_params(discount: Discount, currency: str) -> Dict:
+    return {
+        "name": discount.name,
+        "amount_off": pricing.to_minor(discount.amount, currency),
+        "currency": currency,
+        "duration": "once",
+    }
+
+
+def _tax_rate_params(tax: Tax) -> Dict:
+    return {
+        "display_name": tax.name,
+        "percentage": float(tax.percentage),
+        "inclusive": False,
+    }
+
+
+def _idempotency_key(prefix: str, params: Dict) -> str:
+    """Ключ идемпотентности Stripe с отпечатком параметров: после правки названия запрос с тем же
+    ключом и другими параметрами Stripe отклонил бы, поэтому ключ меняется вместе с параметрами."""
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return f"{prefix}-{hashlib.sha256(raw.encode()).hexdigest()[:16]}"
+
+
+def _remember(key: Tuple, stripe_id: str) -> str:
+    with _lock:
+        _cache[key] = stripe_id
+    return stripe_id
+
+
+def _save(model, lookup: Dict, stripe_id: str):
+    """Сохраняет соответствие; при гонке двух воркеров возвращает уже записанную строку."""
+    try:
+        with transaction.atomic():
+            return model.objects.create(stripe_id=stripe_id, **lookup)
+    except IntegrityError:
+        logger.info(f"{model.__name__} for {lookup} already registered, reusing it")
+        return model.objects.get(**lookup)
@@ -0,0 +1,1275 @@
+import asyncio
+import hashlib
+import hmac
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from fractions import Fraction
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Max
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+import stripe
+from hypothesis import given, strategies as st
+
+from payments import (
+    bulk, buyer, caching, catalog, db_router, order_checkout, page_cache, pricing, reports, retention, stripe_registry,
+    throttling, webhooks,
+)
+from payments.resilience import CircuitBreaker, StripeUnavailable
+from payments.models import (
+    ArchivedOrder, DailySales, Discount, Item, Order, OrderCheckoutSession, OrderItem, StripeCoupon, StripeEvent,
+    StripeTaxRate, Tax,
+)
+
+
+# Страницы с {% static %} без collectstatic: манифест WhiteNoise в тестах не собирается
+PLAIN_STATIC_STORAGES = {
+    **settings.STORAGES,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+def fake_stripe_client():
+    """Клиент Stripe без сети: каждый вызов create возвращает объект с новым id."""
+    client = mock.Mock()
+    counter = iter(range(1, 1_000_000))
+    for service in (client.checkout.sessions, client.coupons, client.tax_rates):
+        service.create.side_effect = lambda *args, **kwargs: mock.Mock(id=f"stripe_{next(counter)}")
+        service.create_async = mock.AsyncMock(side_effect=service.create.side_effect)
+    return client
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, ORDER_SESSION_PREWARM=False)
+class OrderQueryCountTests(TestCase):
+    """Число запросов к БД на эндпоинты заказа не зависит от числа товаров в корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [
+            Item.objects.create(name=f"item {index}", description="", price="10.00", currency="usd")
+            for index in range(5)
+        ]
+        cls.discount = Discount.objects.create(name="discount", amount="5.00")
+        cls.tax = Tax.objects.create(name="tax", percentage="20.00")
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("payments.services.get_stripe_client", return_value=fake_stripe_client())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registry_patcher = mock.patch("payments.stripe_registry.get_stripe_client", return_value=fake_stripe_client())
+        registry_patcher.start()
+        self.addCleanup(registry_patcher.stop)
+
+    def make_order(self, lines: int) -> Order:
+        order = Order.objects.create(discount=self.discount, tax=self.tax)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, item=item, quantity=2) for item in self.items[:lines]
+        )
+        return order
+
+    def post(self, url: str, data: dict):
+        return self.client.post(url, data, content_type="application/json")
+
+    def test_add_to_new_order(self):
+        # Транзакция (SAVEPOINT/RELEASE), товар, новый заказ, проверка товаров, строки, вставка, версия корзины
+        with self.assertNumQueries(11):
+            response = self.post("/order/add/", {"item_id": self.items[0].id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_add_to_existing_order(self):
+        for lines in (1, 5):
+            order = self.make_order(lines)
+            # Плюс проверка, что заказ и его части еще не оплачены
+            with self.subTest(lines=lines), self.assertNumQueries(12):
+                response = self.post("/order/add/", {"order_id": order.id, "item_id": self.items[0].id})
+            self.assertEqual(response.status_code, 200)
+
+    def test_update_items(self):
+        for lines in (1, 5):
+            order = self.make_order(lines)
+            operations = [{"op": "set", "item_id": item.id, "quantity": 3} for item in self.items[:lines]]
+            # Транзакция, заказ, проверка оплаты, проверка товаров, строки, одно UPDATE на все строки,
+            # версия корзины, ответ
+            with self.subTest(lines=lines), self.assertNumQueries(11):
+                response = self.post("/order/items/", {"order_id": order.id, "operations": operations})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["items"]), lines)
+
+    def test_remove_item(self):
+        for lines in (1, 5):
+            order = self.make_order(lines)
+            # Проверка оплаты, DELETE по (order, item) и версия корзины
+            with self.subTest(lines=lines), self.assertNumQueries(3):
+                response = self.post("/order/remove/", {"order_id": order.id, "item_id": self.items[0].id})
+            self.assertEqual(response.status_code, 200)
+
+    def test_order_checkout(self):
+        for lines in (1, 5):
+            order = self.make_order(lines)
+            # Первая оплата создает купон и налоговую ставку Stripe и запоминает их соответствия
+            self.post("/order/buy/", {"order_id": order.id})
+            cache.clear()
+            OrderItem.objects.filter(order=order).update(quantity=3)
+            # Заказ со скидкой и налогом, строки с товарами, оплаченные части и запись выданной сессии
+            # (upsert и сброс неудачной); купон и ставка Stripe уже в кэше процесса
+            with self.subTest(lines=lines), self.assertNumQueries(5):
+                response = self.post("/order/buy/", {"order_id": order.id})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()["sessions"]), 1)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, ORDER_SESSION_PREWARM=False)
+class CartQuantityTests(TestCase):
+    """Количество товара в строке ограничено `OrderItem.MAX_QUANTITY`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+
+    def post(self, url: str, data: dict):
+        return self.client.post(url, data, content_type="application/json")
+
+    def test_quantity_above_limit_is_rejected(self):
+        operations = [{"op": "set", "item_id": self.item.id, "quantity": 10**12}]
+        response = self.post("/order/items/", {"operations": operations})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_accumulated_quantity_above_limit_is_rejected(self):
+        order = Order.objects.create()
+        OrderItem.objects.create(order=order, item=self.item, quantity=OrderItem.MAX_QUANTITY)
+
+        response = self.post("/order/add/", {"order_id": order.id, "item_id": self.item.id})
+        self.assertEqual(response.status_code, 400)
+        operations = [{"op": "add", "item_id": self.item.id, "quantity": 1}]
+        response = self.post("/order/items/", {"order_id": order.id, "operations": operations})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(OrderItem.objects.get(order=order).quantity, OrderItem.MAX_QUANTITY)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, ORDER_SESSION_PREWARM=False)
+class OrderStateTests(TestCase):
+    """Состояние корзины (GET /order/<id>/) кэшируется и сбрасывается при каждом изменении заказа."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usd = Item.objects.create(name="usd item", description="", price="10.00", currency="usd")
+        cls.eur = Item.objects.create(name="eur item", description="", price="3.33", currency="eur")
+        cls.tax = Tax.objects.create(name="tax", percentage="20.00")
+
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(tax=self.tax)
+        OrderItem.objects.create(order=self.order, item=self.usd, quantity=2)
+
+    def post(self, url: str, data: dict):
+        return self.client.post(url, data, content_type="application/json")
+
+    def state(self) -> dict:
+        response = self.client.get(f"/order/{self.order.id}/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_state_lists_items_and_totals(self):
+        state = self.state()
+        self.assertEqual(state["order_id"], self.order.id)
+        self.assertEqual(state["cart_version"], 0)
+        self.assertEqual(
+            state["items"],
+            [{"item_id": self.usd.id, "name": "usd item", "price": "10.00", "currency": "usd", "quantity": 2}],
+        )
+        self.assertEqual(state["totals"]["total"], "24.00")
+        self.assertEqual([part["currency"] for part in state["currency_totals"]], ["usd"])
+
+    def test_repeated_state_is_served_from_cache(self):
+        self.state()
+        with self.assertNumQueries(0):
+            self.state()
+
+    def test_cart_changes_bump_version_and_reset_cache(self):
+        self.state()
+        self.assertEqual(self.post("/order/add/", {"order_id": self.order.id, "item_id": self.eur.id}).status_code, 200)
+        state = self.state()
+        self.assertEqual(state["cart_version"], 1)
+        self.assertEqual([part["currency"] for part in state["currency_totals"]], ["usd", "eur"])
+        # usd: 20.00 + 20% налога; eur: 3.33 + 0.67 налога
+        self.assertEqual([part["total"] for part in state["currency_totals"]], ["24.00", "4.00"])
+
+        operations = [{"op": "set", "item_id": self.usd.id, "quantity": 5}]
+        self.post("/order/items/", {"order_id": self.order.id, "operations": operations})
+        state = self.state()
+        self.assertEqual(state["cart_version"], 2)
+        self.assertEqual(state["items"][0]["quantity"], 5)
+
+        self.post("/order/remove/", {"order_id": self.order.id, "item_id": self.eur.id})
+        state = self.state()
+        self.assertEqual(state["cart_version"], 3)
+        self.assertEqual([row["item_id"] for row in state["items"]], [self.usd.id])
+
+    def test_unchanged_cart_keeps_version(self):
+        operations = [{"op": "set", "item_id": self.usd.id, "quantity": 2}]
+        self.post("/order/items/", {"order_id": self.order.id, "operations": operations})
+        self.assertEqual(self.state()["cart_version"], 0)
+
+    @override_settings(STRIPE_CATALOG_SYNC_ON_SAVE=False)
+    def test_catalog_and_tax_changes_reset_cache(self):
+        self.state()
+        self.usd.price = Decimal("12.00")
+        self.usd.save()
+        self.assertEqual(self.state()["totals"]["total"], "28.80")
+
+        self.tax.percentage = Decimal("10.00")
+        self.tax.save()
+        self.assertEqual(self.state()["totals"]["total"], "26.40")
+
+    def test_unknown_order(self):
+        self.assertEqual(self.client.get(f"/order/{self.order.id + 1}/").status_code, 404)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, ORDER_SESSION_PREWARM=False)
+class AsyncCheckoutTests(TestCase):
+    """Эндпоинты оплаты, которые вызывает страница, асинхронные и ждут Stripe через create_async."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+        cls.order = Order.objects.create()
+        OrderItem.objects.create(order=cls.order, item=cls.item, quantity=2)
+
+    def setUp(self):
+        cache.clear()
+        self.stripe = fake_stripe_client()
+        patcher = mock.patch("payments.services.get_stripe_client", return_value=self.stripe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_primary_checkout_endpoints_are_async(self):
+        for url in (f"/buy/{self.item.id}/", "/order/buy/"):
+            with self.subTest(url=url):
+                self.assertTrue(resolve(url).func.view_class.view_is_async)
+
+    async def test_buy_item(self):
+        response = await self.async_client.get(f"/buy/{self.item.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["session_id"], "stripe_1")
+        self.stripe.checkout.sessions.create_async.assert_awaited_once()
+        self.stripe.checkout.sessions.create.assert_not_called()
+
+        response = await self.async_client.get("/buy/0/")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_buy_order_without_csrf_token(self):
+        # Страница товара кэшируется и не выдает CSRF-токен, как и прежний APIView
+        client = AsyncClient(enforce_csrf_checks=True)
+        response = await client.post("/order/buy/", {"order_id": self.order.id}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([session["currency"] for session in response.json()["sessions"]], ["usd"])
+        self.stripe.checkout.sessions.create_async.assert_awaited_once()
+        self.assertTrue(await OrderCheckoutSession.objects.filter(order=self.order).aexists())
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, CHECKOUT_SESSION_TTL=60, STORAGES=PLAIN_STATIC_STORAGES)
+class CheckoutSessionReuseTests(TestCase):
+    """Повторные и одновременные запросы оплаты товара одним покупателем получают одну сессию Stripe."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+
+    def setUp(self):
+        cache.clear()
+        self.stripe = fake_stripe_client()
+        create = self.stripe.checkout.sessions.create.side_effect
+
+        async def slow_create(*args, **kwargs):
+            # Ответ Stripe приходит не сразу: одновременные запросы успевают встретиться
+            await asyncio.sleep(0.05)
+            return create(*args, **kwargs)
+
+        self.stripe.checkout.sessions.create_async.side_effect = slow_create
+        patcher = mock.patch("payments.services.get_stripe_client", return_value=self.stripe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = f"/buy/{self.item.id}/"
+
+    def test_repeated_requests_reuse_session(self):
+        first = self.client.get(self.url)
+        self.assertIn(buyer.COOKIE_NAME, first.cookies)
+        session_ids = {first.json()["session_id"]} | {self.client.get(self.url).json()["session_id"] for _ in range(3)}
+        self.assertEqual(len(session_ids), 1)
+        self.assertEqual(self.stripe.checkout.sessions.create_async.await_count, 1)
+
+    def test_item_page_issues_buyer_cookie(self):
+        self.assertIn(buyer.COOKIE_NAME, self.client.get(f"/item/{self.item.id}/").cookies)
+        # Cookie уже есть: ответ оплаты ее не переписывает
+        response = self.client.get(self.url)
+        self.assertNotIn(buyer.COOKIE_NAME, response.cookies)
+
+    def test_buyers_get_own_sessions(self):
+        mine = self.client.get(self.url).json()["session_id"]
+        theirs = self.client_class().get(self.url).json()["session_id"]
+        self.assertNotEqual(mine, theirs)
+        self.assertEqual(self.stripe.checkout.sessions.create_async.await_count, 2)
+
+    def test_forged_cookie_is_replaced(self):
+        self.client.cookies[buyer.COOKIE_NAME] = "someone-else"
+        response = self.client.get(self.url)
+        self.assertIn(buyer.COOKIE_NAME, response.cookies)
+
+    async def test_concurrent_requests_share_one_call(self):
+        await self.async_client.get(f"/item/{self.item.id}/")
+        responses = await asyncio.gather(*(self.async_client.get(self.url) for _ in range(3)))
+        self.assertEqual({response.json()["session_id"] for response in responses}, {"stripe_1"})
+        self.assertEqual(self.stripe.checkout.sessions.create_async.await_count, 1)
+
+
+class StripeRegistryTests(TestCase):
+    """Купоны и налоговые ставки Stripe создаются один раз на валюту и пересоздаются после изменения строки."""
+
+    def setUp(self):
+        stripe_registry._cache.clear()
+        self.addCleanup(stripe_registry._cache.clear)
+        self.stripe = fake_stripe_client()
+        patcher = mock.patch("payments.stripe_registry.get_stripe_client", return_value=self.stripe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.discount = Discount.objects.create(name="discount", amount="5.00")
+        self.tax = Tax.objects.create(name="tax", percentage="20.00")
+
+    def idempotency_keys(self, service) -> list:
+        return [call.kwargs["options"]["idempotency_key"] for call in service.create.call_args_list]
+
+    def test_coupon_is_reused(self):
+        coupon_id = stripe_registry.get_stripe_coupon_id(self.discount, "usd")
+        self.assertEqual(stripe_registry.get_stripe_coupon_id(self.discount, "usd"), coupon_id)
+        # Другой процесс без кэша берет соответствие из БД
+        stripe_registry._cache.clear()
+        self.assertEqual(stripe_registry.get_stripe_coupon_id(self.discount, "usd"), coupon_id)
+        self.assertEqual(self.stripe.coupons.create.call_count, 1)
+
+    def test_coupon_per_currency_has_own_idempotency_key(self):
+        usd = stripe_registry.get_stripe_coupon_id(self.discount, "usd")
+        eur = stripe_registry.get_stripe_coupon_id(self.discount, "eur")
+        self.assertNotEqual(usd, eur)
+        usd_key, eur_key = self.idempotency_keys(self.stripe.coupons)
+        self.assertTrue(usd_key.startswith(f"coupon-{self.discount.pk}-usd-"))
+        self.assertTrue(eur_key.startswith(f"coupon-{self.discount.pk}-eur-"))
+
+    def test_tax_rate_is_reused(self):
+        tax_rate_id = stripe_registry.get_stripe_tax_rate_id(self.tax, "usd")
+        stripe_registry._cache.clear()
+        self.assertEqual(stripe_registry.get_stripe_tax_rate_id(self.tax, "usd"), tax_rate_id)
+        self.assertEqual(self.stripe.tax_rates.create.call_count, 1)
+
+    def test_saving_discount_recreates_coupon(self):
+        old = stripe_registry.get_stripe_coupon_id(self.discount, "usd")
+        self.discount.amount = "7.00"
+        self.discount.save()
+        self.assertFalse(StripeCoupon.objects.filter(discount=self.discount).exists())
+
+        new = stripe_registry.get_stripe_coupon_id(self.discount, "usd")
+        self.assertNotEqual(new, old)
+        self.assertEqual(self.stripe.coupons.create.call_args.kwargs["params"]["amount_off"], 700)
+        old_key, new_key = self.idempotency_keys(self.stripe.coupons)
+        self.assertNotEqual(old_key, new_key)
+
+    def test_saving_tax_recreates_tax_rate(self):
+        old = stripe_registry.get_stripe_tax_rate_id(self.tax, "usd")
+        self.tax.percentage = "10.00"
+        self.tax.save()
+        self.assertFalse(StripeTaxRate.objects.filter(tax=self.tax).exists())
+
+        self.assertNotEqual(stripe_registry.get_stripe_tax_rate_id(self.tax, "usd"), old)
+        self.assertEqual(self.stripe.tax_rates.create.call_count, 2)
+
+
+class CacheNamespaceTests(SimpleTestCase):
+    """Версионная инвалидация пространств имен и пересчет значения одним вызовом."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.namespace = caching.CacheNamespace("test")
+
+    def test_invalidate_object_keeps_other_keys(self):
+        self.namespace.set("a", value=1, pk=1)
+        self.namespace.set("a", value=2, pk=2)
+        self.namespace.invalidate(1)
+        self.assertIsNone(self.namespace.get("a", pk=1))
+        self.assertEqual(self.namespace.get("a", pk=2), 2)
+
+    def test_invalidate_namespace_drops_all_keys(self):
+        self.namespace.set("list", value=[1])
+        self.namespace.set("a", value=2, pk=2)
+        other = caching.CacheNamespace("other")
+        other.set("list", value=[3])
+
+        self.namespace.invalidate()
+        self.assertIsNone(self.namespace.get("list"))
+        self.assertIsNone(self.namespace.get("a", pk=2))
+        self.assertEqual(other.get("list"), [3])
+
+    def test_evicted_version_does_not_resurrect_old_values(self):
+        self.namespace.set("a", value="old")
+        self.namespace.invalidate()
+        # Ключ версии вытеснен: новая версия от времени, а не с нуля
+        cache.delete(self.namespace._version_key())
+        self.assertIsNone(self.namespace.get("a"))
+
+    def test_get_or_set_computes_once(self):
+        compute = mock.Mock(return_value="value")
+        self.assertEqual(self.namespace.get_or_set(("a",), compute, beta=0), "value")
+        self.assertEqual(self.namespace.get_or_set(("a",), compute, beta=0), "value")
+        self.assertEqual(compute.call_count, 1)
+
+    @override_settings(CACHE_LOCK_TIMEOUT=5)
+    def test_concurrent_miss_is_computed_once(self):
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(self.namespace.get_or_set(("a",), compute)))
+        first.start()
+        started.wait(1)
+        # Второй вызов ждет значение, которое пересчитывает первый
+        with mock.patch("payments.caching.LOCK_POLL_INTERVAL", 0.01):
+            results.append(self.namespace.get_or_set(("a",), compute))
+        first.join()
+        self.assertEqual(results, ["value", "value"])
+        self.assertEqual(len(calls), 1)
+
+    def test_early_expiration_recomputes_before_ttl(self):
+        self.namespace.get_or_set(("a",), lambda: "old", timeout=60)
+        key = self.namespace.key("a")
+        entry = cache.get(key)
+        # Пересчет шел 10 секунд, до срока жизни осталась 1 секунда: XFetch почти наверняка пересчитает
+        cache.set(key, dict(entry, delta=10.0, expires=time.time() + 1), 60)
+        with mock.patch("payments.caching.random.random", return_value=0.5):
+            self.assertEqual(self.namespace.get_or_set(("a",), lambda: "new"), "new")
+
+        # Далеко до срока жизни — значение отдается из кэша
+        self.assertEqual(self.namespace.get_or_set(("a",), lambda: "newer"), "new")
+
+    def test_stale_value_is_served_while_another_call_recomputes(self):
+        self.namespace.get_or_set(("a",), lambda: "old", timeout=60)
+        key = self.namespace.key("a")
+        cache.set(key, dict(cache.get(key), expires=time.time() - 1), 60)
+        # Блокировку держит другой воркер
+        cache.add(f"{key}:lock", 1, 5)
+        compute = mock.Mock(return_value="new")
+        self.assertEqual(self.namespace.get_or_set(("a",), compute), "old")
+        compute.assert_not_called()
+
+
+@override_settings(DB_REPLICA_LAG=10)
+class ReplicaRouterTests(SimpleTestCase):
+    """Реплика читается только в read-only views каталога, вне транзакций и не сразу после записи."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict(settings.DATABASES, {"replica": settings.DATABASES["default"]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = db_router.ReplicaRouter()
+
+    def test_catalog_reads_use_replica_only_in_catalog_views(self):
+        self.assertIsNone(self.router.db_for_read(Item))
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_read(Item), "replica")
+            self.assertEqual(self.router.db_for_read(Discount), "replica")
+            self.assertIsNone(self.router.db_for_read(Order))
+        self.assertEqual(self.router.db_for_write(Item), "default")
+
+    def test_reads_inside_transaction_use_primary(self):
+        with db_router.replica_reads(), mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertIsNone(self.router.db_for_read(Item))
+
+    def test_render_after_write_uses_primary(self):
+        def render():
+            return {"replica": self.router.db_for_read(Item)}
+
+        self.assertEqual(page_cache._render(render), {"replica": "replica"})
+        db_router.mark_catalog_written()
+        self.assertEqual(page_cache._render(render), {"replica": None})
+
+        # Запас на отставание реплики прошел
+        cache.delete(db_router.CATALOG_WRITTEN_KEY)
+        self.assertEqual(page_cache._render(render), {"replica": "replica"})
+
+    def test_without_replica_everything_uses_primary(self):
+        del settings.DATABASES["replica"]
+        with db_router.replica_reads():
+            self.assertIsNone(self.router.db_for_read(Item))
+
+
+@override_settings(STRIPE_CATALOG_SYNC_ON_SAVE=False, STORAGES=PLAIN_STATIC_STORAGES)
+class PageCacheTests(TestCase):
+    """Страница товара и JSON-каталог отдаются из кэша с ETag и сбрасываются при сохранении товара."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_item_page_is_cached_with_etag(self):
+        url = f"/item/{self.item.id}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual((cached.content, cached["ETag"]), (response.content, etag))
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+    def test_item_page_is_invalidated_on_save(self):
+        url = f"/item/{self.item.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.item.name = "renamed"
+        self.item.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "renamed")
+
+    def test_catalog_is_cached_and_invalidated(self):
+        response = self.client.get("/api/items/")
+        self.assertEqual([row["name"] for row in response.json()["results"]], ["item"])
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/items/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Item.objects.create(name="second", description="", price="5.00", currency="eur")
+        response = self.client.get("/api/items/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["name"] for row in response.json()["results"]], ["item", "second"])
+
+
+@override_settings(STRIPE_CATALOG_SYNC_ON_SAVE=False)
+class CatalogSyncTests(TestCase):
+    """Синхронизация товара с каталогом Stripe: Product и Price создаются один раз, старая цена архивируется."""
+
+    def setUp(self):
+        self.stripe = mock.Mock()
+        prices = iter(range(1, 1000))
+        self.stripe.products.create.return_value = mock.Mock(id="prod_1")
+        self.stripe.prices.create.side_effect = lambda **kwargs: mock.Mock(id=f"price_{next(prices)}")
+        patcher = mock.patch("payments.catalog.get_stripe_client", return_value=self.stripe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+
+    def test_sync_is_idempotent(self):
+        catalog.sync_item(self.item)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stripe_product_id, self.item.stripe_price_id), ("prod_1", "price_1"))
+        self.assertTrue(self.item.has_synced_price)
+
+        catalog.sync_item(self.item)
+        self.assertEqual(self.stripe.products.create.call_count, 1)
+        self.assertEqual(self.stripe.prices.create.call_count, 1)
+        self.stripe.prices.update.assert_not_called()
+
+    def test_price_change_archives_old_price(self):
+        catalog.sync_item(self.item)
+        self.item.refresh_from_db()
+        self.item.price = "12.50"
+        self.item.save()
+
+        catalog.sync_item(self.item)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stripe_price_id, "price_2")
+        self.assertEqual(self.item.stripe_unit_amount, 1250)
+        self.stripe.products.update.assert_any_call("prod_1", params={"default_price": "price_2"})
+        self.stripe.prices.update.assert_called_once_with("price_1", params={"active": False})
+
+    def test_save_syncs_after_commit(self):
+        with self.settings(STRIPE_CATALOG_SYNC_ON_SAVE=True), self.captureOnCommitCallbacks(execute=True):
+            self.item.name = "renamed"
+            self.item.save()
+        self.stripe.products.create.assert_called_once()
+        self.assertEqual(self.stripe.products.create.call_args.kwargs["params"]["name"], "renamed")
+
+        # Сохранение полей, которых нет в Stripe, синхронизацию не запускает
+        with self.settings(STRIPE_CATALOG_SYNC_ON_SAVE=True), self.captureOnCommitCallbacks() as callbacks:
+            self.item.save(update_fields=["sku"])
+        self.assertEqual(callbacks, [])
+
+    def test_find_stale_prices(self):
+        catalog.sync_item(self.item)
+        listed = [
+            mock.Mock(id="price_1", metadata={"item_id": self.item.pk}),
+            mock.Mock(id="price_old", metadata={"item_id": self.item.pk}),
+            mock.Mock(id="price_foreign", metadata={}),
+        ]
+        self.stripe.prices.list.return_value.auto_paging_iter.return_value = iter(listed)
+
+        self.assertEqual(catalog.find_stale_prices("usd"), ["price_old"])
+        self.assertEqual(catalog.archive_prices(["price_old"], "usd"), 1)
+        self.stripe.prices.update.assert_called_once_with("price_old", params={"active": False})
+
+
+@override_settings(STRIPE_EVENT_MAX_ATTEMPTS=3, STRIPE_EVENT_RETRY_DELAY=10, STRIPE_EVENT_RETRY_MAX_DELAY=15)
+class StripeEventQueueTests(TestCase):
+    """Неудачные события вебхуков откладываются, а не разбираются повторно в том же цикле."""
+
+    def setUp(self):
+        self.event = StripeEvent.objects.create(
+            event_id="evt_1", type="checkout.session.completed", currency="usd", payload={}
+        )
+        handler = mock.Mock(side_effect=ValueError("boom"))
+        patcher = mock.patch.dict(webhooks.EVENT_HANDLERS, {"checkout.session.completed": handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_event_is_deferred_with_backoff(self):
+        with self.assertLogs("payments.webhooks", "ERROR"):
+            self.assertEqual(webhooks.process_batch(10), 0)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attempts, 1)
+        self.assertEqual(self.event.status, StripeEvent.STATUS_PENDING)
+        self.assertGreater(self.event.next_attempt_at, timezone.now())
+
+        # До next_attempt_at событие не берется
+        webhooks.process_batch(10)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attempts, 1)
+
+    def test_retry_delay_doubles_up_to_max(self):
+        self.assertEqual([webhooks.retry_delay(n).total_seconds() for n in (1, 2, 3)], [10, 15, 15])
+
+    def test_event_fails_after_max_attempts(self):
+        for _ in range(3):
+            StripeEvent.objects.filter(pk=self.event.pk).update(next_attempt_at=None)
+            with self.assertLogs("payments.webhooks", "ERROR"):
+                webhooks.process_batch(10)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.status, StripeEvent.STATUS_FAILED)
+        self.assertEqual(self.event.attempts, 3)
+
+
+def stripe_signature(payload: bytes, secret: str) -> str:
+    """Заголовок Stripe-Signature, как его подписывает Stripe."""
+    timestamp = int(time.time())
+    signed = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signed}"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRETS={"usd": "whsec_usd", "eur": "whsec_eur"})
+class WebhookIngestionTests(TestCase):
+    """Вебхук проверяет подпись секретами всех аккаунтов и сохраняет каждое событие один раз."""
+
+    def setUp(self):
+        self.payload = json.dumps(
+            {"id": "evt_1", "object": "event", "type": "checkout.session.completed", "data": {"object": {}}}
+        ).encode()
+
+    def post(self, signature: str):
+        return self.client.post(
+            "/webhook/", self.payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=signature
+        )
+
+    def test_verify_event_finds_account_by_secret(self):
+        for currency in ("usd", "eur"):
+            with self.subTest(currency=currency):
+                signature = stripe_signature(self.payload, f"whsec_{currency}")
+                event, account = webhooks.verify_event(self.payload, signature)
+                self.assertEqual((event.id, account), ("evt_1", currency))
+
+    def test_verify_event_rejects_unknown_secret(self):
+        with self.assertRaises(stripe.error.SignatureVerificationError):
+            webhooks.verify_event(self.payload, stripe_signature(self.payload, "whsec_other"))
+
+    @override_settings(STRIPE_WEBHOOK_SECRETS={"usd": "", "eur": "whsec_eur"})
+    def test_empty_secret_is_skipped(self):
+        # Пустой секрет не должен принимать событие с любой подписью
+        with self.assertRaises(stripe.error.SignatureVerificationError):
+            webhooks.verify_event(self.payload, stripe_signature(self.payload, ""))
+
+    def test_duplicate_delivery_is_stored_once(self):
+        signature = stripe_signature(self.payload, "whsec_eur")
+        self.assertEqual([self.post(signature).status_code for _ in range(2)], [200, 200])
+        event = StripeEvent.objects.get()
+        self.assertEqual((event.event_id, event.currency, event.status), ("evt_1", "eur", StripeEvent.STATUS_PENDING))
+
+    def test_bad_signature_is_rejected(self):
+        with self.assertLogs("payments.views", "WARNING"):
+            response = self.post(stripe_signature(self.payload, "whsec_other"))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+@override_settings(STRIPE_CATALOG_SYNC_ON_SAVE=False)
+class CatalogImportExportTests(TestCase):
+    """Экспорт и импорт каталога: данные переживают круг без изменений, ошибочные строки пропускаются."""
+
+    def import_text(self, kind: str, text: str, fmt: str = "csv", batch_size: int = 100) -> bulk.ImportStats:
+        return bulk.import_rows(bulk.SPECS[kind], io.StringIO(text), fmt, batch_size)
+
+    def test_round_trip(self):
+        Item.objects.create(sku="A", name="Первый, с запятой", description="две\nстроки", price="10.50", currency="usd")
+        Item.objects.create(sku="B", name="second", description="", price="3.00", currency="eur")
+        Tax.objects.create(name="tax", percentage="7.25")
+        fields = ("sku", "name", "description", "price", "currency")
+        expected_items = list(Item.objects.order_by("sku").values_list(*fields))
+        expected_taxes = list(Tax.objects.values_list("id", "name", "percentage"))
+
+        for fmt in bulk.FORMATS:
+            with self.subTest(fmt=fmt):
+                items, taxes = io.StringIO(), io.StringIO()
+                self.assertEqual(bulk.export_rows(bulk.SPECS["items"], items, fmt, chunk_size=1), 2)
+                self.assertEqual(bulk.export_rows(bulk.SPECS["taxes"], taxes, fmt, chunk_size=1), 1)
+                Item.objects.update(name="changed", price="1.00")
+                Tax.objects.all().delete()
+
+                self.assertEqual(self.import_text("items", items.getvalue(), fmt).written, 2)
+                self.assertEqual(self.import_text("taxes", taxes.getvalue(), fmt).written, 1)
+                self.assertEqual(list(Item.objects.order_by("sku").values_list(*fields)), expected_items)
+                self.assertEqual(list(Tax.objects.values_list("id", "name", "percentage")), expected_taxes)
+
+    def test_invalid_rows_are_rejected_with_line_numbers(self):
+        stats = self.import_text(
+            "items",
+            "sku,name,description,price,currency\n"
+            "A,good,,10.00,usd\n"
+            "B,bad currency,,10.00,gbp\n"
+            "C,bad price,,ten,usd\n"
+            "D,,,10.00,usd\n",
+        )
+        self.assertEqual((stats.read, stats.written, stats.errors), (4, 1, 3))
+        self.assertEqual([message.split(":")[0] for message in stats.messages], ["line 3", "line 4", "line 5"])
+        self.assertIn("gbp", stats.messages[0])
+        self.assertEqual(list(Item.objects.values_list("sku", flat=True)), ["A"])
+
+    def test_invalid_jsonl_rows_are_rejected(self):
+        stats = self.import_text(
+            "discounts",
+            '{"name": "ok", "amount": "5.00"}\nnot json\n{"name": "bad", "amount": "-"}\n',
+            fmt="jsonl",
+        )
+        self.assertEqual((stats.written, stats.errors), (1, 2))
+        self.assertEqual(list(Discount.objects.values_list("name", flat=True)), ["ok"])
+
+    def test_duplicate_keys_in_batch_are_counted_once(self):
+        stats = self.import_text(
+            "items", "sku,name,description,price,currency\nA,first,,1.00,usd\nA,second,,2.00,usd\n,no sku,,3.00,usd\n"
+        )
+        self.assertEqual((stats.read, stats.written), (3, 2))
+        self.assertEqual(Item.objects.get(sku="A").name, "second")
+        self.assertEqual(Item.objects.count(), 2)
+
+
+@override_settings(ORDER_SESSION_PREWARM=False, STRIPE_CATALOG_SYNC_ON_SAVE=False)
+class SalesReportTests(TestCase):
+    """Отчеты строятся по суммам, запомненным при выдаче сессии, а не по текущим ценам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usd = Item.objects.create(name="usd item", description="", price="10.00", currency="usd")
+        cls.eur = Item.objects.create(name="eur item", description="", price="3.33", currency="eur")
+        cls.discount = Discount.objects.create(name="discount", amount="5.00")
+        cls.tax = Tax.objects.create(name="tax", percentage="20.00")
+
+    def setUp(self):
+        cache.clear()
+        for target in ("payments.services.get_stripe_client", "payments.stripe_registry.get_stripe_client"):
+            patcher = mock.patch(target, return_value=fake_stripe_client())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_order(self, *lines) -> Order:
+        order = Order.objects.create(discount=self.discount, tax=self.tax)
+        for item, quantity in lines:
+            OrderItem.objects.create(order=order, item=item, quantity=quantity)
+        return order
+
+    def checkout(self, order: Order) -> list:
+        # Асинхронный путь, как у /order/buy/: потоки синхронного пути не видят транзакцию теста в SQLite
+        order = Order.objects.for_checkout().get(pk=order.pk)
+        return async_to_sync(order_checkout.acreate_order_checkout_sessions)("http://testserver", order)
+
+    def pay(self, order: Order) -> None:
+        for session in self.checkout(order):
+            webhooks.handle_session_paid({
+                "data": {
+                    "object": {
+                        "id": session["session_id"],
+                        "currency": session["currency"],
+                        "payment_status": "paid",
+                        "metadata": {"order_id": str(order.pk)},
+                    }
+                }
+            })
+
+    def totals(self, rows) -> dict:
+        return {row["currency"]: (row["orders"], row["items"], row["total"]) for row in rows}
+
+    def test_live_report_sums_paid_parts(self):
+        self.pay(self.make_order((self.usd, 2), (self.eur, 1)))
+        self.pay(self.make_order((self.usd, 1)))
+        self.checkout(self.make_order((self.usd, 3)))
+        self.make_order((self.usd, 4))
+
+        rows = reports.live_report()
+        # usd: (20.00 - 5.00) × 1.2 и (10.00 - 5.00) × 1.2; eur: 3.33 + 0.67 налога, скидка только в основной валюте
+        self.assertEqual(self.totals(rows), {"usd": (2, 3, Decimal("24.00")), "eur": (1, 1, Decimal("4.00"))})
+        self.assertEqual(rows[0]["period"], timezone.localdate())
+        # Выданная, но не оплаченная сессия — в отчете по ожидающим заказам, корзина без сессии — нигде
+        pending = reports.live_report(statuses=[Order.STATUS_PENDING])
+        self.assertEqual(self.totals(pending), {"usd": (1, 3, Decimal("30.00"))})
+
+    def test_price_changes_after_payment_do_not_rewrite_reports(self):
+        self.pay(self.make_order((self.usd, 2)))
+        reports.refresh_rollup()
+        before = reports.live_report()
+
+        self.usd.price = Decimal("99.00")
+        self.usd.save()
+        self.discount.amount = Decimal("1.00")
+        self.discount.save()
+        self.tax.percentage = Decimal("50.00")
+        self.tax.save()
+        reports.refresh_rollup(full=True)
+
+        self.assertEqual(reports.live_report(), before)
+        self.assertEqual(reports.rollup_report(), before)
+        self.assertEqual(before[0]["subtotal"], Decimal("20.00"))
+
+    def test_repeated_checkout_snapshots_the_current_cart(self):
+        order = self.make_order((self.usd, 1))
+        self.checkout(order)
+        OrderItem.objects.filter(order=order).update(quantity=3)
+        self.pay(order)
+        self.assertEqual(self.totals(reports.live_report()), {"usd": (1, 3, Decimal("30.00"))})
+
+    def test_rollup_matches_live_report(self):
+        self.pay(self.make_order((self.usd, 2), (self.eur, 3)))
+        self.pay(self.make_order((self.eur, 1)))
+        self.assertEqual(reports.refresh_rollup(), {"days": 1, "rows": 2})
+        self.assertEqual(reports.rollup_report(), reports.live_report())
+        self.assertEqual(reports.rollup_report("week"), reports.live_report("week"))
+        self.assertEqual(reports.rollup_report(currency="eur"), reports.live_report(currency="eur"))
+
+    def test_report_totals_equal_engine_totals(self):
+        # Налог 7.25% на строки по 0.10: по строке округляется до цента (3 цента), на весь заказ было бы 2
+        tax = Tax.objects.create(name="tax", percentage="7.25")
+        discount = Discount.objects.create(name="discount", amount="0.05")
+        cheap = [Item.objects.create(name=f"cheap {i}", description="", price="0.10", currency="usd") for i in range(3)]
+        orders = [
+            self.make_order(*[(item, 1) for item in cheap], (self.eur, 7)),
+            self.make_order((cheap[0], 5), (self.usd, 3)),
+        ]
+        for order in orders:
+            Order.objects.filter(pk=order.pk).update(tax=tax, discount=discount)
+            self.pay(order)
+
+        expected = {}
+        for order in Order.objects.for_checkout().filter(pk__in=[order.pk for order in orders]):
+            for currency, part in order.get_currency_totals().items():
+                sums = expected.setdefault(currency, [0, 0, 0, 0])
+                for index, amount in enumerate((part.subtotal, part.discount, part.tax, part.total)):
+                    sums[index] += amount
+        report = {
+            row["currency"]: [pricing.to_minor(row[name], row["currency"]) for name in reports.AMOUNT_FIELDS]
+            for row in reports.live_report()
+        }
+        self.assertEqual(report, expected)
+        # Второй заказ: налог строк 0.50 и 29.95 (скидка распределена по строкам) — 4 и 217 центов
+        self.assertEqual(report["usd"][2], 3 + 4 + 217)
+        reports.refresh_rollup()
+        self.assertEqual(reports.rollup_report(), reports.live_report())
+
+    def test_incremental_refresh_overlap_window(self):
+        self.pay(self.make_order((self.usd, 1)))
+        reports.refresh_rollup()
+
+        def last_refresh():
+            return DailySales.objects.aggregate(last=Max("refreshed_at"))["last"]
+
+        # Заказ из транзакции, закоммиченной после начала прошлого обновления, но начатой раньше
+        late = self.make_order((self.usd, 2))
+        self.pay(late)
+        window_start = last_refresh() - reports.ROLLUP_OVERLAP
+        Order.objects.filter(pk=late.pk).update(updated_at=window_start + timedelta(minutes=1))
+        self.assertEqual(reports.refresh_rollup(), {"days": 1, "rows": 1})
+        self.assertEqual(self.totals(reports.rollup_report()), {"usd": (2, 3, Decimal("24.00"))})
+
+        # Заказы, измененные раньше окна, повторно не пересчитываются
+        Order.objects.update(updated_at=last_refresh() - reports.ROLLUP_OVERLAP - timedelta(minutes=1))
+        self.assertEqual(reports.refresh_rollup(), {"days": 0, "rows": 0})
+        self.assertEqual(reports.rollup_report(), reports.live_report())
+
+
+class PurgeOrdersTests(TestCase):
+    """Очистка брошенных заказов считает именно заказы и реально заархивированные строки."""
+
+    def setUp(self):
+        item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+        self.orders = [Order.objects.create() for _ in range(3)]
+        for order in self.orders:
+            OrderItem.objects.create(order=order, item=item, quantity=2)
+        self.cutoff = timezone.now() + timedelta(seconds=1)
+
+    def test_counts_orders_without_cascaded_rows(self):
+        result = retention.purge_batch(self.cutoff, [Order.STATUS_PENDING], batch_size=10)
+        self.assertEqual(result, {"orders": 3, "order_items": 3, "archived": 0})
+        self.assertFalse(Order.objects.exists())
+
+    def test_partly_paid_orders_are_kept(self):
+        OrderCheckoutSession.objects.create(
+            order=self.orders[0], currency="usd", session_id="cs_1", status=Order.STATUS_PAID
+        )
+        result = retention.purge_batch(self.cutoff, [Order.STATUS_PENDING], batch_size=10)
+        self.assertEqual(result["orders"], 2)
+        self.assertEqual(list(Order.objects.all()), [self.orders[0]])
+
+    def test_already_archived_orders_are_not_counted(self):
+        now = timezone.now()
+        ArchivedOrder.objects.create(
+            order_id=self.orders[0].pk, status=Order.STATUS_PENDING, totals={}, lines=[], created_at=now, updated_at=now
+        )
+        result = retention.purge_batch(self.cutoff, [Order.STATUS_PENDING], batch_size=10, archive=True)
+        self.assertEqual(result["archived"], 2)
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+
+    def test_archive_keeps_every_currency_part(self):
+        order = self.orders[0]
+        order.discount = Discount.objects.create(name="discount", amount="5.00")
+        order.tax = Tax.objects.create(name="tax", percentage="20.00")
+        order.save()
+        eur_item = Item.objects.create(name="eur item", description="", price="3.33", currency="eur")
+        OrderItem.objects.create(order=order, item=eur_item, quantity=1)
+        parts = Order.objects.get(pk=order.pk).get_currency_totals()
+        expected = {currency: part.total for currency, part in parts.items()}
+
+        retention.purge_batch(self.cutoff, [Order.STATUS_PENDING], batch_size=10, archive=True)
+        archived = ArchivedOrder.objects.get(order_id=order.pk)
+        # usd: 20.00 - 5.00 + 20% налога; eur: 3.33 + 0.67 налога, скидка только в основной валюте
+        self.assertEqual(archived.totals, {"usd": 1800, "eur": 400})
+        self.assertEqual(archived.totals, expected)
+
+
+class AdminSearchTests(TestCase):
+    """Поиск в админке больших таблиц строит условия, которые могут использовать индексы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.item = Item.objects.create(sku="SKU-1", name="iPad Pro", description="", price="10.00", currency="usd")
+        Item.objects.create(sku="SKU-2", name="MacBook", description="", price="20.00", currency="usd")
+        cls.order = Order.objects.create()
+
+    def search(self, model, term: str):
+        model_admin = site._registry[model]
+        request = RequestFactory().get("/", {"q": term})
+        request.user = self.admin_user
+        return model_admin.get_search_results(request, model.objects.all(), term)[0]
+
+    def test_item_search_by_exact_sku_and_name_prefix(self):
+        self.assertEqual(list(self.search(Item, "SKU-1")), [self.item])
+        self.assertEqual(list(self.search(Item, "ipad")), [self.item])
+        self.assertFalse(self.search(Item, "Pro").exists())
+        self.assertIn('UPPER("payments_item"."name")', str(self.search(Item, "ipad").query))
+
+    def test_order_search_by_id_is_an_integer_lookup(self):
+        self.assertEqual(list(self.search(Order, str(self.order.pk))), [self.order])
+        self.assertIn(f'"payments_order"."id" = {self.order.pk}', str(self.search(Order, str(self.order.pk)).query))
+        self.assertFalse(self.search(Order, "abc").exists())
+
+
+# Суммы в минимальных единицах: до 10 млн долларов за строку
+amounts = st.integers(min_value=0, max_value=10**9)
+lines_strategy = st.lists(
+    st.tuples(st.integers(min_value=0, max_value=10**7), st.integers(min_value=1, max_value=OrderItem.MAX_QUANTITY)),
+    min_size=1,
+    max_size=20,
+)
+
+
+class PricingPropertyTests(SimpleTestCase):
+    """Свойства расчета сумм (payments.pricing) на случайных заказах."""
+
+    @given(total=amounts, weights=st.lists(amounts, min_size=1, max_size=20))
+    def test_allocate_parts_sum_exactly_to_total(self, total, weights):
+        shares = pricing.allocate(total, weights)
+        self.assertEqual(len(shares), len(weights))
+        if sum(weights):
+            self.assertEqual(sum(shares), total)
+            # Каждая часть отличается от точной пропорции меньше чем на единицу
+            for share, weight in zip(shares, weights):
+                self.assertLess(abs(share * sum(weights) - total * weight), sum(weights))
+        else:
+            self.assertEqual(shares, [0] * len(weights))
+
+    @given(weights=st.lists(amounts, min_size=1, max_size=20), data=st.data())
+    def test_allocated_discount_never_exceeds_line(self, weights, data):
+        total = data.draw(st.integers(min_value=0, max_value=sum(weights)))
+        for share, weight in zip(pricing.allocate(total, weights), weights):
+            self.assertGreaterEqual(share, 0)
+            self.assertLessEqual(share, weight)
+
+    @given(
+        lines=lines_strategy,
+        discount=st.integers(min_value=-10**6, max_value=10**12),
+        tax_basis_points=st.integers(min_value=0, max_value=10_000),
+    )
+    def test_totals_are_consistent(self, lines, discount, tax_basis_points):
+        totals = pricing.compute_totals(lines, "usd", discount, tax_basis_points)
+
+        self.assertEqual(totals.subtotal, sum(unit_amount * quantity for unit_amount, quantity in lines))
+        self.assertGreaterEqual(totals.discount, 0)
+        self.assertLessEqual(totals.discount, totals.subtotal)
+        self.assertEqual(totals.total, totals.subtotal - totals.discount + totals.tax)
+        self.assertGreaterEqual(totals.total, 0)
+
+        # Налог округляется по строкам: от точного налога на сумму после скидки он отличается
+        # не больше чем на половину единицы на строку
+        exact = Fraction((totals.subtotal - totals.discount) * tax_basis_points, 10_000)
+        self.assertGreaterEqual(totals.tax, 0)
+        self.assertLessEqual(abs(totals.tax - exact), Fraction(len(lines), 2))
+
+    @given(amount=amounts, currency=st.sampled_from(sorted(pricing.MINOR_UNIT_EXPONENTS)))
+    def test_minor_units_round_trip(self, amount, currency):
+        self.assertEqual(pricing.to_minor(pricing.to_major(amount, currency), currency), amount)
+
+    @given(amount=st.decimals(min_value=0, max_value=10**7, places=2), currency=st.sampled_from(["usd", "eur"]))
+    def test_major_units_round_trip(self, amount, currency):
+        self.assertEqual(pricing.to_major(pricing.to_minor(amount, currency), currency), amount)
+
+    @given(amount=st.decimals(min_value=0, max_value=10**7, places=4))
+    def test_to_minor_rounds_half_up(self, amount):
+        minor = pricing.to_minor(amount, "usd")
+        self.assertLessEqual(abs(Decimal(minor) - amount * 100), Decimal("0.5"))
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Ведро токенов: всплеск до емкости, затем отказ с временем ожидания и пополнение со временем."""
+
+    def setUp(self):
+        self.store = throttling.MemoryBucketStore()
+        self.now = 1000.0
+        patcher = mock.patch("payments.throttling.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate("30/min"), (30, 0.5))
+        self.assertEqual(throttling.parse_rate("5/s"), (5, 5.0))
+
+    def test_burst_up_to_capacity(self):
+        capacity, rate = throttling.parse_rate("3/min")
+        self.assertEqual([self.store.take("key", capacity, rate) for _ in range(3)], [0, 0, 0])
+        # Пустое ведро: следующий токен через 60 / 3 секунд
+        self.assertAlmostEqual(self.store.take("key", capacity, rate), 20.0)
+        # Ключи не делят ведро
+        self.assertEqual(self.store.take("other", capacity, rate), 0)
+
+    def test_refill(self):
+        capacity, rate = throttling.parse_rate("3/min")
+        for _ in range(3):
+            self.store.take("key", capacity, rate)
+        self.now += 20
+        self.assertEqual(self.store.take("key", capacity, rate), 0)
+        self.assertGreater(self.store.take("key", capacity, rate), 0)
+        # За долгую паузу ведро наполняется не больше чем до емкости
+        self.now += 3600
+        self.assertEqual([self.store.take("key", capacity, rate) for _ in range(3)], [0, 0, 0])
+        self.assertGreater(self.store.take("key", capacity, rate), 0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Circuit breaker: closed -> open по доле ошибок, open -> half-open по таймеру, пробный запрос решает дальше."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("payments.resilience.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("usd", error_rate=0.5, min_calls=4, window=60, open_seconds=30)
+
+    def call(self, success: bool) -> None:
+        self.breaker.before_call()
+        self.breaker.record(success)
+
+    def trip(self) -> None:
+        for success in (True, True, False, False):
+            self.call(success)
+
+    def test_stays_closed_below_min_calls_and_error_rate(self):
+        for success in (False, False, False):
+            self.call(success)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        # Четвертый запрос успешный: 3 ошибки из 4 — уже больше порога
+        self.call(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_old_failures_leave_window(self):
+        for success in (False, False, True):
+            self.call(success)
+        self.now += 61
+        self.call(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_open_rejects_with_retry_after(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 10
+        with self.assertRaises(StripeUnavailable) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 20)
+
+    def test_half_open_trial_success_closes(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # Пока пробный запрос не завершен, остальные отклоняются
+        with self.assertRaises(StripeUnavailable):
+            self.breaker.before_call()
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.call(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial_failure_reopens(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(StripeUnavailable) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 30)
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True,
+    ORDER_SESSION_PREWARM=False,
+    RATE_LIMITS={"checkout_ip": "2/min", "checkout_session": "", "checkout_currency": "", "order_ip": "2/min"},
+)
+class RateLimitViewTests(TestCase):
+    """Превышение лимита — ответ 429 с Retry-After."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = Item.objects.create(name="item", description="", price="10.00", currency="usd")
+
+    def setUp(self):
+        throttling.memory_store._buckets.clear()
+        self.addCleanup(throttling.memory_store._buckets.clear)
+        cache.clear()
+        patcher = mock.patch("payments.services.get_stripe_client", return_value=fake_stripe_client())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_checkout_is_throttled_with_retry_after(self):
+        codes = [self.client.get(f"/buy/{self.item.id}/").status_code for _ in range(2)]
+        self.assertEqual(codes, [200, 200])
+
+        response = self.client.get(f"/buy/{self.item.id}/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+        # Лимит на IP: другой клиент не затронут
+        self.assertEqual(self.client.get(f"/buy/{self.item.id}/", REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+    def test_cart_is_throttled(self):
+        codes = [
+            self.client.post("/order/add/", {"item_id": self.item.id}, content_type="application/json").status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, ORDER_SESSION_PREWARM=False)
+class MultiCurrencyOrderTests(TestCase):
+    """Заказ в нескольких валютах: сессия на каждую валюту, заказ оплачен после оплаты всех частей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usd = Item.objects.create(name="usd item", description="", price="10.00", currency="usd")
+        cls.eur = Item.objects.create(name="eur item", description="", price="20.00", currency="eur")
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("payments.services.get_stripe_client", return_value=fake_stripe_client())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.order = Order.objects.create()
+        OrderItem.objects.create(order=self.order, item=self.usd, quantity=1)
+        OrderItem.objects.create(order=self.order, item=self.eur, quantity=1)
+
+    def post(self, url: str, data: dict):
+        return self.client.post(url, data, content_type="application/json")
+
+    def pay(self, session: dict) -> None:
+        event = {
+            "data": {
+                "object": {
+                    "id": session["session_id"],
+                    "currency": session["currency"],
+                    "payment_status": "paid",
+                    "client_reference_id": str(self.order.pk),
+                    "metadata": {"order_id": str(self.order.pk)},
+                }
+            }
+        }
+        webhooks.handle_session_paid(event)
+
+    def test_order_is_paid_after_all_parts(self):
+        sessions = self.post("/order/buy/", {"order_id": self.order.id}).json()["sessions"]
+        self.assertEqual([session["currency"] for session in sessions], ["usd", "eur"])
+
+        self.pay(sessions[0])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_PENDING)
+        # Повторная оплата — только неоплаченная часть
+        retry = self.post("/order/buy/", {"order_id": self.order.id}).json()["sessions"]
+        self.assertEqual([session["currency"] for session in retry], ["eur"])
+
+        self.pay(retry[0])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_PAID)
+
+    def test_cart_is_locked_after_a_part_is_paid(self):
+        sessions = self.post("/order/buy/", {"order_id": self.order.id}).json()["sessions"]
+        self.pay(sessions[0])
+
+        operations = [{"op": "add", "item_id": self.usd.id, "quantity": 5}]
+        responses = [
+            self.post("/order/items/", {"order_id": self.order.id, "operations": operations}),
+            self.post("/order/add/", {"order_id": self.order.id, "item_id": self.usd.id}),
+            self.post("/order/remove/", {"order_id": self.order.id, "item_id": self.eur.id}),
+        ]
+        self.assertEqual([response.status_code for response in responses], [409, 409, 409])
+        self.assertEqual(OrderItem.objects.filter(order=self.order).count(), 2)
+        self.assertEqual(OrderItem.objects.get(order=self.order, item=self.usd).quantity, 1)
@@ -0,0 +1,202 @@
+"""Ограничение частоты запросов к эндпоинтам оплаты и корзины (token bucket).
+
+У каждого ключа (IP, сессия, валюта) есть «ведро» на `N` токенов, которое
+наполняется со скоростью `N` за период лимита (`"30/min"`); запрос забирает
+один токен, пустое ведро — ответ 429 с `Retry-After`. В отличие от окна с
+фиксированным счетчиком, всплеск не может превысить `N` на стыке окон.
+
+Ведра хранятся в Redis (атомарный Lua-скрипт, общий для всех воркеров), если
+кэш настроен на Redis; иначе и при недоступности Redis — в памяти процесса,
+и тогда лимит действует на каждый воркер отдельно.
+
+Лимиты задаются в `settings.RATE_LIMITS` по ключу `<throttle_scope вида>_<вид лимита>`,
+например `checkout_ip`; лимита нет — проверка пропускается.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+from payments import metrics
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+# Ведро: число токенов и время последнего пополнения (время сервера Redis)
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """`"30/min"` -> (емкость ведра 30, пополнение 0.5 токена в секунду)."""
+    count, period = rate.split("/")
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip().lower()]
+
+
+class MemoryBucketStore:
+    """Ведра в памяти процесса; при переполнении вытесняются давно не использованные."""
+
+    def __init__(self, max_keys: int = 10_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        """Забирает токен; возвращает 0 или сколько секунд ждать следующего токена."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketStore:
+    """Ведра в Redis кэша Django: проверка и списание — один атомарный скрипт."""
+
+    def __init__(self, redis_cache):
+        self._cache = redis_cache
+        self._script = None
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        key = self._cache.make_key(key)
+        client = self._cache._cache.get_client(key, write=True)
+        if self._script is None:
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        return float(self._script(keys=[key], args=[capacity, rate], client=client))
+
+
+memory_store = MemoryBucketStore()
+_redis_store: Optional[RedisBucketStore] = None
+
+
+def take(key: str, capacity: int, rate: float) -> float:
+    """Токен из общего хранилища или, если Redis не настроен или недоступен, из памяти процесса."""
+    global _redis_store
+    if _redis_store is None:
+        backend = caches["default"]
+        if not isinstance(backend, RedisCache):
+            return memory_store.take(key, capacity, rate)
+        _redis_store = RedisBucketStore(backend)
+    try:
+        return _redis_store.take(key, capacity, rate)
+    except Exception as e:
+        logger.warning(f"Rate limit store unavailable, using in-process buckets: {e}")
+        metrics.registry.inc("rate_limit_store_fallbacks_total", {})
+        return memory_store.take(key, capacity, rate)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Базовый троттлинг: `kind` — вид лимита, ключи ведер дает `get_keys`."""
+    kind = ""
+
+    def __init__(self):
+        self._wait: Optional[float] = None
+
+    def get_keys(self, request, view) -> List[str]:
+        raise NotImplementedError
+
+    def allow_request(self, request, view) -> bool:
+        # DRF проверяет все классы подряд: после первого отказа остальные ведра не расходуются,
+        # иначе отклоненные запросы бота опустошали бы общий лимит валюты
+        if not settings.RATE_LIMIT_ENABLED or getattr(request, "_rate_limited", False):
+            return True
+        scope = getattr(view, "throttle_scope", None)
+        rate = settings.RATE_LIMITS.get(f"{scope}_{self.kind}") if scope else None
+        if not rate:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        for key in self.get_keys(request, view):
+            wait = take(f"ratelimit:{scope}:{self.kind}:{key}", capacity, refill)
+            if wait:
+                self._wait = math.ceil(wait)
+                request._rate_limited = True
+                metrics.registry.inc("rate_limit_rejections_total", {"scope": scope, "limit": self.kind})
+                return False
+        return True
+
+    def wait(self) -> Optional[float]:
+        return self._wait
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    """Лимит на IP клиента (за прокси — по `REST_FRAMEWORK["NUM_PROXIES"]`)."""
+    kind = "ip"
+
+    def get_keys(self, request, view) -> List[str]:
+        ident = self.get_ident(request)
+        return [ident] if ident else []
+
+
+class SessionRateThrottle(TokenBucketThrottle):
+    """Лимит на сессию Django. Без cookie сессии не применяется (новая сессия не создается): остается лимит на IP."""
+    kind = "session"
+
+    def get_keys(self, request, view) -> List[str]:
+        session = getattr(request, "session", None)
+        key = session.session_key if session is not None else None
+        return [key] if key else []
+
+
+class CurrencyRateThrottle(TokenBucketThrottle):
+    """Общий лимит на аккаунт Stripe валюты: защищает лимит запросов Stripe от всех клиентов сразу.
+
+    Валюты запроса возвращает `view.get_throttle_currencies(request)`.
+    """
+    kind = "currency"
+
+    def get_keys(self, request, view) -> List[str]:
+        get_currencies = getattr(view, "get_throttle_currencies", None)
+        return list(get_currencies(request)) if get_currencies else []
+
+
+# Лимиты эндпоинтов, создающих сессии Stripe, и эндпоинтов, создающих и меняющих заказы
+CHECKOUT_THROTTLES = [IPRateThrottle, SessionRateThrottle, CurrencyRateThrottle]
+ORDER_THROTTLES = [IPRateThrottle, SessionRateThrottle]
+
+
+def check(request, view, throttle_classes) -> Optional[float]:
+    """Проверка лимитов вне DRF (асинхронные views): None или сколько секунд ждать."""
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            return throttle.wait()
+    return None
+
+
+metrics.registry.describe("rate_limit_rejections_total", "Requests rejected by rate limits")
+metrics.registry.describe("rate_limit_store_fallbacks_total", "Rate limit checks served from in-process buckets")
@@ -1,18 +1,36 @@
 from django.urls import path
 from .views import (
     CreateCheckoutSessionView,
-    CreateOrderCheckoutSessionView,
     AddToOrderView,
     ItemDetailView,
     SuccessView,
-    CancelView, RemoveFromOrderView,RetrieveCheckoutSessionView,
+    CancelView, RemoveFromOrderView,
+    AsyncRetrieveCheckoutSessionView,
+    AsyncCreateOrderCheckoutSessionView,
+    UpdateOrderItemsView,
+    OrderStateView,
+    StripeWebhookView,
+    ItemListView,
+    MetricsView,
+    ReadinessView,
+    SalesReportView,
 )
 
 urlpatterns = [
-    path("buy/<int:item_id>/", RetrieveCheckoutSessionView.as_view(), name="buy"),
+    path("buy/<int:item_id>/", AsyncRetrieveCheckoutSessionView.as_view(), name="buy"),
     path('order/add/', AddToOrderView.as_view(), name='add_to_order'),
-    path("order/buy/", CreateOrderCheckoutSessionView.as_view(), name="order_buy"),
+    path("order/items/", UpdateOrderItemsView.as_view(), name="update_order_items"),
+    path("order/<int:order_id>/", OrderStateView.as_view(), name="order_state"),
+    path("order/buy/", AsyncCreateOrderCheckoutSessionView.as_view(), name="order_buy"),
     path("order/remove/", RemoveFromOrderView.as_view(), name="remove_from_order"),
+    # Прежние адреса асинхронной оплаты
+    path("async/buy/<int:item_id>/", AsyncRetrieveCheckoutSessionView.as_view(), name="async_buy"),
+    path("async/order/buy/", AsyncCreateOrderCheckoutSessionView.as_view(), name="async_order_buy"),
+    path("webhook/", StripeWebhookView.as_view(), name="stripe_webhook"),
+    path("api/items/", ItemListView.as_view(), name="item_list"),
+    path("api/reports/sales/", SalesReportView.as_view(), name="sales_report"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
+    path("ready", ReadinessView.as_view(), name="ready"),
     path("item/<int:pk>/", ItemDetailView.as_view(), name="item_detail"),
     path("success/", SuccessView.as_view(), name="success"),
     path("cancel/", CancelView.as_view(), name="cancel"),
@@ -1,61 +1,112 @@
+import json
 import logging
-from typing import Dict
+import math
+from typing import Dict, List
 
 import stripe
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.db import transaction
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import DetailView, TemplateView
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Item, Order
-from .serilizers import AddToOrderSerializer
-from .services import create_stripe_line_items, create_stripe_checkout_session
+from . import buyer, caching, health, metrics, order_checkout, page_cache, prewarm, reports, throttling
+from .models import Item, Order, OrderItem
+from .resilience import StripeUnavailable
+from .serilizers import (
+    AddToOrderSerializer,
+    ItemSerializer,
+    SalesReportQuerySerializer,
+    SalesReportRowSerializer,
+    UpdateOrderItemsSerializer,
+)
+from .services import (
+    CartLocked,
+    acreate_stripe_checkout_session,
+    apply_cart_operations,
+    bump_cart_version,
+    create_stripe_checkout_session,
+    create_stripe_line_items,
+    ensure_cart_editable,
+    get_site_url,
+)
+from .webhooks import store_event, verify_event
 
 logger = logging.getLogger(__name__)
 
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 200
 
-# ---------- API Views ----------
-class RetrieveCheckoutSessionView(APIView):
-    """Возвращает `session_id` для оплаты товара по его `id`."""
 
-    renderer_classes = [JSONRenderer]
+def _retry_after(error: StripeUnavailable) -> Dict[str, str]:
+    """Заголовок Retry-After для ответа 503, пока circuit breaker Stripe открыт."""
+    return {"Retry-After": str(math.ceil(error.retry_after))}
 
-    def get(self, request, item_id: int) -> Response:
-        item = get_object_or_404(Item, id=item_id)
 
-        try:
-            line_items = create_stripe_line_items([item])
-            result = create_stripe_checkout_session(request,None, line_items)  # order=None, работаем только с line_items
-            return Response(result, status=status.HTTP_200_OK)
-        except ValueError as e:
-            logger.error(f"ValueError: {e}")
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            return Response({"error": "Something went wrong"}, status=status.HTTP_400_BAD_REQUEST)
+def _item_currencies(item_id) -> List[str]:
+    """Валюта товара для общего лимита аккаунта Stripe (CurrencyRateThrottle)."""
+    return list(Item.objects.filter(id=item_id).values_list("currency", flat=True))
+
 
+def _order_currencies(order_id) -> List[str]:
+    """Валюты товаров заказа для общего лимита аккаунта Stripe (CurrencyRateThrottle)."""
+    try:
+        return list(
+            OrderItem.objects.filter(order_id=int(order_id))
+            .order_by()
+            .values_list("item__currency", flat=True)
+            .distinct()
+        )
+    except (TypeError, ValueError):
+        return []
 
+
+def _throttled(wait: float) -> JsonResponse:
+    """Ответ 429 асинхронных views, такой же, как у DRF."""
+    return JsonResponse(
+        {"detail": "Request was throttled."},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(math.ceil(wait))},
+    )
+
+
+# ---------- API Views ----------
 class CreateCheckoutSessionView(APIView):
     """Создает сессию оплаты для одиночного товара."""
+    throttle_scope = "checkout"
+    throttle_classes = throttling.CHECKOUT_THROTTLES
+
+    def get_throttle_currencies(self, request) -> List[str]:
+        return _item_currencies(self.kwargs["item_id"])
 
     def post(self, request, item_id: int) -> Response:
         item = get_object_or_404(Item, id=item_id)
 
         try:
             line_items = create_stripe_line_items([item])
-            order = Order.objects.create()  # Создаём временный заказ
-            result = create_stripe_checkout_session(request, None, line_items)
+            result = create_stripe_checkout_session(request, None, line_items, item.currency)
             return Response(result, status=status.HTTP_201_CREATED)
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except StripeUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=_retry_after(e))
 
 
 class AddToOrderView(APIView):
     """Добавляет товар в существующий или новый заказ."""
+    throttle_scope = "order"
+    throttle_classes = throttling.ORDER_THROTTLES
 
     def post(self, request) -> Response:
         serializer = AddToOrderSerializer(data=request.data)
@@ -69,15 +120,20 @@ class AddToOrderView(APIView):
                 if order_id:
                     # Если передан order_id, добавляем товар в существующий заказ
                     order = get_object_or_404(Order, id=order_id)
+                    ensure_cart_editable(order.id)
                 else:
                     # Если order_id нет, создаем новый заказ
                     order = Order.objects.create()
 
-                order.items.add(item)
-                order.save()
+                apply_cart_operations(order, [{"op": "add", "item_id": item.id}])
+                prewarm.schedule(order.id, get_site_url(request))
 
         except Order.DoesNotExist:
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+        except CartLocked as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Order error: {str(e)}")
             return Response({"error": "Invalid request"}, status=status.HTTP_400_BAD_REQUEST)
@@ -86,29 +142,79 @@ class AddToOrderView(APIView):
 
 
 
-class CreateOrderCheckoutSessionView(APIView):
-    """Создает сессию оплаты для заказа с учетом скидки и налога."""
+class UpdateOrderItemsView(APIView):
+    """Применяет к заказу пакет операций с товарами в одной транзакции."""
+    throttle_scope = "order"
+    throttle_classes = throttling.ORDER_THROTTLES
 
     def post(self, request) -> Response:
-        order_id = request.data.get("order_id")
-        if not order_id:
-            return Response({"error": "order_id is required"}, status=status.HTTP_400_BAD_REQUEST)  # Добавлено!
-
-        order = get_object_or_404(Order, id=order_id)
+        serializer = UpdateOrderItemsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        if not order.items.exists():
-            return Response({"error": "Order is empty"}, status=status.HTTP_400_BAD_REQUEST)
+        order_id = serializer.validated_data.get("order_id")
 
         try:
-            line_items = create_stripe_line_items(order.items.all())
-            result = create_stripe_checkout_session(request, order, line_items)
-            return Response(result, status=status.HTTP_201_CREATED)
+            with transaction.atomic():
+                if order_id:
+                    order = get_object_or_404(Order, id=order_id)
+                    ensure_cart_editable(order.id)
+                else:
+                    order = Order.objects.create()
+                order_items = apply_cart_operations(order, serializer.validated_data["operations"])
+                prewarm.schedule(order.id, get_site_url(request))
+        except Item.DoesNotExist as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except CartLocked as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        return Response(
+            {
+                "order_id": order.id,
+                "items": [{"item_id": row.item_id, "quantity": row.quantity} for row in order_items],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class OrderStateView(APIView):
+    """Состояние корзины для страницы: товары, количество и суммы заказа одним запросом."""
+
+    def get(self, request, order_id: int) -> Response:
+        def load() -> Dict:
+            order = get_object_or_404(Order.objects.for_checkout(), id=order_id)
+            totals = order.get_totals()
+            return {
+                "order_id": order.id,
+                "status": order.status,
+                "cart_version": order.cart_version,
+                "items": [
+                    {
+                        "item_id": row.item_id,
+                        "name": row.item.name,
+                        "price": str(row.item.price),
+                        "currency": row.item.currency,
+                        "quantity": row.quantity,
+                    }
+                    for row in order.order_items.all()
+                ],
+                "totals": {key: str(value) for key, value in totals.as_major().items()},
+                # Части заказа в разных валютах оплачиваются отдельно
+                "currency_totals": [
+                    {key: str(value) for key, value in part.as_major().items()}
+                    for part in order.get_currency_totals().values()
+                ],
+            }
+
+        # Сбрасывается при изменении корзины, статуса, скидки, налога или товаров (см. signals.py)
+        return Response(caching.orders.get_or_set(("state",), load, pk=order_id), status=status.HTTP_200_OK)
+
 
 class RemoveFromOrderView(APIView):
     """Удаляет товар из заказа."""
+    throttle_scope = "order"
+    throttle_classes = throttling.ORDER_THROTTLES
 
     def post(self, request) -> Response:
         order_id = request.data.get("order_id")
@@ -117,22 +223,224 @@ class RemoveFromOrderView(APIView):
         if not order_id or not item_id:
             return Response({"error": "order_id and item_id are required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order = get_object_or_404(Order, id=order_id)
-        item = get_object_or_404(Item, id=item_id)
-
-        if item in order.items.all():
-            order.items.remove(item)
-            order.save()
+        # Один DELETE по уникальному индексу (order, item) вместо загрузки всех товаров заказа
+        try:
+            ensure_cart_editable(order_id)
+            deleted, _ = OrderItem.objects.filter(order_id=order_id, item_id=item_id).delete()
+        except CartLocked as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError:
+            return Response({"error": "order_id and item_id must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if deleted:
+            bump_cart_version(order_id)
+            prewarm.schedule(int(order_id), get_site_url(request))
             return Response({"message": "Item removed from order"}, status=status.HTTP_200_OK)
+        if not Order.objects.filter(id=order_id).exists():
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
         return Response({"error": "Item not in order"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+# ---------- Async Views ----------
+# DRF не поддерживает асинхронные APIView, поэтому оплата (`/buy/`, `/order/buy/`)
+# построена на обычных Django View: под ASGI (stripe_project/asgi.py) ожидание Stripe не занимает поток.
+class AsyncRetrieveCheckoutSessionView(View):
+    """Асинхронно возвращает `session_id` для оплаты товара по его `id`."""
+    throttle_scope = "checkout"
+
+    def get_throttle_currencies(self, request) -> List[str]:
+        return _item_currencies(self.kwargs["item_id"])
+
+    async def get(self, request: HttpRequest, item_id: int) -> JsonResponse:
+        wait = await sync_to_async(throttling.check)(request, self, throttling.CHECKOUT_THROTTLES)
+        if wait is not None:
+            return _throttled(wait)
+
+        try:
+            item = await Item.objects.aget(id=item_id)
+        except Item.DoesNotExist:
+            return JsonResponse({"error": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            line_items = create_stripe_line_items([item])
+            result = await acreate_stripe_checkout_session(request, None, line_items, item.currency)
+            return JsonResponse(result, status=status.HTTP_200_OK)
+        except ValueError as e:
+            logger.error(f"ValueError: {e}")
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except StripeUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=_retry_after(e))
+
+
+# Как APIView в DRF для анонимных покупателей: страница товара кэшируется и не выдает CSRF-токен
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncCreateOrderCheckoutSessionView(View):
+    """Асинхронно создает сессию оплаты для заказа с учетом скидки и налога."""
+    throttle_scope = "checkout"
+
+    def get_throttle_currencies(self, request) -> List[str]:
+        return _order_currencies(self.order_id)
+
+    async def post(self, request: HttpRequest) -> JsonResponse:
+        try:
+            order_id = json.loads(request.body or b"{}").get("order_id")
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        if not order_id:
+            return JsonResponse({"error": "order_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.order_id = order_id
+        wait = await sync_to_async(throttling.check)(request, self, throttling.CHECKOUT_THROTTLES)
+        if wait is not None:
+            return _throttled(wait)
+
+        try:
+            order = await Order.objects.for_checkout().aget(id=order_id)
+        except (Order.DoesNotExist, ValueError):
+            return JsonResponse({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if not order.order_items.all():  # уже загружены через prefetch_related
+            return JsonResponse({"error": "Order is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            sessions = await order_checkout.acreate_order_checkout_sessions(get_site_url(request), order)
+            return JsonResponse({"order_id": order.id, "sessions": sessions}, status=status.HTTP_201_CREATED)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except StripeUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=_retry_after(e))
+
+
+class ItemListView(APIView):
+    """JSON-каталог товаров с keyset-пагинацией: `?cursor=<последний id>&limit=<n>`."""
+
+    def get(self, request) -> HttpResponse:
+        try:
+            cursor = int(request.query_params.get("cursor", 0))
+            limit = min(int(request.query_params.get("limit", CATALOG_PAGE_SIZE)), CATALOG_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({"error": "cursor and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+
+        def render() -> Dict:
+            items = list(Item.objects.filter(id__gt=cursor).order_by("id")[:limit + 1])
+            has_more = len(items) > limit
+            items = items[:limit]
+            payload = {
+                "results": ItemSerializer(items, many=True).data,
+                "next_cursor": items[-1].id if has_more else None,
+            }
+            last_modified = max((item.updated_at for item in items), default=None)
+            return page_cache.make_entry(JSONRenderer().render(payload), last_modified)
+
+        entry = page_cache.catalog_page(cursor, limit, render)
+        return _cached_response(request, entry, "application/json")
+
+
+def _cached_response(request: HttpRequest, entry: Dict, content_type: str) -> HttpResponse:
+    """Ответ из записи кэша страниц с ETag/Last-Modified; 304, если у клиента актуальная копия."""
+    response = get_conditional_response(request, etag=entry["etag"], last_modified=entry["last_modified"])
+    if response is None:
+        response = HttpResponse(entry["content"], content_type=content_type)
+    response["ETag"] = entry["etag"]
+    if entry["last_modified"]:
+        response["Last-Modified"] = http_date(entry["last_modified"])
+    return response
+
+
+# ---------- Reports ----------
+class SalesReportView(APIView):
+    """Продажи по валютам и дням/неделям: `?period=day|week&start=&end=&currency=&status=&source=live|rollup`.
+
+    Доступен только сотрудникам (is_staff), например после входа в админку.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request) -> Response:
+        query = SalesReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        filters = {"start": params.get("start"), "end": params.get("end"), "currency": params.get("currency")}
+
+        if params["source"] == "rollup":
+            rows = reports.rollup_report(params["period"], **filters)
+        else:
+            statuses = params.get("status") or [Order.STATUS_PAID]
+            rows = reports.live_report(params["period"], statuses=statuses, **filters)
+
+        return Response(
+            {
+                "period": params["period"],
+                "source": params["source"],
+                "rows": SalesReportRowSerializer(rows, many=True).data,
+                "summary": SalesReportRowSerializer(reports.summary(rows), many=True).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+# ---------- Webhooks ----------
+@method_decorator(csrf_exempt, name="dispatch")
+class StripeWebhookView(View):
+    """Принимает вебхук Stripe: проверяет подпись, сохраняет событие и сразу отвечает 200.
+
+    Сами события применяются командой `process_stripe_events`.
+    """
+
+    def post(self, request: HttpRequest) -> HttpResponse:
+        try:
+            event, currency = verify_event(request.body, request.headers.get("Stripe-Signature", ""))
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            logger.warning(f"Rejected Stripe webhook: {e}")
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+        store_event(event, currency)
+        return HttpResponse(status=status.HTTP_200_OK)
+
+
+# ---------- Metrics ----------
+class MetricsView(View):
+    """Метрики процесса в текстовом формате Prometheus."""
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        token = settings.METRICS_TOKEN
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ---------- Health ----------
+class ReadinessView(View):
+    """Готовность принимать трафик: БД, кэш и примененные миграции. 503, пока что-то не готово."""
+
+    def get(self, request: HttpRequest) -> JsonResponse:
+        checks = health.run_checks()
+        ready = all(checks.values())
+        return JsonResponse(
+            {"ready": ready, "checks": checks},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
 # ---------- Template Views ----------
 class ItemDetailView(DetailView):
+    """Страница товара. Отрендеренный HTML кэшируется до изменения товара."""
     model = Item
     template_name = "item_detail.html"
     context_object_name = "item"
 
+    def get(self, request, *args, **kwargs) -> HttpResponse:
+        def render() -> Dict:
+            response = super(ItemDetailView, self).get(request, *args, **kwargs)
+            response.render()
+            return page_cache.make_entry(response.content, self.object.updated_at)
+
+        entry = page_cache.item_page(kwargs["pk"], render)
+        # Покупатель получает cookie вместе со страницей: даже первые два клика «Купить» дают одну сессию
+        buyer.get_buyer_id(request)
+        return _cached_response(request, entry, "text/html; charset=utf-8")
+
     def get_context_data(self, **kwargs) -> Dict:
         context = super().get_context_data(**kwargs)
         currency = self.object.currency
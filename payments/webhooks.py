@@ -0,0 +1,143 @@
+import logging
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from payments import caching
+from payments.models import Order, OrderCheckoutSession, OrderItem, StripeEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+def verify_event(payload: bytes, signature: str) -> Tuple[stripe.Event, str]:
+    """Проверяет подпись события секретами всех аккаунтов и возвращает событие и валюту аккаунта."""
+    for currency, secret in settings.STRIPE_WEBHOOK_SECRETS.items():
+        if not secret:
+            continue
+        try:
+            return stripe.Webhook.construct_event(payload, signature, secret), currency
+        except stripe.error.SignatureVerificationError:
+            continue
+    raise stripe.error.SignatureVerificationError("No matching webhook secret", signature)
+
+
+def store_event(event: stripe.Event, currency: str) -> None:
+    """Сохраняет событие в очередь; повторная доставка того же события игнорируется."""
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event.id, type=event.type, currency=currency, payload=event.to_dict())],
+        ignore_conflicts=True,
+    )
+
+
+# ---------- Обработчики событий ----------
+def _session_order_id(event: Dict) -> Optional[str]:
+    session = event["data"]["object"]
+    return (session.get("metadata") or {}).get("order_id") or session.get("client_reference_id")
+
+
+def _order_part(order_id: str, session: Dict):
+    """Часть заказа, к которой относится сессия: по id сессии или по валюте (если оплачена более ранняя сессия)."""
+    return OrderCheckoutSession.objects.filter(
+        Q(session_id=session.get("id")) | Q(currency=session.get("currency")), order_id=order_id
+    )
+
+
+def _unpaid_currencies(order_id: str) -> set:
+    """Валюты заказа, части которых еще не оплачены; пусто, если части не отслеживались."""
+    parts = dict(OrderCheckoutSession.objects.filter(order_id=order_id).values_list("currency", "status"))
+    if not parts:
+        # Сессия выдана до появления оплаты по частям: одна сессия на весь заказ
+        return set()
+    currencies = set(OrderItem.objects.filter(order_id=order_id).values_list("item__currency", flat=True))
+    return {currency for currency in currencies if parts.get(currency) != Order.STATUS_PAID}
+
+
+def handle_session_paid(event: Dict) -> None:
+    """Сессия оплачена (сразу или после асинхронного платежа). Заказ оплачен, когда оплачены все его валюты."""
+    session = event["data"]["object"]
+    order_id = _session_order_id(event)
+    if not order_id or session.get("payment_status") not in ("paid", "no_payment_required"):
+        return
+    now = timezone.now()
+    _order_part(order_id, session).update(session_id=session["id"], status=Order.STATUS_PAID, paid_at=now)
+    if _unpaid_currencies(order_id):
+        Order.objects.filter(id=order_id).update(updated_at=now)
+    else:
+        Order.objects.filter(id=order_id).exclude(status=Order.STATUS_PAID).update(
+            status=Order.STATUS_PAID, paid_at=now, updated_at=now
+        )
+    caching.orders.invalidate(order_id)
+
+
+def handle_session_failed(event: Dict) -> None:
+    """Асинхронный платеж по сессии не прошел."""
+    order_id = _session_order_id(event)
+    if order_id:
+        _order_part(order_id, event["data"]["object"]).exclude(status=Order.STATUS_PAID).update(
+            status=Order.STATUS_FAILED
+        )
+        Order.objects.filter(id=order_id, status=Order.STATUS_PENDING).update(
+            status=Order.STATUS_FAILED, updated_at=timezone.now()
+        )
+        caching.orders.invalidate(order_id)
+
+
+EVENT_HANDLERS: Dict[str, Callable[[Dict], None]] = {
+    "checkout.session.completed": handle_session_paid,
+    "checkout.session.async_payment_succeeded": handle_session_paid,
+    "checkout.session.async_payment_failed": handle_session_failed,
+}
+
+
+# ---------- Обработка очереди ----------
+def process_batch(batch_size: int) -> int:
+    """Обрабатывает пачку готовых к обработке событий и возвращает число успешно примененных.
+
+    Строки блокируются через `SELECT ... FOR UPDATE SKIP LOCKED`, поэтому
+    несколько воркеров могут разбирать очередь параллельно без повторов.
+    Неудачное событие откладывается с экспоненциальной паузой (`retry_delay`).
+    """
+    now = timezone.now()
+    processed = 0
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=StripeEvent.STATUS_PENDING)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by("id")[:batch_size]
+        )
+
+        for event in events:
+            event.attempts += 1
+            handler = EVENT_HANDLERS.get(event.type)
+            try:
+                with transaction.atomic():
+                    if handler:
+                        handler(event.payload)
+            except Exception as e:
+                logger.error(f"Stripe event {event.event_id} failed: {e}")
+                event.error = str(e)
+                if event.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+                    event.status = StripeEvent.STATUS_FAILED
+                else:
+                    event.next_attempt_at = now + retry_delay(event.attempts)
+                continue
+            event.status = StripeEvent.STATUS_PROCESSED
+            event.error = ""
+            event.processed_at = timezone.now()
+            processed += 1
+
+        StripeEvent.objects.bulk_update(events, ["status", "attempts", "next_attempt_at", "error", "processed_at"])
+    return processed
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Пауза перед следующей попыткой: `STRIPE_EVENT_RETRY_DELAY`, удваивается с каждой неудачей."""
+    delay = settings.STRIPE_EVENT_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.STRIPE_EVENT_RETRY_MAX_DELAY))
@@ -0,0 +1,18 @@
+#!/bin/sh
+# Точка входа образа:
+#   init  — миграции, суперпользователь и статика (один раз перед запуском web)
+#   serve — только gunicorn, без подготовки, поэтому реплики стартуют за секунды
+#   иначе — произвольная команда (например, python manage.py process_stripe_events)
+set -e
+
+case "$1" in
+  init)
+    exec python manage.py init_app
+    ;;
+  serve)
+    exec gunicorn -c stripe_project/gunicorn.conf.py
+    ;;
+  *)
+    exec "$@"
+    ;;
+esac
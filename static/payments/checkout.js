@@ -0,0 +1,193 @@
+/**
+ * Оплата товара и корзина заказа на странице товара.
+ *
+ * Данные товара и публичный ключ Stripe берутся из data-атрибутов #item,
+ * в localStorage хранится только order_id: состав корзины и суммы приходят
+ * с сервера одним запросом GET /order/<order_id>/.
+ *
+ * Заказ с товарами в разных валютах оплачивается по частям: /order/buy/
+ * возвращает сессию на каждую валюту, покупатель оплачивает их по очереди.
+ */
+(function () {
+    "use strict";
+
+    var root = document.getElementById("item");
+    var itemId = Number(root.dataset.itemId);
+    // Экземпляры Stripe по публичному ключу: у каждой валюты свой аккаунт
+    var stripePromises = {};
+
+    /** Stripe.js подключен с async: ждем загрузки скрипта только в момент оплаты */
+    function getStripe(key) {
+        key = key || root.dataset.stripeKey;
+        if (!stripePromises[key]) {
+            stripePromises[key] = new Promise(function (resolve, reject) {
+                if (window.Stripe) {
+                    resolve(window.Stripe(key));
+                    return;
+                }
+                var script = document.getElementById("stripe-js");
+                script.addEventListener("load", function () { resolve(window.Stripe(key)); });
+                script.addEventListener("error", function () { delete stripePromises[key]; reject(new Error("Stripe.js не загрузился")); });
+            });
+        }
+        return stripePromises[key];
+    }
+
+    /** Получение CSRF-токена */
+    function getCookie(name) {
+        var cookieValue = null;
+        if (document.cookie && document.cookie !== "") {
+            document.cookie.split(";").forEach(function (cookie) {
+                cookie = cookie.trim();
+                if (cookie.startsWith(name + "=")) {
+                    cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                }
+            });
+        }
+        return cookieValue;
+    }
+
+    function postJSON(url, body) {
+        return fetch(url, {
+            method: "POST",
+            headers: {
+                "X-CSRFToken": getCookie("csrftoken"),
+                "Content-Type": "application/json"
+            },
+            body: JSON.stringify(body)
+        }).then(function (response) { return response.json(); });
+    }
+
+    function redirectToCheckout(session) {
+        if (!session.session_id) {
+            alert("Ошибка: " + (session.error || "не удалось создать сессию оплаты"));
+            return;
+        }
+        return getStripe(session.public_key).then(function (stripe) {
+            return stripe.redirectToCheckout({ sessionId: session.session_id });
+        });
+    }
+
+    /** Оплата заказа: первая готовая часть, остальные — при следующей оплате корзины */
+    function redirectToOrderCheckout(data) {
+        var sessions = data.sessions || [];
+        var ready = sessions.filter(function (session) { return session.session_id; })[0];
+        return redirectToCheckout(ready || sessions[0] || data);
+    }
+
+    /** Отрисовка корзины по ответу GET /order/<order_id>/ */
+    function renderOrder(order) {
+        var list = document.getElementById("order-items");
+        var checkout = document.getElementById("checkout-order");
+        list.textContent = "";
+
+        if (!order || order.items.length === 0) {
+            list.innerHTML = "<li>Корзина пуста</li>";
+            checkout.style.display = "none";
+            return;
+        }
+
+        order.items.forEach(function (item) {
+            var li = document.createElement("li");
+            li.textContent = item.name + " × " + item.quantity + " — " + item.currency.toUpperCase() + " " + item.price + " ";
+            var remove = document.createElement("button");
+            remove.textContent = "❌";
+            remove.addEventListener("click", function () { removeFromOrder(item.item_id); });
+            li.appendChild(remove);
+            list.appendChild(li);
+        });
+
+        // Итог по каждой валюте: части оплачиваются отдельными сессиями
+        (order.currency_totals || [order.totals]).forEach(function (part) {
+            var total = document.createElement("li");
+            total.textContent = "Итого: " + part.currency.toUpperCase() + " " + part.total;
+            list.appendChild(total);
+        });
+        checkout.style.display = "block";
+    }
+
+    function loadOrder() {
+        var orderId = localStorage.getItem("order_id");
+        if (!orderId) {
+            renderOrder(null);
+            return Promise.resolve();
+        }
+        return fetch("/order/" + orderId + "/")
+            .then(function (response) {
+                if (response.status === 404) {
+                    localStorage.removeItem("order_id");
+                    return null;
+                }
+                return response.json();
+            })
+            .then(function (order) {
+                // Оплаченный заказ больше не корзина
+                if (order && order.status !== "pending") {
+                    localStorage.removeItem("order_id");
+                    order = null;
+                }
+                renderOrder(order);
+            })
+            .catch(function (error) { console.error("Ошибка:", error); });
+    }
+
+    /** Покупка одного товара */
+    document.getElementById("buy-button").addEventListener("click", function () {
+        fetch("/buy/" + itemId + "/")
+            .then(function (response) { return response.json(); })
+            .then(redirectToCheckout)
+            .catch(function (error) { console.error("Ошибка:", error); });
+    });
+
+    /** Добавление товара в заказ */
+    document.getElementById("add-to-order").addEventListener("click", function () {
+        var orderId = localStorage.getItem("order_id");
+        var body = orderId ? { order_id: orderId, item_id: itemId } : { item_id: itemId };
+
+        postJSON("/order/add/", body)
+            .then(function (data) {
+                if (data.order_id) {
+                    localStorage.setItem("order_id", data.order_id);
+                    return loadOrder();
+                }
+                alert("Ошибка: " + data.error);
+            })
+            .catch(function (error) { console.error("Ошибка:", error); });
+    });
+
+    /** Оплата заказа */
+    document.getElementById("checkout-order").addEventListener("click", function () {
+        var orderId = localStorage.getItem("order_id");
+        if (!orderId) {
+            alert("Ошибка: заказ не найден!");
+            return;
+        }
+
+        postJSON("/order/buy/", { order_id: orderId })
+            .then(redirectToOrderCheckout)
+            .catch(function (error) {
+                console.error("Ошибка:", error);
+                alert("Произошла ошибка при оплате");
+            });
+    });
+
+    /** Удаление товара из заказа */
+    function removeFromOrder(removeItemId) {
+        var orderId = localStorage.getItem("order_id");
+        if (!orderId) {
+            alert("Ошибка: заказ не найден!");
+            return;
+        }
+
+        postJSON("/order/remove/", { order_id: orderId, item_id: removeItemId })
+            .then(function (data) {
+                if (data.message) {
+                    return loadOrder();
+                }
+                alert("Ошибка: " + data.error);
+            })
+            .catch(function (error) { console.error("Ошибка:", error); });
+    }
+
+    loadOrder();
+})();
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stripe_project.settings')
 
 application = get_asgi_application()
+
+# Клиенты Stripe с пулом соединений создаются заранее, а не на первом запросе оплаты
+from payments.stripe_clients import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,57 @@
+"""Настройки gunicorn для режима `serve` (scripts/entrypoint.sh).
+
+Запуск: gunicorn -c stripe_project/gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+# Адрес и порт
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Класс воркера: по умолчанию gthread (WSGI) — синхронные views обрабатываются параллельно
+# в потоках процесса, асинхронные views оплаты Django выполняет в своем цикле событий на время запроса.
+# UvicornWorker (ASGI) — только явно через GUNICORN_WORKER_CLASS: под ASGI синхронные views процесса
+# выполняются по одному в общем потоке, и медленный запрос к БД задерживает остальные
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+wsgi_app = (
+    "stripe_project.asgi:application" if worker_class.startswith("uvicorn") else "stripe_project.wsgi:application"
+)
+
+# Число процессов: 2 × CPU + 1
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count() * 2 + 1)
+# Потоки на процесс для gthread: по умолчанию 2 × CPU (ожидание БД и Stripe занимает поток, а не процессор).
+# UvicornWorker потоки не использует, sync однопоточный
+if worker_class.startswith("uvicorn") or worker_class == "sync":
+    threads = 1
+else:
+    threads = int(os.getenv("GUNICORN_THREADS") or multiprocessing.cpu_count() * 2)
+
+# Приложение импортируется один раз в мастере, воркеры делят его память (copy-on-write)
+# и стартуют без повторного django.setup()
+preload_app = True
+
+# Перезапуск воркера после N запросов (со случайным разбросом) ограничивает рост памяти
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+
+# Таймауты (секунды): запрос, корректное завершение, keep-alive за балансировщиком
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Воркер не должен использовать соединения, открытые мастером при импорте приложения."""
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+
+    # Клиенты Stripe с пулами соединений создаются заново в каждом процессе
+    from payments.stripe_clients import registry, warm_up
+
+    registry.clear()
+    warm_up()
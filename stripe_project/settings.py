@@ -26,9 +26,11 @@ INSTALLED_APPS = [
 
 # Middleware
 MIDDLEWARE = [
+    "payments.middleware.PerformanceMiddleware",  # Server-Timing и метрики для /metrics
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # WhiteNoise для обработки статики
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "payments.middleware.BuyerMiddleware",  # cookie анонимного покупателя (payments/buyer.py)
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -41,12 +43,45 @@ ROOT_URLCONF = "stripe_project.urls"
 WSGI_APPLICATION = "stripe_project.wsgi.application"
 
 # База данных
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Без DB_ENGINE используется локальный SQLite, в Docker — PostgreSQL (psycopg 3)
+DB_ENGINE = os.getenv("DB_ENGINE", "django.db.backends.sqlite3")
+# Пул соединений psycopg 3 (только PostgreSQL); с пулом постоянные соединения (CONN_MAX_AGE) не используются
+DB_POOL = DB_ENGINE == "django.db.backends.postgresql" and os.getenv("DB_POOL", "True").lower() == "true"
+
+
+def _database(host: str) -> dict:
+    if DB_ENGINE == "django.db.backends.sqlite3":
+        return {"ENGINE": DB_ENGINE, "NAME": BASE_DIR / "db.sqlite3"}
+
+    options = {}
+    if DB_POOL:
+        options["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+    return {
+        "ENGINE": DB_ENGINE,
+        "NAME": os.getenv("DB_NAME"),
+        "USER": os.getenv("DB_USER"),
+        "PASSWORD": os.getenv("DB_PASSWORD"),
+        "HOST": host,
+        "PORT": os.getenv("DB_PORT", "5432"),
+        "CONN_MAX_AGE": 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": not DB_POOL,
+        "OPTIONS": options,
     }
-}
+
+
+DATABASES = {"default": _database(os.getenv("DB_HOST", "localhost"))}
+
+# Реплика для чтения каталога (см. payments/db_router.py)
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
+if DB_REPLICA_HOST and DB_ENGINE != "django.db.backends.sqlite3":
+    DATABASES["replica"] = {**_database(DB_REPLICA_HOST), "TEST": {"MIRROR": "default"}}
+    DATABASE_ROUTERS = ["payments.db_router.ReplicaRouter"]
+# Сколько секунд после изменения каталога его страницы рендерятся с основной БД (запас на отставание реплики)
+DB_REPLICA_LAG = int(os.getenv("DB_REPLICA_LAG", "10"))
 
 # Валидаторы паролей
 AUTH_PASSWORD_VALIDATORS = [
@@ -83,19 +118,113 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [BASE_DIR / "static"]
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# Django 5.1 читает хранилища только из STORAGES (STATICFILES_STORAGE больше не поддерживается).
+# Файлы с хэшем в имени WhiteNoise отдает сжатыми и с Cache-Control: max-age на 10 лет, immutable.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 # Медиа файлы
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
-# Stripe API
-STRIPE_SECRET_KEYS = {
-    "usd": os.getenv("STRIPE_SECRET_KEY_USD", ""),
-    "eur": os.getenv("STRIPE_SECRET_KEY_EUR", ""),
+# Кэш: общий Redis в продакшене, LRU в памяти процесса локально и в тестах (см. payments/caching.py)
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "stripe",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "payments",
+            # При переполнении вытесняется треть давно не читавшихся ключей
+            "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "5000")), "CULL_FREQUENCY": 3},
+        }
+    }
+# Время жизни значений кэша по умолчанию (секунды)
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+# Сколько секунд один воркер может пересчитывать значение, пока остальные ждут
+CACHE_LOCK_TIMEOUT = int(os.getenv("CACHE_LOCK_TIMEOUT", "5"))
+
+# Время жизни кэша страниц товаров и JSON-каталога (секунды); сбрасывается при изменении товара
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "300"))
+
+# Если задан, /metrics требует заголовок "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Stripe API: у каждой валюты свой аккаунт Stripe. Чтобы добавить валюту, достаточно
+# дописать её в STRIPE_CURRENCIES и задать STRIPE_SECRET_KEY_<ВАЛЮТА> и т. д.
+STRIPE_CURRENCIES = [c.strip().lower() for c in os.getenv("STRIPE_CURRENCIES", "usd,eur").split(",") if c.strip()]
+
+STRIPE_SECRET_KEYS = {c: os.getenv(f"STRIPE_SECRET_KEY_{c.upper()}", "") for c in STRIPE_CURRENCIES}
+
+STRIPE_PUBLIC_KEYS = {c: os.getenv(f"STRIPE_PUBLIC_KEY_{c.upper()}", "") for c in STRIPE_CURRENCIES}
+
+# Секреты подписи вебхуков (у каждого аккаунта Stripe свой)
+STRIPE_WEBHOOK_SECRETS = {c: os.getenv(f"STRIPE_WEBHOOK_SECRET_{c.upper()}", "") for c in STRIPE_CURRENCIES}
+
+# Сколько раз пытаться применить событие вебхука, прежде чем пометить его как failed
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "5"))
+# Пауза перед повтором неудачного события (секунды): удваивается с каждой попыткой, не больше максимума
+STRIPE_EVENT_RETRY_DELAY = int(os.getenv("STRIPE_EVENT_RETRY_DELAY", "10"))
+STRIPE_EVENT_RETRY_MAX_DELAY = int(os.getenv("STRIPE_EVENT_RETRY_MAX_DELAY", "3600"))
+
+# Клиенты Stripe (см. payments.stripe_clients): таймауты (секунды) и число сетевых повторов
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "10"))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "2"))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "2"))
+STRIPE_MAX_RETRY_DELAY = float(os.getenv("STRIPE_MAX_RETRY_DELAY", "1"))
+# Circuit breaker на аккаунт: открывается, если за окно (секунды) было не меньше MIN_CALLS
+# запросов и доля ошибок достигла ERROR_RATE; пока открыт, оплата отвечает 503
+STRIPE_BREAKER_ERROR_RATE = float(os.getenv("STRIPE_BREAKER_ERROR_RATE", "0.5"))
+STRIPE_BREAKER_MIN_CALLS = int(os.getenv("STRIPE_BREAKER_MIN_CALLS", "10"))
+STRIPE_BREAKER_WINDOW = float(os.getenv("STRIPE_BREAKER_WINDOW", "30"))
+STRIPE_BREAKER_OPEN_SECONDS = float(os.getenv("STRIPE_BREAKER_OPEN_SECONDS", "30"))
+STRIPE_MAX_CONNECTIONS = int(os.getenv("STRIPE_MAX_CONNECTIONS", "100"))
+# Адрес API Stripe; переопределяется для локальной заглушки (см. benchmarks/)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")
+# Фабрика клиента: функция (currency, api_key) -> stripe.StripeClient
+STRIPE_CLIENT_FACTORY = os.getenv("STRIPE_CLIENT_FACTORY", "payments.stripe_clients.build_client")
+
+# Сколько секунд повторный запрос оплаты с тем же содержимым (для товара — от того же покупателя) получает ту же сессию Stripe
+CHECKOUT_SESSION_TTL = int(os.getenv("CHECKOUT_SESSION_TTL", "60"))
+
+# Фоновая подготовка сессии оплаты заказа после изменения корзины (см. payments/prewarm.py)
+ORDER_SESSION_PREWARM = os.getenv("ORDER_SESSION_PREWARM", "False").lower() == "true"
+ORDER_SESSION_PREWARM_WORKERS = int(os.getenv("ORDER_SESSION_PREWARM_WORKERS", "4"))
+# Сколько секунд подготовленная сессия считается пригодной (сессия Stripe живет 24 часа)
+ORDER_SESSION_PREWARM_MAX_AGE = int(os.getenv("ORDER_SESSION_PREWARM_MAX_AGE", "3600"))
+
+# Ограничение частоты запросов (token bucket, см. payments/throttling.py): "число/период" (s, min, hour, day).
+# checkout — эндпоинты, создающие сессии Stripe, order — создание и изменение заказов;
+# лимит currency общий для всех клиентов и бережет лимит запросов аккаунта Stripe
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+RATE_LIMITS = {
+    "checkout_ip": os.getenv("RATE_LIMIT_CHECKOUT_IP", "20/min"),
+    "checkout_session": os.getenv("RATE_LIMIT_CHECKOUT_SESSION", "10/min"),
+    "checkout_currency": os.getenv("RATE_LIMIT_CHECKOUT_CURRENCY", "50/s"),
+    "order_ip": os.getenv("RATE_LIMIT_ORDER_IP", "60/min"),
+    "order_session": os.getenv("RATE_LIMIT_ORDER_SESSION", "30/min"),
 }
 
-STRIPE_PUBLIC_KEYS = {
-    "usd": os.getenv("STRIPE_PUBLIC_KEY_USD", ""),
-    "eur": os.getenv("STRIPE_PUBLIC_KEY_EUR", ""),
+REST_FRAMEWORK = {
+    # Сколько прокси стоит перед приложением: IP клиента берется из X-Forwarded-For только за ними,
+    # иначе заголовок подделывается и лимит на IP обходится
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
 }
+
+# Потоки для одновременного создания сессий оплаты частей заказа в разных валютах (см. payments/order_checkout.py)
+ORDER_CHECKOUT_WORKERS = int(os.getenv("ORDER_CHECKOUT_WORKERS", "8"))
+
+# Через сколько дней без активности неоплаченный заказ удаляется командой purge_orders
+ORDER_RETENTION_DAYS = int(os.getenv("ORDER_RETENTION_DAYS", "7"))
+
+# Синхронизация товаров с каталогом Stripe при сохранении в админке
+STRIPE_CATALOG_SYNC_ON_SAVE = os.getenv("STRIPE_CATALOG_SYNC_ON_SAVE", "True").lower() == "true"